@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Handler benchmarks against the local mock OpenStack (benchmarks/mock_openstack.py)
+
+Every handler class is measured for list throughput, single-get latency,
+create/delete flows and the memory peak of the listings, for each dataset
+size. Results are compared with a stored baseline:
+
+    python benchmarks/bench_handlers.py                       # compare with baseline.json
+    python benchmarks/bench_handlers.py --sizes 10,1000,100000 --latency 0.002
+    python benchmarks/bench_handlers.py --save                # record a new baseline
+
+A case regresses when it makes more API requests than the baseline, or when
+its time or memory peak grows by more than --tolerance (a fraction). Request
+counts are exact, timings depend on the machine the baseline was taken on.
+The exit status is 1 when anything regressed.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, HERE)
+
+from mock_openstack import Dataset, MockOpenStack
+
+from openstack_handler.cache import catalog_cache, node_cache
+from openstack_handler.openstack_handler import Image, Network, Node, Size, Snapshot, Volume
+from openstack_handler.registry import registry
+
+BASELINE = os.path.join(HERE, 'baseline.json')
+
+
+def drain(iterator):
+    return sum(1 for _ in iterator)
+
+
+def cases(handlers, ds):
+    """
+    :return: list of (name, kind, callable, items listed) where kind is list|get|flow
+    """
+    image, volume, snapshot, size, node, network = handlers
+    image_id, flavor_id, network_id = ds.images[0]['id'], ds.flavors[0]['id'], ds.networks[0]['id']
+    volume_id, snapshot_id, node_id = ds.volumes[0]['id'], ds.snapshots[0]['id'], ds.servers[0]['id']
+
+    def volume_flow():
+        created = json.loads(volume.create_volume(1, 'bench'))
+        volume.delete_volume(created['volumeId'])
+
+    def snapshot_flow():
+        created = json.loads(snapshot.create_volume_snapshot(volume_id, 'bench'))
+        snapshot.delete_snapshot(created['snapshotId'])
+
+    def node_flow():
+        created = json.loads(node.create_node('bench', image_id, flavor_id, network_id))
+        node.delete_node(created['instanceId'])
+
+    def network_flow():
+        created = json.loads(network.create_network('bench', '10.99.0.0/24'))
+        network.delete_network(created['networkId'])
+
+    return [
+        ('Image.images', 'list', image.images, len(ds.images)),
+        ('Image.iter_images', 'list', lambda: drain(image.iter_images()), len(ds.images)),
+        ('Volume.volumes', 'list', volume.volumes, len(ds.volumes)),
+        ('Volume.iter_volumes', 'list', lambda: drain(volume.iter_volumes()), len(ds.volumes)),
+        ('Volume.get_volume', 'get', lambda: volume.get_volume(volume_id), 0),
+        ('Volume.create_delete', 'flow', volume_flow, 0),
+        ('Snapshot.snapshots', 'list', snapshot.snapshots, len(ds.snapshots)),
+        ('Snapshot.iter_snapshots', 'list', lambda: drain(snapshot.iter_snapshots()), len(ds.snapshots)),
+        ('Snapshot.volume_snapshots_all', 'list', snapshot.volume_snapshots_all, len(ds.snapshots)),
+        ('Snapshot.get_snapshot', 'get', lambda: snapshot.get_snapshot(snapshot_id), 0),
+        ('Snapshot.create_delete', 'flow', snapshot_flow, 0),
+        ('Size.sizes', 'list', size.sizes, len(ds.flavors)),
+        ('Node.nodes', 'list', node.nodes, len(ds.servers)),
+        ('Node.iter_nodes', 'list', lambda: drain(node.iter_nodes()), len(ds.servers)),
+        ('Node.nodes_errored', 'list', lambda: node.nodes(status='ERROR', fields=['instanceId', 'name']), 0),
+        ('Node.get_node', 'get', lambda: node.get_node(node_id), 0),
+        ('Node.create_delete', 'flow', node_flow, 0),
+        ('Network.networks', 'list', network.networks, len(ds.networks)),
+        ('Network.create_delete', 'flow', network_flow, 0),
+    ]
+
+
+def reset_caches():
+    # Measure the API path, not the catalog cache
+    catalog_cache.clear()
+    node_cache.clear()
+
+
+def measure(server, func, repeat):
+    """
+    :return: dict with best seconds per call, requests per call and peak MB
+    """
+    best = None
+    before = len(server.requests)
+    for _ in range(repeat):
+        reset_caches()
+        started = time.time()
+        func()
+        elapsed = time.time() - started
+        best = elapsed if best is None else min(best, elapsed)
+    requests = (len(server.requests) - before) // repeat
+    reset_caches()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': round(best, 6), 'requests': requests, 'peak_mb': round(peak / 1e6, 3)}
+
+
+def run(sizes, latency, repeat):
+    results = {}
+    for n in sizes:
+        # Flavors and networks stay at realistic tenant sizes
+        dataset = Dataset(nodes=n, volumes=n, snapshots=n, images=n, flavors=min(n, 20),
+                          networks=min(n, 100))
+        with MockOpenStack(dataset, latency=latency) as server:
+            registry.clear()
+            args = ('admin', 'password', 'admin', server.url, '2.0_password')
+            handlers = [cls(*args) for cls in (Image, Volume, Snapshot, Size, Node, Network)]
+            handlers[0].images()
+            results[str(n)] = row = {}
+            for name, kind, func, items in cases(handlers, dataset):
+                result = measure(server, func, repeat if n < 10000 else 1)
+                result['kind'] = kind
+                if kind == 'list':
+                    result['items_per_s'] = round(items / result['seconds']) if result['seconds'] else None
+                row[name] = result
+                print('%7d  %-32s %4d req  %9.2f ms  %8.2f MB peak%s' % (
+                    n, name, result['requests'], result['seconds'] * 1000, result['peak_mb'],
+                    '  %d items/s' % result['items_per_s'] if result.get('items_per_s') else ''))
+        registry.clear()
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    :return: list of regression messages
+    """
+    problems = []
+    for n, row in results.items():
+        for name, result in row.items():
+            base = baseline.get(n, {}).get(name)
+            if base is None:
+                continue
+            if result['requests'] > base['requests']:
+                problems.append('%s @%s: %d requests, baseline %d' % (name, n, result['requests'],
+                                                                      base['requests']))
+            for key in ('seconds', 'peak_mb'):
+                # Ignore noise on tiny values
+                floor = 0.002 if key == 'seconds' else 0.5
+                if result[key] > max(base[key], floor) * (1 + tolerance):
+                    problems.append('%s @%s: %s %.4f, baseline %.4f' % (name, n, key, result[key], base[key]))
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10,1000', help='comma separated dataset sizes (10 .. 100000)')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every mock request')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per case, the best one counts')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--tolerance', type=float, default=1.0, help='allowed slowdown, 1.0 = 2x')
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    args = parser.parse_args()
+
+    results = run([int(n) for n in args.sizes.split(',')], args.latency, args.repeat)
+    if args.save:
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as fp:
+                baseline = json.load(fp)
+        baseline.update(results)
+        with open(args.baseline, 'w') as fp:
+            json.dump(baseline, fp, indent=1, sort_keys=True)
+        print('baseline written to %s' % args.baseline)
+        return 0
+    if not os.path.exists(args.baseline):
+        print('no baseline at %s, run with --save' % args.baseline)
+        return 0
+    with open(args.baseline) as fp:
+        problems = compare(results, json.load(fp), args.tolerance)
+    for problem in problems:
+        print('REGRESSION ' + problem)
+    print('%d regression(s)' % len(problems))
+    return 1 if problems else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
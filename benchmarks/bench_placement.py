@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Flavor lookups: scanning the sizes() json vs placement.FlavorIndex
+
+    python benchmarks/bench_placement.py [flavors]
+"""
+import json
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from openstack_handler.placement import FlavorIndex
+from openstack_handler.records import FlavorRecord
+
+
+def flavors(n):
+    rng = random.Random(42)
+    return [FlavorRecord(str(i), 'flavor-%d' % i, rng.choice([512, 1024, 2048, 4096, 8192, 16384, 32768, 65536]),
+                         rng.choice([1, 2, 4, 8, 16, 32, 64]), rng.choice([0, 10, 20, 40, 80, 160, 320]))
+            for i in range(n)]
+
+
+def scan(sizes_json, cpu, ram, disk):
+    # What a caller of Size.sizes() does today
+    best = None
+    for size in json.loads(sizes_json):
+        if size['cpu'] >= cpu and size['memory'] >= ram and size['disk'] >= disk:
+            if best is None or (size['memory'], size['cpu'], size['disk']) < (best['memory'], best['cpu'], best['disk']):
+                best = size
+    return best
+
+
+def per_call(stmt, number):
+    return min(timeit.repeat(stmt, number=number, repeat=5)) / number
+
+
+def main(n=5000):
+    records = flavors(n)
+    sizes_json = json.dumps([r.to_dict() for r in records])
+    rng = random.Random(7)
+    queries = [(rng.choice([1, 2, 3, 4, 6, 8]), rng.choice([500, 1000, 3000, 6000, 12000]),
+                rng.choice([0, 15, 30, 100])) for _ in range(200)]
+
+    build = per_call(lambda: FlavorIndex(records), 10)
+    index = FlavorIndex(records)
+    for cpu, ram, disk in queries:
+        found = index.best_fit(cpu, ram, disk)
+        expected = scan(sizes_json, cpu, ram, disk)
+        assert (found is None) == (expected is None)
+        assert found is None or (found.ram, found.vcpus, found.disk) == \
+            (expected['memory'], expected['cpu'], expected['disk'])
+
+    cpu, ram, disk = queries[0]
+    print('%d flavors' % n)
+    print('  %-28s %10.1f us' % ('scan sizes() json', per_call(lambda: scan(sizes_json, cpu, ram, disk), 5) * 1e6))
+    print('  %-28s %10.1f us' % ('FlavorIndex build', build * 1e6))
+
+    def cold():
+        index._best.clear()
+        index._grid_best.clear()
+        for query in queries:
+            index.best_fit(*query)
+    print('  %-28s %10.1f us' % ('best_fit, unseen query', per_call(cold, 5) / len(queries) * 1e6))
+    print('  %-28s %10.3f us' % ('best_fit, repeated', per_call(lambda: index.best_fit(cpu, ram, disk), 200000) * 1e6))
+    print('  %-28s %10.3f us' % ('candidates, repeated', per_call(
+        lambda: index.candidates(cpu, ram, disk, limit=5), 100000) * 1e6))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
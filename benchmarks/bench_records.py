@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Memory held by a listing: libcloud objects + dicts vs records
+
+    python benchmarks/bench_records.py [records]
+"""
+import gc
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from libcloud.compute.providers import get_driver
+from libcloud.compute.types import Provider
+
+from openstack_handler import records, serializers
+
+
+def servers(n):
+    return [{'id': '%08d-0000-0000-0000-000000000000' % i, 'name': 'node-%d' % i, 'status': 'ACTIVE',
+             'addresses': {'private': [{'addr': '10.0.%d.%d' % (i // 250 % 250, i % 250), 'version': 4}]},
+             'image': {'id': 'image-%d' % (i % 20)}, 'flavor': {'id': str(i % 10)}, 'hostId': 'h',
+             'tenant_id': 'admin', 'user_id': 'admin', 'metadata': {},
+             'created': '2016-05-01T10:%02d:%02dZ' % (i // 60 % 60, i % 60), 'updated': '2016-05-01T10:00:00Z',
+             'links': [{'rel': 'self', 'href': 'http://localhost/servers/%d' % i}],
+             'OS-EXT-STS:vm_state': 'active'}
+            for i in range(n)]
+
+
+def volumes(n):
+    return [{'id': '%08d-1111-0000-0000-000000000000' % i, 'displayName': 'volume-%d' % i, 'size': 10,
+             'status': 'available', 'attachments': [{}], 'availabilityZone': 'nova', 'volumeType': None,
+             'metadata': {}, 'createdAt': '2016-05-01T10:00:00.000000'}
+            for i in range(n)]
+
+
+def measure(build):
+    gc.collect()
+    tracemalloc.start()
+    held = build()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return current
+
+
+def main(n=50000):
+    driver = get_driver(Provider.OPENSTACK)('user', 'password', ex_tenant_name='tenant',
+                                            ex_force_auth_url='http://127.0.0.1:5000',
+                                            ex_force_auth_version='2.0_password')
+    cases = [
+        ('nodes', servers(n), lambda p: driver._to_nodes({'servers': p}), serializers.node_to_dict,
+         records.NodeRecord),
+        ('volumes', volumes(n), lambda p: driver._to_volumes({'volumes': p}), serializers.volume_to_dict,
+         records.VolumeRecord),
+    ]
+    for name, payload, to_objects, to_dict, record_cls in cases:
+        def legacy():
+            objects = to_objects(payload)
+            return objects, [to_dict(o) for o in objects]
+
+        old = measure(legacy)
+        new = measure(lambda: [record_cls.from_api(p) for p in payload])
+        print('%-8s %d items  libcloud+dicts %6.1f MB  records %6.1f MB  (%.0f vs %.0f bytes/item)'
+              % (name, n, old / 1e6, new / 1e6, float(old) / n, float(new) / n))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+gmtCreate conversion: legacy strptime copies vs timeutil.gmt_create
+
+    python benchmarks/bench_timestamps.py [records]
+"""
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from openstack_handler import timeutil
+
+
+def legacy(create):
+    return str(datetime.strptime(create.replace("T", " ")[:-7], "%Y-%m-%d %H:%M:%S"))
+
+
+def timed(func, values):
+    start = time.time()
+    for value in values:
+        func(value)
+    return time.time() - start
+
+
+def main(records=100000):
+    base = datetime(2016, 5, 1)
+    unique = [(base + timedelta(seconds=i)).strftime('%Y-%m-%dT%H:%M:%S.000000') for i in range(records)]
+    # Listings repeat the same creation times a lot (bulk boots, nightly snapshots)
+    repeated = [unique[i % 500] for i in range(records)]
+    for name, values in (('unique', unique), ('repeated', repeated)):
+        timeutil._memo.clear()
+        old = timed(legacy, values)
+        new = timed(timeutil.gmt_create, values)
+        print('%-8s %d records  strptime %.3fs  gmt_create %.3fs  x%.1f' % (name, records, old, new, old / new))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
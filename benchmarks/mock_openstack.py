@@ -0,0 +1,464 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Local stub of the OpenStack APIs used by openstack_handler.
+
+Emulates Keystone v2/v3 tokens, the Nova compute API including the
+os-volumes, os-snapshots and os-networks proxies that the libcloud
+OpenStack 1.1 driver talks to, and the native Cinder v2 (volumes,
+snapshots), Glance v2 (images) and Neutron v2.0 (networks) endpoints, all
+backed by the same Dataset:
+
+    with MockOpenStack(Dataset(nodes=10000), latency=0.005) as server:
+        Node('admin', 'password', 'admin', server.url, '2.0_password').nodes()
+
+Every request is logged in server.requests as (method, path, query).
+"""
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlencode, urlparse, parse_qs
+except ImportError:
+    from urllib import urlencode
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+
+# type, name, path below the server url
+SERVICES = (('compute', 'nova', '/v2/admin'), ('volumev2', 'cinderv2', '/cinder/v2/admin'),
+            ('image', 'glance', '/glance'), ('network', 'neutron', '/neutron'))
+
+
+def _not_found():
+    return 404, {'itemNotFound': {'message': 'Not found', 'code': 404}}
+
+
+def _cinder_volume(v):
+    return {'id': v['id'], 'name': v['displayName'], 'size': v['size'], 'status': v['status'],
+            'attachments': [a for a in v['attachments'] if a], 'availability_zone': v['availabilityZone'],
+            'volume_type': v['volumeType'], 'metadata': v['metadata'], 'bootable': 'false',
+            'created_at': v['createdAt'], 'updated_at': v['updated_at']}
+
+
+def _cinder_snapshot(s):
+    return {'id': s['id'], 'name': s['displayName'], 'description': s['displayDescription'],
+            'volume_id': s['volumeId'], 'size': s['size'], 'status': s['status'],
+            'created_at': s['createdAt'], 'updated_at': s['updated_at'], 'metadata': {}}
+
+
+def _glance_image(i):
+    return {'id': i['id'], 'name': i['name'], 'status': i['status'].lower(), 'visibility': 'public',
+            'created_at': i['created'], 'updated_at': i['updated'], 'min_disk': i['minDisk'],
+            'min_ram': i['minRam'], 'size': 1 << 30, 'tags': [], 'disk_format': 'qcow2',
+            'container_format': 'bare', 'file': '/v2/images/%s/file' % i['id']}
+
+
+def _neutron_network(n):
+    return {'id': n['id'], 'name': n['label'], 'status': 'ACTIVE', 'subnets': [], 'shared': False,
+            'admin_state_up': True, 'router:external': False, 'tenant_id': 'admin'}
+
+
+# (service prefix, collection) -> (dataset attribute, singular key, view)
+NATIVE = {
+    ('cinder', 'volumes'): ('volumes', 'volume', _cinder_volume),
+    ('cinder', 'snapshots'): ('snapshots', 'snapshot', _cinder_snapshot),
+    ('glance', 'images'): ('images', 'image', _glance_image),
+    ('neutron', 'networks'): ('networks', 'network', _neutron_network),
+}
+
+
+def _now():
+    return datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class Dataset(object):
+    """
+    In-memory tenant content served by the stub
+    """
+
+    def __init__(self, nodes=10, volumes=10, snapshots=10, images=10, flavors=10, networks=3):
+        self.lock = threading.Lock()
+        created = '2016-05-01T10:00:00Z'
+        self.flavors = [{'id': str(i), 'name': 'm%d.flavor' % i, 'ram': 512 * (i + 1),
+                         'vcpus': (i % 16) + 1, 'disk': 10 * (i % 20 + 1), 'swap': '',
+                         'OS-FLV-EXT-DATA:ephemeral': 0, 'links': []}
+                        for i in range(flavors)]
+        self.images = [{'id': str(uuid.UUID(int=i + 1)), 'name': 'image-%d' % i, 'status': 'ACTIVE',
+                        'created': created, 'updated': created, 'minDisk': 0, 'minRam': 0,
+                        'progress': 100, 'metadata': {}}
+                       for i in range(images)]
+        self.networks = [{'id': str(uuid.UUID(int=10 ** 6 + i)), 'label': 'net-%d' % i,
+                          'cidr': '10.%d.0.0/24' % i}
+                         for i in range(networks)]
+        self.servers = [self._server('node-%d' % i, self.images[i % len(self.images)]['id'] if images else None,
+                                     self.flavors[i % len(self.flavors)]['id'] if flavors else None,
+                                     'ACTIVE', str(uuid.UUID(int=2 * 10 ** 6 + i)))
+                        for i in range(nodes)]
+        self.volumes = [self._volume('volume-%d' % i, 1 + i % 100, str(uuid.UUID(int=3 * 10 ** 6 + i)))
+                        for i in range(volumes)]
+        self.snapshots = [self._snapshot(self.volumes[i % len(self.volumes)]['id'] if volumes else None,
+                                         'snapshot-%d' % i, str(uuid.UUID(int=4 * 10 ** 6 + i)))
+                          for i in range(snapshots)]
+
+    def _server(self, name, image_id, flavor_id, status, server_id=None):
+        return {'id': server_id or str(uuid.uuid4()), 'name': name, 'status': status,
+                'addresses': {'private': [{'addr': '10.0.0.5', 'version': 4}]},
+                'image': {'id': image_id}, 'flavor': {'id': flavor_id}, 'hostId': 'h',
+                'tenant_id': 'admin', 'user_id': 'admin', 'metadata': {},
+                'created': '2016-05-01T10:00:00Z', 'updated': _now(),
+                'links': [{'rel': 'self', 'href': 'http://localhost/servers'}],
+                'OS-EXT-STS:vm_state': status.lower()}
+
+    def _volume(self, name, size, volume_id=None, status='available'):
+        return {'id': volume_id or str(uuid.uuid4()), 'displayName': name, 'size': size,
+                'status': status, 'attachments': [{}], 'availabilityZone': 'nova',
+                'volumeType': None, 'metadata': {}, 'createdAt': '2016-05-01T10:00:00.000000',
+                'updated_at': _now()}
+
+    def _snapshot(self, volume_id, name, snapshot_id=None, status='available'):
+        return {'id': snapshot_id or str(uuid.uuid4()), 'volumeId': volume_id, 'displayName': name,
+                'displayDescription': name, 'size': 1, 'status': status,
+                'createdAt': '2016-05-01T10:00:00.000000', 'updated_at': _now()}
+
+
+class MockOpenStack(ThreadingMixIn, HTTPServer):
+    """
+    Threaded stub server, use start()/stop() or as a context manager
+    """
+    daemon_threads = True
+
+    def __init__(self, dataset=None, latency=0.0, port=0, token_ttl=3600, regions=None, etags=False,
+                 max_limit=1000):
+        """
+        :param dataset: content of RegionOne
+        :param latency: seconds added to every request
+        :param token_ttl: lifetime of issued tokens, tokens added to `revoked` get a 401
+        :param regions: dict region name -> Dataset for additional regions, served
+                        under /<region> with their own catalog endpoints
+        :param etags: send an ETag with compute listings and answer a matching
+                      If-None-Match with a 304, which Nova itself does not do
+        :param max_limit: most items of one page whatever the limit asked, as
+                          Nova's osapi_max_limit
+        """
+        HTTPServer.__init__(self, ('127.0.0.1', port), _Handler)
+        self.dataset = dataset or Dataset()
+        self.regions = dict(regions or {})
+        self.latency = latency
+        self.token_ttl = token_ttl
+        self.revoked = set()
+        self.etags = etags
+        self.max_limit = max_limit
+        self.requests = []
+        self._thread = None
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.server_address[1]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count(self, method=None, path=None):
+        return len([r for r in self.requests
+                    if (method is None or r[0] == method) and (path is None or re.search(path, r[1]))])
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body go out in separate writes, without this every
+    # keep-alive request waits for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body=None, headers=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else b''
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        self._payload = json.loads(self.rfile.read(length).decode('utf-8')) if length else {}
+
+    def _body(self):
+        return self._payload
+
+    def _bases(self):
+        base = self.server.url
+        return [('RegionOne', base)] + [(region, base + '/' + region) for region in sorted(self.server.regions)]
+
+    def _catalog_v2(self):
+        return [{'type': service_type, 'name': name,
+                 'endpoints': [{'region': region, 'publicURL': base + path} for region, base in self._bases()]}
+                for service_type, name, path in SERVICES]
+
+    def _catalog_v3(self):
+        return [{'type': service_type, 'name': name,
+                 'endpoints': [{'region': region, 'interface': 'public', 'url': base + path}
+                               for region, base in self._bases()]}
+                for service_type, name, path in SERVICES]
+
+    def _dispatch(self, method):
+        server = self.server
+        self._read_body()
+        parsed = urlparse(self.path)
+        path = parsed.path
+        query = dict((k, v[-1]) for k, v in parse_qs(parsed.query).items())
+        server.requests.append((method, path, query))
+        self._ds = server.dataset
+        region = path.split('/')[1] if path.count('/') > 1 else None
+        if region in server.regions:
+            self._ds = server.regions[region]
+            path = path[len(region) + 1:]
+        if server.latency:
+            time.sleep(server.latency)
+        expires = (datetime.utcnow() + timedelta(seconds=server.token_ttl)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        if method == 'POST' and path.endswith('/v2.0/tokens'):
+            token = {'id': uuid.uuid4().hex, 'expires': expires, 'tenant': {'id': 'admin', 'name': 'admin'}}
+            return self._reply(200, {'access': {'token': token, 'serviceCatalog': self._catalog_v2(),
+                                                'user': {'id': 'admin', 'name': 'admin', 'roles': []}}})
+        if method == 'POST' and path.endswith('/v3/auth/tokens'):
+            body = {'token': {'expires_at': expires, 'catalog': self._catalog_v3(),
+                              'user': {'id': 'admin', 'name': 'admin'}, 'roles': []}}
+            return self._reply(201, body, {'X-Subject-Token': uuid.uuid4().hex})
+        if self.headers.get('X-Auth-Token') in server.revoked:
+            return self._reply(401, {'error': {'code': 401, 'message': 'The request you have made requires authentication.'}})
+        native = (re.match(r'^/(cinder)/v2/[^/]+/(.*)$', path) or re.match(r'^/(glance)/v2/(.*)$', path)
+                  or re.match(r'^/(neutron)/v2\.0/(.*)$', path))
+        if native:
+            return self._reply(*self._native(method, native.group(1), native.group(2), query))
+        m = re.match(r'^/v2/[^/]+(/.*)$', path)
+        if not m:
+            return self._reply(*_not_found())
+        return self._compute(method, m.group(1), query)
+
+    def _page(self, items, query, by_offset=False):
+        """
+        :param by_offset: page by offset and ignore the marker, as Nova's Cinder proxies
+        :return: (page, limit applied)
+        """
+        marker = query.get('marker')
+        if by_offset:
+            items = items[int(query.get('offset') or 0):]
+        elif marker:
+            ids = [i['id'] for i in items]
+            items = items[ids.index(marker) + 1:] if marker in ids else []
+        limit = min(int(query.get('limit') or self.server.max_limit), self.server.max_limit)
+        return items[:limit], limit
+
+    def _filter(self, items, query):
+        status = query.get('status')
+        if status:
+            items = [i for i in items if i.get('status', '').lower() == status.lower()]
+        name = query.get('name')
+        if name:
+            items = [i for i in items if re.search(name, i.get('name') or i.get('displayName') or '')]
+        since = query.get('changes-since')
+        if since:
+            since = since.replace('Z', '').replace('T', ' ')[:19]
+            items = [i for i in items if (i.get('updated') or i.get('updated_at') or '')
+                     .replace('Z', '').replace('T', ' ')[:19] >= since]
+        for key in ('image', 'flavor'):
+            if query.get(key):
+                items = [i for i in items if (i.get(key) or {}).get('id') == query[key]]
+        if query.get('reservation_id'):
+            items = [i for i in items if i.get('OS-EXT-SRV-ATTR:reservation_id') == query['reservation_id']]
+        if query.get('volume_id'):
+            items = [i for i in items if i.get('volumeId') == query['volume_id']]
+        return items
+
+    def _native(self, method, service, path, query):
+        ds = self._ds
+        parts = [p for p in path.split('/') if p]
+        if not parts or (service, parts[0]) not in NATIVE:
+            return _not_found()
+        attr, single, view = NATIVE[(service, parts[0])]
+        items = getattr(ds, attr)
+        rest = parts[1:]
+        if rest[:1] == ['detail']:
+            rest = rest[1:]
+        if method == 'GET' and not rest:
+            page, limit = self._page(self._filter(list(items), query), query)
+            body = {attr: [view(i) for i in page]}
+            if service == 'glance' and page and len(page) == limit:
+                body['next'] = '/v2/images?limit=%s&marker=%s' % (limit, page[-1]['id'])
+            return 200, body
+        if method == 'POST' and not rest:
+            data = self._body().get(single, {})
+            if attr == 'volumes':
+                item = ds._volume(data.get('name'), data.get('size'), status='creating')
+                threading.Timer(0.05, self._activate, ([item],), {'status': 'available'}).start()
+            elif attr == 'snapshots':
+                item = ds._snapshot(data.get('volume_id'), data.get('name'))
+            elif attr == 'networks':
+                item = {'id': str(uuid.uuid4()), 'label': data.get('name'), 'cidr': None}
+            else:
+                return 405, None
+            with ds.lock:
+                items.append(item)
+            return 202 if attr == 'volumes' else 201, {single: view(item)}
+        with ds.lock:
+            found = [i for i in items if i['id'] == rest[0]]
+        if not found:
+            return _not_found()
+        if method == 'GET':
+            return 200, view(found[0]) if service == 'glance' else {single: view(found[0])}
+        if method == 'DELETE':
+            with ds.lock:
+                items.remove(found[0])
+            return 204, None
+        return 405, None
+
+    def _compute(self, method, path, query):
+        ds = self._ds
+        collections = {'servers': ('servers', 'server'), 'flavors': ('flavors', 'flavor'),
+                       'images': ('images', 'image'), 'os-volumes': ('volumes', 'volume'),
+                       'os-snapshots': ('snapshots', 'snapshot'), 'os-networks': ('networks', 'network')}
+        parts = [p for p in path.split('/') if p]
+        if not parts or parts[0] not in collections:
+            return self._reply(404, {'itemNotFound': {'message': 'Not found', 'code': 404}})
+        attr, single = collections[parts[0]]
+        items = getattr(ds, attr)
+        rest = parts[1:]
+        if rest[:1] == ['detail']:
+            rest = rest[1:]
+        if method == 'GET' and not rest:
+            proxy = parts[0] in ('os-volumes', 'os-snapshots')
+            if proxy:
+                # Nova's Cinder proxies drop changes-since
+                query = dict((k, v) for k, v in query.items() if k != 'changes-since')
+            page, limit = self._page(self._filter(list(items), query), query, by_offset=proxy)
+            body = {attr: page}
+            if parts[0] in ('servers', 'flavors', 'images') and page and len(page) == limit:
+                following = dict(query, limit=limit, marker=page[-1]['id'])
+                href = '%s%s?%s' % (self.server.url, urlparse(self.path).path,
+                                    urlencode(sorted(following.items())))
+                body[attr + '_links'] = [{'rel': 'next', 'href': href}]
+            if self.server.etags:
+                etag = '"%s"' % hashlib.md5(json.dumps(body, sort_keys=True).encode('utf-8')).hexdigest()
+                if self.headers.get('If-None-Match') == etag:
+                    return self._reply(304, headers={'ETag': etag})
+                return self._reply(200, body, {'ETag': etag})
+            return self._reply(200, body)
+        if method == 'POST' and not rest:
+            return self._create(parts[0], self._body())
+        item_id = rest[0]
+        with ds.lock:
+            found = [i for i in items if i['id'] == item_id]
+        if not found:
+            return self._reply(404, {'itemNotFound': {'message': 'Not found', 'code': 404}})
+        item = found[0]
+        if method == 'GET':
+            return self._reply(200, {single: item})
+        if method == 'DELETE':
+            with ds.lock:
+                items.remove(item)
+            return self._reply(204)
+        if method == 'POST' and rest[1:] == ['action']:
+            action = list(self._body().keys())[0]
+            states = {'pause': 'PAUSED', 'unpause': 'ACTIVE', 'suspend': 'SUSPENDED',
+                      'resume': 'ACTIVE', 'reboot': 'ACTIVE', 'os-start': 'ACTIVE', 'os-stop': 'SHUTOFF'}
+            if action in states:
+                item['status'] = states[action]
+                item['OS-EXT-STS:vm_state'] = states[action].lower()
+                item['updated'] = _now()
+            return self._reply(202)
+        if method == 'POST' and rest[1:] == ['os-volume_attachments']:
+            volume_id = self._body()['volumeAttachment']['volumeId']
+            with ds.lock:
+                volumes = [v for v in ds.volumes if v['id'] == volume_id]
+            if not volumes:
+                return self._reply(404, {'itemNotFound': {'message': 'Not found', 'code': 404}})
+            volumes[0]['status'] = 'in-use'
+            volumes[0]['attachments'] = [{'serverId': item['id'], 'volumeId': volume_id}]
+            return self._reply(200, {'volumeAttachment': {'id': volume_id, 'serverId': item['id'],
+                                                          'volumeId': volume_id}})
+        if method == 'PUT':
+            item.update(self._body().get(single, {}))
+            return self._reply(200, {single: item})
+        return self._reply(405)
+
+    def _create(self, collection, body):
+        ds = self._ds
+        if collection == 'servers':
+            s = body['server']
+            count = int(s.get('max_count', 1))
+            reservation = 'r-' + uuid.uuid4().hex[:8]
+            names = [s['name']] if count == 1 else ['%s-%d' % (s['name'], i + 1) for i in range(count)]
+            servers = [ds._server(name, s.get('imageRef'), s.get('flavorRef'), 'BUILD') for name in names]
+            for server in servers:
+                server['OS-EXT-SRV-ATTR:reservation_id'] = reservation
+            with ds.lock:
+                ds.servers.extend(servers)
+            threading.Timer(0.05, self._activate, (servers,)).start()
+            if s.get('return_reservation_id'):
+                return self._reply(202, {'reservation_id': reservation})
+            return self._reply(202, {'server': dict(servers[0], adminPass='x')})
+        if collection == 'os-volumes':
+            v = body['volume']
+            volume = ds._volume(v.get('display_name'), v.get('size'), status='creating')
+            with ds.lock:
+                ds.volumes.append(volume)
+            threading.Timer(0.05, self._activate, ([volume],), {'status': 'available'}).start()
+            return self._reply(200, {'volume': volume})
+        if collection == 'os-snapshots':
+            v = body['snapshot']
+            snapshot = ds._snapshot(v.get('volume_id'), v.get('display_name'))
+            with ds.lock:
+                ds.snapshots.append(snapshot)
+            return self._reply(200, {'snapshot': snapshot})
+        if collection == 'os-networks':
+            v = body['network']
+            network = {'id': str(uuid.uuid4()), 'label': v.get('label'), 'cidr': v.get('cidr')}
+            with ds.lock:
+                ds.networks.append(network)
+            return self._reply(200, {'network': network})
+        return self._reply(405)
+
+    @staticmethod
+    def _activate(items, status='ACTIVE'):
+        for item in items:
+            item['status'] = status
+            if 'OS-EXT-STS:vm_state' in item:
+                item['OS-EXT-STS:vm_state'] = status.lower()
+            item['updated' if 'updated' in item else 'updated_at'] = _now()
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
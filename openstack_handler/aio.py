@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+asyncio facade over the handler classes (Python 3 only).
+
+Every public handler method becomes a coroutine that runs the synchronous
+method on a shared worker pool, so results are serialized exactly like the
+sync API and the registry connections of the pool threads are reused:
+
+    node = AsyncNode(username, password, tenant, url, api)
+    nodes = await node.nodes()
+
+iter_* generators become async generators pulling batches on the pool:
+
+    async for d in node.iter_nodes():
+        ...
+"""
+import asyncio
+import functools
+import itertools
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from .openstack_handler import Image, Volume, Snapshot, Size, Node, Network
+
+# Max blocking calls in flight per event loop
+concurrency = 32
+# Items pulled from a sync generator per pool call
+batch_size = 500
+
+_lock = threading.Lock()
+_executor = None
+_semaphores = weakref.WeakKeyDictionary()
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=concurrency)
+        return _executor
+
+
+def _get_semaphore(loop):
+    with _lock:
+        semaphore = _semaphores.get(loop)
+        if semaphore is None:
+            semaphore = _semaphores[loop] = asyncio.Semaphore(concurrency)
+        return semaphore
+
+
+async def run(func, *args, **kwargs):
+    """
+    Run a blocking call on the shared pool
+    :param func:
+    :return: func result
+    """
+    loop = asyncio.get_running_loop()
+    async with _get_semaphore(loop):
+        return await loop.run_in_executor(_get_executor(), functools.partial(func, *args, **kwargs))
+
+
+def _coroutine(name, doc):
+    async def method(self, *args, **kwargs):
+        return await run(getattr(self.handler, name), *args, **kwargs)
+    method.__name__ = name
+    method.__doc__ = doc
+    return method
+
+
+def _take(iterator, n):
+    return list(itertools.islice(iterator, n))
+
+
+def _async_generator(name, doc):
+    async def method(self, *args, **kwargs):
+        iterator = getattr(self.handler, name)(*args, **kwargs)
+        while True:
+            items = await run(_take, iterator, batch_size)
+            if not items:
+                return
+            for item in items:
+                yield item
+    method.__name__ = name
+    method.__doc__ = doc
+    return method
+
+
+class AsyncHandler(object):
+    """
+    Base class of the async facades
+    """
+
+    handler_cls = None
+
+    def __init__(self, username, password, tenant, url, api, **kwargs):
+        self.handler = self.handler_cls(username, password, tenant, url, api, **kwargs)
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        for name in dir(cls.handler_cls):
+            if name.startswith('_') or name in ('init_connection',) or hasattr(cls, name):
+                continue
+            attr = getattr(cls.handler_cls, name)
+            if name.startswith('iter_'):
+                setattr(cls, name, _async_generator(name, attr.__doc__))
+            elif callable(attr):
+                setattr(cls, name, _coroutine(name, attr.__doc__))
+
+
+class AsyncImage(AsyncHandler):
+    handler_cls = Image
+
+
+class AsyncVolume(AsyncHandler):
+    handler_cls = Volume
+
+
+class AsyncSnapshot(AsyncHandler):
+    handler_cls = Snapshot
+
+
+class AsyncSize(AsyncHandler):
+    handler_cls = Size
+
+
+class AsyncNode(AsyncHandler):
+    handler_cls = Node
+
+
+class AsyncNetwork(AsyncHandler):
+    handler_cls = Network
@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from .ratelimit import priority
+
+
+class Throttle(object):
+    """
+    Spaces calls so no more than `rate` start per second
+    """
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
+_lock = threading.Lock()
+_executor = None
+# Size of the worker pool shared by every bulk call; worker threads keep
+# their registry driver, so connections are reused across calls
+max_workers = 32
+
+
+def executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            # Imported on first use to keep the package import light
+            from concurrent.futures import ThreadPoolExecutor
+            _executor = ThreadPoolExecutor(max_workers=max_workers)
+        return _executor
+
+
+def run_bulk(func, ids, concurrency=8, rate=None):
+    """
+    Call func(id) for every id on the shared worker pool
+    :param func: callable taking one id
+    :param ids: iterable of ids
+    :param concurrency: max calls in flight for this batch
+    :param rate: max calls started per second, None for no limit
+    :return: (results, errors) dicts keyed by id
+    """
+    throttle = Throttle(rate)
+    slots = threading.BoundedSemaphore(max(1, concurrency))
+    results, errors = {}, {}
+
+    def call(obj_id):
+        try:
+            throttle.wait()
+            with priority('bulk'):
+                return func(obj_id)
+        finally:
+            slots.release()
+
+    futures = []
+    for obj_id in ids:
+        slots.acquire()
+        futures.append((obj_id, executor().submit(call, obj_id)))
+    for obj_id, future in futures:
+        try:
+            results[obj_id] = future.result()
+        except Exception as e:
+            errors[obj_id] = str(e) or e.__class__.__name__
+    return results, errors
+
+
+def fan_out(calls, timeout, pool=None):
+    """
+    Start independent calls at once and wait for them until a deadline
+    :param calls: dict key -> callable taking no argument
+    :param timeout: seconds to wait for all of them, calls still running are reported as timed out
+    :param pool: executor running the calls, the shared worker pool by default
+    :return: dict key -> (result or None, status dict {'status': ok|error|timeout,
+             'seconds', 'error', 'count'}), count being the number of items returned
+    """
+    def run(func):
+        started = time.time()
+        try:
+            return func(), None, time.time() - started
+        except Exception as e:
+            return None, e, time.time() - started
+
+    from concurrent.futures import wait
+    pool = pool or executor()
+    started = time.time()
+    futures = dict((pool.submit(run, func), key) for key, func in calls.items())
+    wait(futures, timeout=timeout)
+    outcome = {}
+    for future, key in futures.items():
+        if not future.done():
+            future.cancel()
+            outcome[key] = (None, {'status': 'timeout', 'seconds': round(time.time() - started, 3),
+                                   'error': 'no answer within %ss' % timeout, 'count': 0})
+            continue
+        result, error, seconds = future.result()
+        if error is not None:
+            status = {'status': 'error', 'seconds': round(seconds, 3),
+                      'error': '%s: %s' % (error.__class__.__name__, error)}
+        else:
+            status = {'status': 'ok', 'seconds': round(seconds, 3), 'error': None}
+        status['count'] = len(result) if isinstance(result, list) else int(result is not None)
+        outcome[key] = (result, status)
+    return outcome
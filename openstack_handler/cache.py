@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import threading
+import time
+from collections import OrderedDict
+
+
+class CatalogCache(object):
+    """
+    TTL + LRU cache for catalog lookups (images, flavors, networks).
+
+    Entries are keyed by (scope, resource, key) where scope identifies the
+    connection (see SharedDriver.key), resource is the catalog type and key
+    is an object id, or None for the full listing.
+    """
+
+    # Volumes change often, set a ttl to share them between calls
+    DEFAULT_TTL = {'image': 300, 'flavor': 600, 'network': 300, 'volume': 0}
+
+    def __init__(self, ttl=None, maxsize=1024):
+        """
+        :param ttl: dict of resource -> seconds, merged over DEFAULT_TTL
+        :param maxsize: max number of entries kept
+        """
+        self.ttl = dict(self.DEFAULT_TTL)
+        self.ttl.update(ttl or {})
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'invalidations': 0}
+
+    def configure(self, ttl=None, maxsize=None):
+        with self._lock:
+            if ttl:
+                self.ttl.update(ttl)
+            if maxsize is not None:
+                self.maxsize = maxsize
+                self._evict()
+
+    def _evict(self):
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def get(self, scope, resource, key=None):
+        """
+        :return: cached value or None when missing/expired
+        """
+        k = (scope, resource, key)
+        with self._lock:
+            item = self._data.pop(k, None)
+            if item is None:
+                return None
+            expires, value = item
+            if expires < time.time():
+                return None
+            self._data[k] = item
+            return value
+
+    def set(self, scope, resource, key, value):
+        ttl = self.ttl.get(resource, 0)
+        if ttl <= 0 or value is None:
+            return
+        with self._lock:
+            k = (scope, resource, key)
+            self._data.pop(k, None)
+            self._data[k] = (time.time() + ttl, value)
+            self._evict()
+
+    def get_or_load(self, scope, resource, key, loader):
+        """
+        Return the cached value or call loader() and cache its result
+        :param scope:
+        :param resource: image|flavor|network|volume
+        :param key: object id, None for the listing
+        :param loader: callable fetching the value
+        :return:
+        """
+        value = self.get(scope, resource, key)
+        if value is not None:
+            with self._lock:
+                self._stats['hits'] += 1
+            return value
+        with self._lock:
+            self._stats['misses'] += 1
+        value = loader()
+        self.set(scope, resource, key, value)
+        return value
+
+    def invalidate(self, scope, resource, key=None):
+        """
+        Drop cached entries. Dropping a single object also drops the listing
+        that contains it; key=None drops every entry of that resource.
+        """
+        with self._lock:
+            for k in list(self._data):
+                if k[0] != scope or k[1] != resource:
+                    continue
+                if key is None or k[2] is None or k[2] == key:
+                    del self._data[k]
+                    self._stats['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            d = dict(self._stats)
+            d['size'] = len(self._data)
+        return d
+
+
+catalog_cache = CatalogCache()
+
+# Node objects only need to be fresh enough to address the server in actions
+node_cache = CatalogCache(ttl={'node': 30}, maxsize=50000)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Image, flavor and network listings persisted in a local SQLite file, so a
+new process (a CLI call, a freshly forked worker) starts with the catalog
+of the previous ones instead of downloading it again.
+
+Entries are keyed by endpoint, tenant and query, and are answered:
+
+- without any request while younger than max_age (the catalog cache ttl
+  of the resource by default)
+- then with a conditional request: If-None-Match when the API sent an
+  ETag, a 304 keeps the entry. Nova does not send ETags for these
+  listings, for /images/detail the entry is revalidated with a
+  changes-since query instead, an empty answer keeps the entry and the
+  changed images are merged into it. Glance v2 leaves deleted images out
+  of changes-since, so the listing is downloaded in full again every
+  full_interval seconds
+- flavors and networks without an ETag are downloaded again
+
+Any POST, PUT or DELETE on images, flavors or networks drops the tenant's
+entries of that resource.
+
+The file is shared by every process of the host: it is opened in WAL mode,
+every write is a single statement, and a locked database is waited for.
+
+    diskcache.configure('/var/cache/openstack_handler/responses.db')
+"""
+import json
+import os
+import threading
+import time
+
+# Environment variable naming the default cache file
+ENV = 'OPENSTACK_HANDLER_DISK_CACHE'
+
+# listing path -> (catalog resource, response key, supports changes-since)
+LISTINGS = {
+    '/images/detail': ('image', 'images', True),
+    '/flavors/detail': ('flavor', 'flavors', False),
+    '/os-networks': ('network', 'networks', False),
+}
+
+# Seconds an entry is served without asking the API, as the catalog cache ttl
+DEFAULT_MAX_AGE = {'image': 300, 'flavor': 600, 'network': 300}
+
+# Seconds taken off changes-since for the clock drift between host and API
+SKEW = 60
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    tenant TEXT NOT NULL,
+    resource TEXT NOT NULL,
+    etag TEXT,
+    body TEXT NOT NULL,
+    validated REAL NOT NULL,
+    full REAL
+);
+CREATE INDEX IF NOT EXISTS responses_resource ON responses (tenant, resource);
+"""
+
+
+class DiskCache(object):
+    """
+    SQLite backed response store, safe for concurrent processes
+    """
+
+    def __init__(self, path, max_age=None, timeout=30, expire=86400, full_interval=3600):
+        """
+        :param path: database file
+        :param max_age: dict of resource -> seconds, merged over DEFAULT_MAX_AGE
+        :param timeout: seconds to wait for another process holding the database
+        :param expire: seconds after which an entry that was not revalidated is dropped
+        :param full_interval: seconds after the last full download of an entry
+                              revalidated by changes-since before downloading it again
+        """
+        self.path = os.path.expanduser(path)
+        self.max_age = dict(DEFAULT_MAX_AGE)
+        self.max_age.update(max_age or {})
+        self.timeout = timeout
+        self.expire = expire
+        self.full_interval = full_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'revalidated': 0, 'merged': 0, 'misses': 0, 'invalidations': 0}
+
+    def _db(self):
+        db = getattr(self._local, 'db', None)
+        # A forked worker opens its own connection
+        if db is None or self._local.pid != os.getpid():
+            import sqlite3
+            directory = os.path.dirname(self.path) or '.'
+            if not os.path.isdir(directory):
+                os.makedirs(directory, 0o700)
+            db = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            db.executescript(_SCHEMA)
+            # Files written before full downloads were tracked
+            if 'full' not in [row[1] for row in db.execute('PRAGMA table_info(responses)')]:
+                try:
+                    db.execute('ALTER TABLE responses ADD COLUMN full REAL')
+                except sqlite3.OperationalError:
+                    pass
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def get(self, key):
+        """
+        :return: (etag, body, validated, full) or None
+        """
+        return self._db().execute('SELECT etag, body, validated, full FROM responses WHERE key = ?',
+                                  (key,)).fetchone()
+
+    def put(self, key, tenant, resource, etag, body, full=None):
+        """
+        :param full: time of the last full download of the body, now by default
+        """
+        now = time.time()
+        db = self._db()
+        db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                   (key, tenant, resource, etag, body, now, now if full is None else full))
+        if self.expire:
+            db.execute('DELETE FROM responses WHERE validated < ?', (now - self.expire,))
+
+    def touch(self, key):
+        self._db().execute('UPDATE responses SET validated = ? WHERE key = ?', (time.time(), key))
+
+    def invalidate(self, tenant=None, resource=None):
+        """
+        Drop the entries of a tenant and/or resource, everything by default
+        """
+        query, args = 'DELETE FROM responses', []
+        clauses = []
+        if tenant is not None:
+            clauses.append('tenant = ?')
+            args.append(tenant)
+        if resource is not None:
+            clauses.append('resource = ?')
+            args.append(resource)
+        if clauses:
+            query += ' WHERE ' + ' AND '.join(clauses)
+        self._db().execute(query, args)
+        self._count('invalidations')
+
+    def stats(self):
+        """
+        :return: dict with hits (no request), revalidated (304 or no changes),
+                 merged (changes applied), misses (full download) and entries
+        """
+        with self._lock:
+            d = dict(self._stats)
+        d['entries'] = self._db().execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+        return d
+
+    def reset(self):
+        with self._lock:
+            self._stats = dict((k, 0) for k in self._stats)
+
+
+class _Cached(object):
+    """
+    Stand-in for a libcloud response served from the cache
+    """
+
+    def __init__(self, body, status):
+        self.body = body
+        self.object = json.loads(body)
+        self.status = status
+        self.headers = {}
+
+
+def configure(path, **kwargs):
+    """
+    Enable the cache for every connection of the process
+    :param path: database file
+    :param kwargs: DiskCache options
+    :return: DiskCache
+    """
+    global cache
+    cache = DiskCache(path, **kwargs)
+    return cache
+
+
+def disable():
+    global cache
+    cache = None
+
+
+def from_env():
+    """
+    :return: DiskCache for $OPENSTACK_HANDLER_DISK_CACHE, None when unset
+    """
+    path = os.environ.get(ENV)
+    return DiskCache(path) if path else None
+
+
+cache = from_env()
+
+
+# Writes below these paths drop the cached listings of the resource
+_WRITES = (('/images', 'image'), ('/flavors', 'flavor'), ('/os-networks', 'network'))
+
+
+def _resource(action):
+    for prefix, resource in _WRITES:
+        if action.startswith(prefix):
+            return resource
+    return None
+
+
+def _merge(body, changes, key):
+    """
+    Apply a changes-since answer to a cached listing
+    """
+    doc = json.loads(body)
+    changed = dict((item['id'], item) for item in changes)
+    items = [changed.pop(item['id'], item) for item in doc.get(key) or []]
+    items.extend(item for item in changes if item['id'] in changed)
+    doc[key] = [item for item in items if (item.get('status') or '').upper() != 'DELETED']
+    return json.dumps(doc)
+
+
+def _since(validated):
+    return time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(validated - SKEW))
+
+
+_conditionals = {}
+
+
+def _conditional(cls):
+    """
+    Response class also accepting the 304 of a conditional request, libcloud
+    would fail parsing its empty body as an error
+    """
+    conditional = _conditionals.get(cls)
+    if conditional is None:
+        class conditional(cls):
+            def success(self):
+                return self.status == 304 or cls.success(self)
+
+            def parse_body(self):
+                return None if self.status == 304 else cls.parse_body(self)
+        conditional.__name__ = 'Conditional' + cls.__name__
+        conditional = _conditionals.setdefault(cls, conditional)
+    return conditional
+
+
+_ARGS = ('params', 'data', 'headers', 'method', 'raw')
+
+
+def install(connection, tenant):
+    """
+    Answer the catalog listings of a libcloud connection from the current cache
+    :param connection: driver.connection
+    :param tenant: tenant name, part of the cache key
+    """
+    request = connection.request
+    connection.responseCls = _conditional(connection.responseCls)
+
+    def cached_request(action, *args, **kwargs):
+        disk = cache
+        if disk is None:
+            return request(action, *args, **kwargs)
+        call = dict(zip(_ARGS, args))
+        call.update(kwargs)
+        method = (call.get('method') or 'GET').upper()
+        if method != 'GET':
+            response = request(action, *args, **kwargs)
+            resource = _resource(action)
+            if resource is not None:
+                disk.invalidate(tenant, resource)
+            return response
+        listing = LISTINGS.get(action)
+        if listing is None or call.get('raw'):
+            return request(action, *args, **kwargs)
+        try:
+            endpoint = connection.get_endpoint()
+        except Exception:
+            return request(action, *args, **kwargs)
+        resource, list_key, since_ok = listing
+        params = dict(call.get('params') or {})
+        key = json.dumps([endpoint, tenant, action, sorted(params.items())])
+        entry = disk.get(key)
+        if entry is not None and time.time() - entry[2] < disk.max_age.get(resource, 0):
+            disk._count('hits')
+            return _Cached(entry[1], 200)
+
+        headers = dict(call.get('headers') or {})
+        delta = False
+        if entry is not None:
+            if entry[0]:
+                headers['If-None-Match'] = entry[0]
+            elif (since_ok and 'limit' not in params and 'marker' not in params
+                  and time.time() - (entry[3] or 0) < disk.full_interval):
+                params['changes-since'] = _since(entry[2])
+                delta = True
+        response = request(action, params=params, data=call.get('data'), headers=headers, method='GET')
+        if response.status == 304:
+            disk.touch(key)
+            disk._count('revalidated')
+            return _Cached(entry[1], 304)
+
+        if delta:
+            changes = (response.object or {}).get(list_key) or []
+            if not changes:
+                disk.touch(key)
+                disk._count('revalidated')
+                return _Cached(entry[1], response.status)
+            body = _merge(entry[1], changes, list_key)
+            disk.put(key, tenant, resource, None, body, entry[3])
+            disk._count('merged')
+            return _Cached(body, response.status)
+        if isinstance(response.object, dict):
+            disk.put(key, tenant, resource, response.headers.get('etag'), response.body)
+        disk._count('misses')
+        return response
+
+    connection.request = cached_request
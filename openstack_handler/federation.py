@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+One client over many clouds, regions and tenants.
+
+Calls fan out to every target at once on a worker pool of the federation's
+own, with a thread for every call of a refresh(), so they never wait behind
+unrelated bulk work on the shared pool. The results are merged, each item
+tagged with its target's name. A target that fails or misses the deadline is
+reported instead of failing the whole call, so a refresh takes as long as the slowest healthy region rather than the
+sum of all of them. Targets of the same Keystone and credentials share one
+token through the registry, whatever their region.
+
+    federation = Federation([
+        {'name': 'east', 'username': 'admin', 'password': 'secret', 'tenant': 'admin',
+         'url': 'http://keystone:5000', 'api': '2.0_password', 'region': 'RegionOne'},
+        {'name': 'west', ..., 'region': 'RegionTwo'},
+    ], timeout=30)
+    federation.nodes()
+"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from .bulk import fan_out
+from .openstack_handler import Image, Network, Node, Size, Snapshot, Volume
+from .serializers import check_output, encode
+
+# resource -> handler class
+HANDLERS = {
+    'image': Image,
+    'volume': Volume,
+    'snapshot': Snapshot,
+    'size': Size,
+    'node': Node,
+    'network': Network,
+}
+
+# listings run by refresh(): section -> (resource, method)
+LISTINGS = {
+    'nodes': ('node', 'nodes'),
+    'volumes': ('volume', 'volumes'),
+    'snapshots': ('snapshot', 'snapshots'),
+    'images': ('image', 'images'),
+    'sizes': ('size', 'sizes'),
+    'networks': ('network', 'networks'),
+}
+
+
+class Target(object):
+    """
+    One endpoint/region/tenant, handlers are created on first use
+    """
+
+    def __init__(self, username, password, tenant, url, api, region=None, name=None):
+        self.username = username
+        self.password = password
+        self.tenant = tenant
+        self.url = url
+        self.api = api
+        self.region = region
+        self.name = name or '%s/%s' % (region or url, tenant)
+        self._handlers = {}
+
+    def handler(self, resource):
+        handler = self._handlers.get(resource)
+        if handler is None:
+            handler = self._handlers[resource] = HANDLERS[resource](
+                self.username, self.password, self.tenant, self.url, self.api,
+                output='dict', region=self.region)
+        return handler
+
+
+class Federation(object):
+    """
+    Runs handler methods on every target concurrently
+    """
+
+    def __init__(self, targets, timeout=60, output='json'):
+        """
+        :param targets: list of Target or of dicts with Target's arguments
+        :param timeout: per call deadline in seconds, targets still running are reported as timed out
+        :param output: result format, see serializers.FORMATS, an unknown one raises ValueError
+        """
+        check_output(output)
+        self.targets = [t if isinstance(t, Target) else Target(**t) for t in targets]
+        names = [t.name for t in self.targets]
+        if len(set(names)) != len(names):
+            raise ValueError("Target names must be unique: %s" % ', '.join(names))
+        self.timeout = timeout
+        self.output = output
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def _executor(self):
+        """
+        Pool sized to run every listing of every target at once, its threads
+        keep their registry drivers between calls
+        """
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=len(self.targets) * len(LISTINGS))
+            return self._pool
+
+    def close(self):
+        """
+        Stop the federation's worker threads
+        """
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def _fan_out(self, calls, timeout):
+        """
+        :param calls: list of (key, target, resource, method, args, kwargs)
+        :return: dict key -> (target, result or None, status dict)
+        """
+        def bind(target, resource, method, args, kwargs):
+            return lambda: getattr(target.handler(resource), method)(*args, **kwargs)
+
+        targets = dict((key, target) for key, target, _, _, _, _ in calls)
+        outcome = fan_out(dict((key, bind(target, resource, method, args, kwargs))
+                               for key, target, resource, method, args, kwargs in calls), timeout,
+                          pool=self._executor())
+        return dict((key, (targets[key], result, status)) for key, (result, status) in outcome.items())
+
+    @staticmethod
+    def _tag(result, name):
+        if isinstance(result, list):
+            return [dict(item, region=name) if isinstance(item, dict) else item for item in result]
+        if isinstance(result, dict):
+            return dict(result, region=name)
+        return result
+
+    def call(self, resource, method, *args, **kwargs):
+        """
+        Run one handler method on every target
+        :param resource: image|volume|snapshot|size|node|network
+        :param method: handler method name, e.g. 'nodes'
+        :param timeout: keyword only, overrides the federation's deadline
+        :return: json {'items': [...], 'regions': {name: {'status', 'seconds', 'error', 'count'}}},
+                 list results are merged into items, each item tagged with 'region'
+        """
+        timeout = kwargs.pop('timeout', self.timeout)
+        outcome = self._fan_out([(t.name, t, resource, method, args, kwargs) for t in self.targets], timeout)
+        items, regions = [], {}
+        for target in self.targets:
+            _, result, status = outcome[target.name]
+            tagged = self._tag(result, target.name)
+            if isinstance(tagged, list):
+                items.extend(tagged)
+            elif tagged is not None:
+                items.append(tagged)
+            regions[target.name] = status
+        return encode({'items': items, 'regions': regions}, self.output)
+
+    def refresh(self, sections=None, timeout=None):
+        """
+        Every listing on every target in a single fan out
+        :param sections: subset of LISTINGS keys, all of them by default
+        :param timeout: overrides the federation's deadline
+        :return: json {section: [...tagged items], 'regions': {name: {section: status}}}
+        """
+        sections = sorted(sections or LISTINGS)
+        calls = [((section, t.name), t, LISTINGS[section][0], LISTINGS[section][1], (), {})
+                 for section in sections for t in self.targets]
+        outcome = self._fan_out(calls, self.timeout if timeout is None else timeout)
+        report = dict((section, []) for section in sections)
+        report['regions'] = dict((t.name, {}) for t in self.targets)
+        for section in sections:
+            for target in self.targets:
+                _, result, status = outcome[(section, target.name)]
+                report[section].extend(self._tag(result, target.name) or [])
+                report['regions'][target.name][section] = status
+        return encode(report, self.output)
+
+    def nodes(self, **filters):
+        return self.call('node', 'nodes', **filters)
+
+    def volumes(self, **filters):
+        return self.call('volume', 'volumes', **filters)
+
+    def snapshots(self, **filters):
+        return self.call('snapshot', 'snapshots', **filters)
+
+    def images(self, **filters):
+        return self.call('image', 'images', **filters)
+
+    def sizes(self):
+        return self.call('size', 'sizes')
+
+    def networks(self):
+        return self.call('network', 'networks')
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Filters and field projection for the list calls.
+
+Filters are sent as query parameters so the API returns only the matching
+resources: Nova filters servers by status, name (a regex), image, flavor and
+changes-since, and images by status, name and changes-since. The Cinder
+proxies ignore them, and Nova cannot filter on creation time. So every
+filter is checked again on the returned payloads, which gives the same
+result whatever the API honoured. With changes-since Nova also returns the
+servers and images deleted since then, they are dropped unless a status
+was asked for.
+
+With fields=['instanceId', 'status'] only those keys are built from the
+payload, see the API_FIELDS tables of the records module.
+"""
+import re
+
+from .records import ImageRecord, NodeRecord, SnapshotRecord, VolumeRecord
+from .timeutil import gmt_create
+
+
+def _name(payload):
+    return payload.get('name', payload.get('displayName', payload.get('display_name')))
+
+
+def _created(payload):
+    return payload.get('created', payload.get('created_at', payload.get('createdAt')))
+
+
+def _ref(key):
+    return lambda payload: (payload.get(key) or {}).get('id')
+
+
+# resource -> (listing url, response key, record class,
+#              {filter: (query parameter or None, payload accessor)})
+LISTINGS = {
+    'node': ('/servers/detail', 'servers', NodeRecord, {
+        'status': ('status', lambda payload: payload.get('status')),
+        'name': ('name', _name),
+        'image': ('image', _ref('image')),
+        'flavor': ('flavor', _ref('flavor')),
+        'created_since': ('changes-since', _created),
+    }),
+    'volume': ('/os-volumes', 'volumes', VolumeRecord, {
+        'status': ('status', lambda payload: payload.get('status')),
+        'name': ('name', _name),
+        'created_since': (None, _created),
+    }),
+    'snapshot': ('/os-snapshots', 'snapshots', SnapshotRecord, {
+        'status': ('status', lambda payload: payload.get('status')),
+        'name': ('name', _name),
+        'volume_id': ('volume_id', lambda payload: payload.get('volume_id', payload.get('volumeId'))),
+        'created_since': (None, _created),
+    }),
+    'image': ('/images/detail', 'images', ImageRecord, {
+        'status': ('status', lambda payload: payload.get('status')),
+        'name': ('name', _name),
+        'created_since': ('changes-since', _created),
+    }),
+}
+
+
+class ListFilter(object):
+    """
+    Query parameters and payload check for one filtered listing
+    """
+
+    def __init__(self, resource, fields=None, **filters):
+        """
+        :param resource: node|volume|snapshot|image
+        :param fields: output keys to build, all of them when None
+        :param filters: filter name -> value, None values are ignored
+        """
+        self.path, self.key, self.record, accessors = LISTINGS[resource]
+        unknown = set(filters) - set(accessors)
+        if unknown:
+            raise ValueError("Unknown %s filters: %s" % (resource, ', '.join(sorted(unknown))))
+        if fields is not None:
+            unknown = set(fields) - set(self.record.API_FIELDS)
+            if unknown:
+                raise ValueError("Unknown %s fields: %s" % (resource, ', '.join(sorted(unknown))))
+        self.fields = list(fields) if fields is not None else None
+        self.params = {}
+        self._checks = []
+        for name, value in sorted(filters.items()):
+            if value is None:
+                continue
+            param, accessor = accessors[name]
+            if name == 'created_since':
+                value = gmt_create(value)
+                if value is None:
+                    raise ValueError("created_since is not a date")
+                if param:
+                    self.params[param] = value.replace(' ', 'T') + 'Z'
+                self._checks.append(lambda p, a=accessor, v=value: (gmt_create(a(p)) or '') >= v)
+            elif name == 'name':
+                pattern = re.compile(value)
+                if param:
+                    self.params[param] = value
+                self._checks.append(lambda p, a=accessor, r=pattern: r.search(a(p) or '') is not None)
+            elif name == 'status':
+                if param:
+                    self.params[param] = value.upper() if resource in ('node', 'image') else value
+                self._checks.append(lambda p, a=accessor, v=value.lower(): (a(p) or '').lower() == v)
+            else:
+                if param:
+                    self.params[param] = value
+                self._checks.append(lambda p, a=accessor, v=value: a(p) == v)
+        if 'changes-since' in self.params and filters.get('status') is None:
+            status = accessors['status'][1]
+            self._checks.append(lambda p, a=status: (a(p) or '').lower() != 'deleted')
+
+    def match(self, payload):
+        for check in self._checks:
+            if not check(payload):
+                return False
+        return True
+
+    def build(self, payload):
+        """
+        :return: output dict of a matching payload
+        """
+        if self.fields is None:
+            return self.record.from_api(payload).to_dict()
+        return self.record.project(payload, self.fields)
@@ -0,0 +1,352 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Timing of handler methods, driver calls and HTTP requests.
+
+Three nested levels are recorded, each as a Call:
+
+- 'handler'  a public handler method, e.g. 'Node.create_node'
+- 'driver'   a libcloud driver method the handler used, e.g. 'get_image'
+- 'http'     one API request, named by verb and path with ids replaced,
+             e.g. 'GET /images/{id}', with status, bytes and retries
+
+Nothing is recorded until enable() is called with one or more sinks; while
+disabled every hook is a single check of the module level `sinks` tuple.
+
+    from openstack_handler import instrumentation
+    instrumentation.enable(instrumentation.stats, instrumentation.SpanSink())
+    ...
+    print(instrumentation.prometheus_text())
+"""
+import functools
+import inspect
+import json
+import random
+import re
+import threading
+import time
+from collections import deque
+
+# Prometheus' default buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_ID = re.compile(r'^([0-9a-fA-F]{8}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{4}-?[0-9a-fA-F]{12}|\d+)$')
+
+# Active sinks, empty while disabled
+sinks = ()
+_local = threading.local()
+
+
+def endpoint(method, action):
+    """
+    Metric name of a request, ids in the path are replaced by {id}
+    :param method: HTTP verb
+    :param action: request path, query string excluded
+    :return: str, e.g. 'GET /servers/{id}'
+    """
+    path = action.split('?', 1)[0]
+    return '%s /%s' % (method, '/'.join('{id}' if _ID.match(part) else part
+                                        for part in path.split('/') if part))
+
+
+class Call(object):
+    """
+    One finished handler method, driver call or HTTP request
+    """
+    __slots__ = ('kind', 'name', 'trace_id', 'span_id', 'parent_id', 'start', 'duration',
+                 'status', 'error', 'cause', 'bytes_in', 'bytes_out', 'attempts')
+
+    def __init__(self, kind, name, parent):
+        self.kind = kind
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else '%032x' % random.getrandbits(128)
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = parent.span_id if parent is not None else None
+        self.start = time.time()
+        self.duration = None
+        self.status = None
+        self.error = None
+        self.cause = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.attempts = 0
+
+
+def _describe(e):
+    return '%s: %s' % (e.__class__.__name__, e) if str(e) else e.__class__.__name__
+
+
+class _Trace(object):
+    """
+    Context manager recording one Call into every active sink
+    """
+
+    def __init__(self, kind, name):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        self.stack = stack
+        self.call = Call(kind, name, stack[-1] if stack else None)
+
+    def __enter__(self):
+        self.stack.append(self.call)
+        self._started = time.time()
+        return self.call
+
+    def __exit__(self, exc_type, exc, tb):
+        call = self.call
+        call.duration = time.time() - self._started
+        self.stack.pop()
+        if exc is not None:
+            call.error = exc.__class__.__name__
+            if call.status is None:
+                call.status = getattr(exc, 'code', None)
+            # Handler errors wrap the original exception, keep both
+            cause = exc.__cause__ or exc.__context__
+            call.cause = _describe(cause) if cause is not None else _describe(exc)
+        for sink in sinks:
+            try:
+                sink.record(call)
+            except Exception:
+                pass
+        return False
+
+
+def current():
+    """
+    :return: innermost Call in progress on this thread, or None
+    """
+    stack = getattr(_local, 'stack', None)
+    return stack[-1] if stack else None
+
+
+def enable(*new_sinks):
+    """
+    Start recording
+    :param new_sinks: objects with a record(call) method, defaults to `stats`
+    """
+    global sinks
+    sinks = tuple(new_sinks) or (stats,)
+
+
+def disable():
+    global sinks
+    sinks = ()
+
+
+def trace_driver(name, func):
+    """
+    Wrap a bound driver method so calls are recorded as 'driver' Calls
+    """
+    @functools.wraps(func)
+    def traced(*args, **kwargs):
+        if not sinks:
+            return func(*args, **kwargs)
+        with _Trace('driver', name):
+            return func(*args, **kwargs)
+    return traced
+
+
+def _trace_method(qualname, func):
+    @functools.wraps(func)
+    def traced(*args, **kwargs):
+        if not sinks:
+            return func(*args, **kwargs)
+        with _Trace('handler', qualname):
+            return func(*args, **kwargs)
+    return traced
+
+
+def instrumented(cls):
+    """
+    Class decorator recording every public method as a 'handler' Call.
+    Generators (iter_*) are left alone, their requests are still recorded.
+    """
+    for name, value in list(vars(cls).items()):
+        if name.startswith('_') or not inspect.isfunction(value) or inspect.isgeneratorfunction(value):
+            continue
+        setattr(cls, name, _trace_method('%s.%s' % (cls.__name__, name), value))
+    return cls
+
+
+def _body_size(data):
+    if data is None:
+        return 0
+    if isinstance(data, (dict, list)):
+        return len(json.dumps(data))
+    return len(data)
+
+
+def install(connection):
+    """
+    Hook a libcloud connection so its requests are recorded as 'http' Calls
+    :param connection: driver.connection
+    """
+    request = connection.request
+    retryable = connection._retryable_request
+
+    def traced_request(action, *args, **kwargs):
+        if not sinks:
+            return request(action, *args, **kwargs)
+        method = kwargs.get('method', args[3] if len(args) > 3 else 'GET')
+        data = kwargs.get('data', args[1] if len(args) > 1 else None)
+        with _Trace('http', endpoint(method, action)) as call:
+            call.bytes_out = _body_size(data)
+            response = request(action, *args, **kwargs)
+            call.status = getattr(response, 'status', None)
+            call.bytes_in = len(getattr(response, 'body', None) or '')
+            return response
+
+    def traced_retryable(*args, **kwargs):
+        call = current()
+        if call is not None and call.kind == 'http':
+            call.attempts += 1
+        return retryable(*args, **kwargs)
+
+    connection.request = traced_request
+    connection._retryable_request = traced_retryable
+
+
+class _Series(object):
+    __slots__ = ('count', 'errors', 'total', 'buckets', 'bytes_in', 'bytes_out', 'retries', 'causes')
+
+    def __init__(self, size):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.buckets = [0] * size
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.retries = 0
+        self.causes = {}
+
+
+class Stats(object):
+    """
+    In-process sink: counts, latency histogram, bytes, retries and errors
+    per (kind, name)
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def record(self, call):
+        with self._lock:
+            series = self._series.get((call.kind, call.name))
+            if series is None:
+                series = self._series[(call.kind, call.name)] = _Series(len(self.buckets))
+            series.count += 1
+            series.total += call.duration
+            for i, bound in enumerate(self.buckets):
+                if call.duration <= bound:
+                    series.buckets[i] += 1
+                    break
+            series.bytes_in += call.bytes_in
+            series.bytes_out += call.bytes_out
+            # The first attempt is not a retry
+            series.retries += max(call.attempts - 1, 0)
+            if call.error is not None:
+                series.errors += 1
+                series.causes[call.cause] = series.causes.get(call.cause, 0) + 1
+
+    def snapshot(self):
+        """
+        :return: dict kind -> name -> {'count', 'errors', 'sum', 'buckets' (cumulative,
+                 keyed by upper bound), 'bytesIn', 'bytesOut', 'retries', 'causes'}
+        """
+        result = {}
+        with self._lock:
+            for (kind, name), series in self._series.items():
+                cumulative, buckets = 0, {}
+                for bound, count in zip(self.buckets, series.buckets):
+                    cumulative += count
+                    buckets[bound] = cumulative
+                result.setdefault(kind, {})[name] = {
+                    'count': series.count, 'errors': series.errors, 'sum': series.total,
+                    'buckets': buckets, 'bytesIn': series.bytes_in, 'bytesOut': series.bytes_out,
+                    'retries': series.retries, 'causes': dict(series.causes)}
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._series = {}
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def prometheus_text(source=None, prefix='openstack_handler'):
+    """
+    Render a Stats sink in the Prometheus text exposition format
+    :param source: Stats, defaults to `stats`
+    :param prefix: metric name prefix
+    :return: str
+    """
+    snapshot = (source or stats).snapshot()
+    lines = ['# HELP %s_duration_seconds Latency of handler methods, driver calls and requests' % prefix,
+             '# TYPE %s_duration_seconds histogram' % prefix]
+    counters = {'errors': [], 'retries': [], 'bytes': []}
+    for kind in sorted(snapshot):
+        for name in sorted(snapshot[kind]):
+            series = snapshot[kind][name]
+            labels = 'kind="%s",name="%s"' % (_label(kind), _label(name))
+            for bound, count in sorted(series['buckets'].items()):
+                lines.append('%s_duration_seconds_bucket{%s,le="%s"} %d' % (prefix, labels, bound, count))
+            lines.append('%s_duration_seconds_bucket{%s,le="+Inf"} %d' % (prefix, labels, series['count']))
+            lines.append('%s_duration_seconds_sum{%s} %.6f' % (prefix, labels, series['sum']))
+            lines.append('%s_duration_seconds_count{%s} %d' % (prefix, labels, series['count']))
+            counters['errors'].append('%s_errors_total{%s} %d' % (prefix, labels, series['errors']))
+            counters['retries'].append('%s_retries_total{%s} %d' % (prefix, labels, series['retries']))
+            counters['bytes'].append('%s_bytes_total{%s,direction="in"} %d' % (prefix, labels, series['bytesIn']))
+            counters['bytes'].append('%s_bytes_total{%s,direction="out"} %d' % (prefix, labels, series['bytesOut']))
+    for name, help_text in (('errors', 'Failed calls'), ('retries', 'Request retries'),
+                            ('bytes', 'Request and response body bytes')):
+        lines.append('# HELP %s_%s_total %s' % (prefix, name, help_text))
+        lines.append('# TYPE %s_%s_total counter' % (prefix, name))
+        lines.extend(counters[name])
+    return '\n'.join(lines) + '\n'
+
+
+class SpanSink(object):
+    """
+    OpenTelemetry-style spans: dicts with trace/span/parent ids, start/end
+    times in ns, attributes, status and an exception event on errors
+    """
+
+    def __init__(self, export=None, maxlen=10000):
+        """
+        :param export: callable(span) receiving every finished span, when None the
+                       spans are kept in self.spans (the last maxlen of them)
+        :param maxlen:
+        """
+        self.export = export
+        self.spans = deque(maxlen=maxlen)
+
+    def record(self, call):
+        start = int(call.start * 1e9)
+        attributes = {'openstack.kind': call.kind}
+        if call.kind == 'http':
+            method, _, route = call.name.partition(' ')
+            attributes.update({'http.method': method, 'http.route': route,
+                               'http.status_code': call.status, 'http.request_content_length': call.bytes_out,
+                               'http.response_content_length': call.bytes_in,
+                               'http.retry_count': max(call.attempts - 1, 0)})
+        span = {'name': call.name, 'trace_id': call.trace_id, 'span_id': call.span_id,
+                'parent_span_id': call.parent_id, 'kind': 'CLIENT' if call.kind == 'http' else 'INTERNAL',
+                'start_time_unix_nano': start, 'end_time_unix_nano': start + int(call.duration * 1e9),
+                'attributes': attributes,
+                'status': {'status_code': 'ERROR' if call.error else 'OK', 'description': call.cause},
+                'events': []}
+        if call.error:
+            span['events'].append({'name': 'exception', 'attributes': {
+                'exception.type': call.error, 'exception.message': call.cause}})
+        if self.export is not None:
+            self.export(span)
+        else:
+            self.spans.append(span)
+
+
+stats = Stats()
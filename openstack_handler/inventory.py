@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Local inventory of nodes, volumes and snapshots.
+
+The first sync of a resource type pages through the full listing, later
+node syncs only ask for what changed since the previous one (changes-since),
+and a full listing runs again every full_interval seconds so objects deleted
+behind our back disappear. Nova's volume and snapshot proxies ignore
+changes-since, so those are always synced with a full listing that replaces
+the previous one. Queries are answered from memory through
+secondary indexes, the optional SQLite file keeps the inventory across
+restarts so a new process starts with deltas instead of a full listing.
+"""
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+
+from .instrumentation import instrumented
+from .openstack_handler import OpenStackHandler
+from .records import NodeRecord, SnapshotRecord, VolumeRecord
+from .resilience import failure
+
+
+def _node_keys(item, record):
+    return {'status': [record.status], 'image': [record.image_id], 'flavor': [record.flavor_id],
+            'network': list(item.get('addresses') or {})}
+
+
+def _volume_keys(item, record):
+    return {'status': [record.status]}
+
+
+def _snapshot_keys(item, record):
+    return {'status': [record.status], 'volume': [record.volume_id]}
+
+
+# resource -> (listing url, response key, record type, index keys, honours changes-since)
+RESOURCES = {
+    'node': ('/servers/detail', 'servers', NodeRecord, _node_keys, True),
+    'volume': ('/os-volumes', 'volumes', VolumeRecord, _volume_keys, False),
+    'snapshot': ('/os-snapshots', 'snapshots', SnapshotRecord, _snapshot_keys, False),
+}
+
+# resource -> {query filter name: index field}
+FILTERS = {
+    'node': {'status': 'status', 'image': 'image', 'flavor': 'flavor', 'network': 'network'},
+    'volume': {'status': 'status'},
+    'snapshot': {'status': 'status', 'volume_id': 'volume'},
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS inventory (
+    scope TEXT, resource TEXT, id TEXT, data TEXT, keys TEXT,
+    PRIMARY KEY (scope, resource, id));
+CREATE TABLE IF NOT EXISTS inventory_sync (
+    scope TEXT, resource TEXT, since TEXT, full REAL,
+    PRIMARY KEY (scope, resource));
+"""
+
+
+def _norm(value):
+    return value.lower() if isinstance(value, str) else value
+
+
+class _Table(object):
+    """
+    Objects of one resource type plus their secondary indexes
+    """
+
+    def __init__(self, fields):
+        self.fields = frozenset(fields)
+        self.items = {}
+        self.keys = {}
+        self.indexes = {}
+        self.since = None
+        self.full = 0
+        self.synced = 0
+
+    def put(self, obj_id, item, keys):
+        self.remove(obj_id)
+        self.items[obj_id] = item
+        self.keys[obj_id] = keys
+        for field, values in keys.items():
+            index = self.indexes.setdefault(field, {})
+            for value in values:
+                index.setdefault(_norm(value), set()).add(obj_id)
+
+    def remove(self, obj_id):
+        keys = self.keys.pop(obj_id, None)
+        self.items.pop(obj_id, None)
+        for field, values in (keys or {}).items():
+            index = self.indexes[field]
+            for value in values:
+                ids = index.get(_norm(value))
+                if ids is not None:
+                    ids.discard(obj_id)
+                    if not ids:
+                        del index[_norm(value)]
+
+    def clear(self):
+        self.items, self.keys, self.indexes = {}, {}, {}
+
+    def select(self, **filters):
+        unknown = set(filters) - self.fields
+        if unknown:
+            raise ValueError('Unknown index %s' % ', '.join(sorted(unknown)))
+        ids = None
+        for field, value in filters.items():
+            if value is None:
+                continue
+            matched = self.indexes.get(field, {}).get(_norm(value), set())
+            ids = set(matched) if ids is None else ids & matched
+        if ids is None:
+            return list(self.items.values())
+        return [self.items[obj_id] for obj_id in ids]
+
+
+@instrumented
+class Inventory(OpenStackHandler):
+    """
+    Locally indexed snapshot of a tenant's nodes, volumes and snapshots
+    """
+
+    # Allow for clock skew between us and the API when asking for deltas
+    SKEW = 60
+
+    def __init__(self, username, password, tenant, url, api, path=None, min_interval=5,
+                 full_interval=600, page_size=1000, **kwargs):
+        """
+        :param path: SQLite file keeping the inventory across restarts, None for memory only
+        :param min_interval: min seconds between two syncs of a resource, reads
+                             within that window are served without any request
+        :param full_interval: seconds between two full node listings
+        :param page_size: items per listing request
+        """
+        super(Inventory, self).__init__(username, password, tenant, url, api, **kwargs)
+        self.path = path
+        self.min_interval = min_interval
+        self.full_interval = full_interval
+        self.page_size = page_size
+        # Regions of one Keystone share the file but not their rows
+        self.scope = '%s@%s' % (tenant, url)
+        if self.region is not None:
+            self.scope += '/%s' % self.region
+        self._lock = threading.RLock()
+        self._tables = dict((resource, _Table(FILTERS[resource].values()))
+                            for resource in RESOURCES)
+        self._db = None
+        if path is not None:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.executescript(_SCHEMA)
+            self._load()
+
+    def _load(self):
+        for resource, table in self._tables.items():
+            for obj_id, data, keys in self._db.execute(
+                    'SELECT id, data, keys FROM inventory WHERE scope = ? AND resource = ?',
+                    (self.scope, resource)):
+                table.put(obj_id, json.loads(data), json.loads(keys))
+            row = self._db.execute('SELECT since, full FROM inventory_sync WHERE scope = ? AND resource = ?',
+                                   (self.scope, resource)).fetchone()
+            if row is not None:
+                table.since, table.full = row
+
+    def _store(self, resource, table, changed, removed, full):
+        if self._db is None:
+            return
+        with self._db:
+            if full:
+                self._db.execute('DELETE FROM inventory WHERE scope = ? AND resource = ?',
+                                 (self.scope, resource))
+            self._db.executemany('DELETE FROM inventory WHERE scope = ? AND resource = ? AND id = ?',
+                                 [(self.scope, resource, obj_id) for obj_id in removed])
+            self._db.executemany('INSERT OR REPLACE INTO inventory VALUES (?, ?, ?, ?, ?)',
+                                 [(self.scope, resource, obj_id, json.dumps(table.items[obj_id]),
+                                   json.dumps(table.keys[obj_id])) for obj_id in changed])
+            self._db.execute('INSERT OR REPLACE INTO inventory_sync VALUES (?, ?, ?, ?)',
+                             (self.scope, resource, table.since, table.full))
+
+    def sync(self, resource=None, force=False):
+        """
+        Bring the inventory up to date
+        :param resource: node|volume|snapshot, None for all of them
+        :param force: ignore min_interval
+        :return: dict resource -> number of objects fetched, skipped resources excluded
+        """
+        fetched = {}
+        for name in [resource] if resource else sorted(RESOURCES):
+            count = self._sync(name, force)
+            if count is not None:
+                fetched[name] = count
+        return fetched
+
+    def _sync(self, resource, force):
+        path, key, record_cls, index_keys, deltas = RESOURCES[resource]
+        table = self._tables[resource]
+        with self._lock:
+            now = time.time()
+            if not force and now - table.synced < self.min_interval:
+                return None
+            full = not deltas or table.since is None or now - table.full > self.full_interval
+            started = (datetime.utcnow() - timedelta(seconds=self.SKEW)).strftime('%Y-%m-%dT%H:%M:%SZ')
+            params = {} if full else {'changes-since': table.since}
+            try:
+                items = list(self._iter_pages(path, key, self.page_size, params))
+            except Exception:
+                raise failure("Failed to sync %ss" % resource)
+            changed, removed = [], []
+            if full:
+                table.clear()
+                table.full = now
+            for item in items:
+                if str(item.get('status')).lower() == 'deleted':
+                    table.remove(item['id'])
+                    removed.append(item['id'])
+                    continue
+                record = record_cls.from_api(item)
+                table.put(record.id, record.to_dict(), index_keys(item, record))
+                changed.append(record.id)
+            table.since = started
+            table.synced = now
+            self._store(resource, table, changed, removed, full)
+            return len(items)
+
+    def _select(self, resource, **filters):
+        names = FILTERS.get(resource)
+        if names is None:
+            raise ValueError('Unknown resource %s' % resource)
+        unknown = set(filters) - set(names)
+        if unknown:
+            raise ValueError('Unknown %s filter %s' % (resource, ', '.join(sorted(unknown))))
+        fields = dict((names[name], value) for name, value in filters.items())
+        self._sync(resource, False)
+        with self._lock:
+            return self._tables[resource].select(**fields)
+
+    def nodes(self, status=None, image=None, flavor=None, network=None):
+        """
+        Nodes matching every given filter
+        :param status: vm state, e.g. active|error
+        :param image: image id
+        :param flavor: flavor id
+        :param network: network label as in the server addresses
+        :return: json list of nodes, same dicts as Node.nodes()
+        """
+        return self._dump(self._select('node', status=status, image=image, flavor=flavor,
+                                       network=network))
+
+    def volumes(self, status=None):
+        """
+        Volumes matching every given filter
+        :param status: e.g. available|inuse|error
+        :return: json list of volumes, same dicts as Volume.volumes()
+        """
+        return self._dump(self._select('volume', status=status))
+
+    def snapshots(self, status=None, volume_id=None):
+        """
+        Snapshots matching every given filter
+        :param status:
+        :param volume_id:
+        :return: json list of snapshots, same dicts as Snapshot.snapshots()
+        """
+        return self._dump(self._select('snapshot', status=status, volume_id=volume_id))
+
+    def count(self, resource, **filters):
+        """
+        :param resource: node|volume|snapshot
+        :param filters: see nodes()/volumes()/snapshots(), an unknown name raises ValueError
+        :return: number of matching objects
+        """
+        return len(self._select(resource, **filters))
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
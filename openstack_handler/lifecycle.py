@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Policy driven snapshot creation and pruning for a whole tenant.
+
+The plan comes from one listing of the volumes and one of the snapshots,
+however many volumes are covered, and nothing is fetched again per volume
+or per snapshot. It is then run on the shared worker pool with at most
+`concurrency` requests in flight. The steps of one volume run in order:
+its new snapshot is created first and waited for, and only then are the
+snapshots it replaces deleted. A failed creation leaves the volume's old
+snapshots alone.
+
+    policy = RetentionPolicy(keep_last=3, daily=7, weekly=4, interval=20 * 3600)
+    snapshot.lifecycle(policy)
+
+Only snapshots whose name starts with the policy's prefix are ever deleted.
+"""
+import threading
+import time
+from datetime import datetime
+
+from .bulk import executor
+from .ratelimit import priority
+from .records import SnapshotRecord, VolumeRecord
+from .waiter import WaitTimeout
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class RetentionPolicy(object):
+    """
+    Which snapshots of a volume to keep, and when to take a new one
+    """
+
+    def __init__(self, keep_last=None, daily=None, weekly=None, prefix='auto-', interval=None):
+        """
+        :param keep_last: keep the N newest snapshots
+        :param daily: keep the newest snapshot of each of the last N days having one
+        :param weekly: keep the newest snapshot of each of the last N ISO weeks having one
+        :param prefix: name prefix of the snapshots managed by the policy
+        :param interval: only create a snapshot when the newest one is older than
+                         this many seconds, None to always create one
+        """
+        if not (keep_last or daily or weekly):
+            raise ValueError("A retention policy must keep something")
+        self.keep_last = keep_last or 0
+        self.daily = daily or 0
+        self.weekly = weekly or 0
+        self.prefix = prefix
+        self.interval = interval
+
+    def manages(self, snapshot):
+        return (snapshot.name or '').startswith(self.prefix)
+
+    def name(self, now):
+        return '%s%s' % (self.prefix, now.strftime('%Y%m%d-%H%M%S'))
+
+    def needs_snapshot(self, snapshots, now):
+        """
+        :param snapshots: available managed snapshots of one volume, newest first
+        """
+        if self.interval is None or not snapshots or not snapshots[0].gmt_create:
+            return True
+        newest = datetime.strptime(snapshots[0].gmt_create, '%Y-%m-%d %H:%M:%S')
+        return (now - newest).total_seconds() >= self.interval
+
+    def keep(self, snapshots):
+        """
+        :param snapshots: available managed snapshots of one volume, newest first
+        :return: set of the ids to keep
+        """
+        kept = set(s.id for s in snapshots[:self.keep_last])
+        for count, period in ((self.daily, _day), (self.weekly, _week)):
+            seen = set()
+            for snapshot in snapshots:
+                if len(seen) >= count:
+                    break
+                key = period(snapshot.gmt_create)
+                if key not in seen:
+                    seen.add(key)
+                    kept.add(snapshot.id)
+        return kept
+
+
+def _day(gmt):
+    return (gmt or '')[:10]
+
+
+def _week(gmt):
+    if not gmt:
+        return None
+    return datetime.strptime(gmt[:10], '%Y-%m-%d').isocalendar()[:2]
+
+
+class _Pending(object):
+    """
+    Snapshot taken in this run, newest of its volume
+    """
+    __slots__ = ('id', 'name', 'gmt_create')
+
+    def __init__(self, name, gmt_create):
+        self.id = None
+        self.name = name
+        self.gmt_create = gmt_create
+
+
+class _VolumePlan(object):
+    """
+    Ordered steps of one volume
+    """
+
+    def __init__(self, volume_id, create, delete):
+        self.volume_id = volume_id
+        self.create = create
+        self.delete = delete
+        self.snapshot_id = None
+        self.created = False
+        self.deleted = []
+        self.failures = []
+
+    def to_dict(self):
+        return {'volumeId': self.volume_id, 'create': self.create, 'delete': self.delete}
+
+
+class Lifecycle(object):
+    """
+    Plans and runs the snapshots of a tenant for a Snapshot handler
+    """
+
+    def __init__(self, handler, policy, concurrency=8, timeout=600, force=True, page_size=1000):
+        """
+        :param handler: Snapshot handler
+        :param policy: RetentionPolicy, or callable(VolumeRecord) -> RetentionPolicy or None
+        :param concurrency: requests in flight
+        :param timeout: seconds to wait for a volume's new snapshot, counted from its submission,
+                        before giving up on the volume
+        :param force: snapshot in-use volumes too
+        :param page_size: items per listing request
+        """
+        self.handler = handler
+        self.policy = policy if callable(policy) else (lambda volume: policy)
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self.force = force
+        self.page_size = page_size
+
+    def plan(self, volume_ids=None, now=None):
+        """
+        :param volume_ids: volumes to cover, every volume of the tenant by default
+        :param now: naive UTC datetime the plan is made for
+        :return: list of _VolumePlan
+        """
+        now = now or datetime.utcnow()
+        wanted = set(volume_ids) if volume_ids is not None else None
+        volumes = [VolumeRecord.from_api(item) for item in
+                   self.handler._iter_pages('/os-volumes', 'volumes', self.page_size)]
+        by_volume = {}
+        for item in self.handler._iter_pages('/os-snapshots', 'snapshots', self.page_size):
+            snapshot = SnapshotRecord.from_api(item)
+            by_volume.setdefault(snapshot.volume_id, []).append(snapshot)
+
+        plans = []
+        for volume in volumes:
+            if wanted is not None and volume.id not in wanted:
+                continue
+            policy = self.policy(volume)
+            if policy is None:
+                continue
+            managed = sorted((s for s in by_volume.get(volume.id, []) if policy.manages(s)),
+                             key=lambda s: s.gmt_create or '', reverse=True)
+            available = [s for s in managed if s.status == 'available']
+            create = None
+            if volume.status in ('available', 'inuse') and policy.needs_snapshot(available, now):
+                create = policy.name(now)
+                available.insert(0, _Pending(create, now.strftime('%Y-%m-%d %H:%M:%S')))
+            kept = policy.keep(available)
+            # Failed snapshots are garbage, the ones still being created or deleted are left alone
+            delete = [s.id for s in managed
+                      if (s.status == 'available' and s.id not in kept) or s.status == 'error']
+            if create or delete:
+                plans.append(_VolumePlan(volume.id, create, delete))
+        return plans
+
+    def run(self, volume_ids=None, dry_run=False):
+        """
+        :return: report dict {'planned', 'created', 'deleted', 'failures', 'seconds', 'throughput'}
+        """
+        started = time.time()
+        plans = self.plan(volume_ids)
+        planned = time.time()
+        report = {'planned': {'volumes': len(plans),
+                              'create': sum(1 for p in plans if p.create),
+                              'delete': sum(len(p.delete) for p in plans)}}
+        if dry_run:
+            report['plan'] = [p.to_dict() for p in plans]
+            report['seconds'] = {'plan': round(planned - started, 3)}
+            return report
+
+        self._execute(plans)
+        finished = time.time()
+        operations = sum(int(p.created) + len(p.deleted) for p in plans)
+        report.update({
+            'created': sum(1 for p in plans if p.created),
+            'deleted': sum(len(p.deleted) for p in plans),
+            'failures': [dict(failure, volumeId=p.volume_id) for p in plans for failure in p.failures],
+            'seconds': {'plan': round(planned - started, 3), 'run': round(finished - planned, 3),
+                        'total': round(finished - started, 3)},
+            'throughput': round(operations / (finished - planned), 2) if finished > planned else None,
+        })
+        return report
+
+    def _execute(self, plans):
+        """
+        Feed the steps of every volume to the worker pool, each volume's next
+        step is queued when the previous one is done. Each step of a volume
+        gets its own deadline, counted from its submission, so volumes queued
+        behind `concurrency` others are not timed out before they start.
+        """
+        steps = queue.Queue()
+        slots = threading.BoundedSemaphore(max(1, self.concurrency))
+        for plan in plans:
+            steps.put((plan, 'create' if plan.create else 'delete'))
+        pending = set(plans)
+        deadlines = {}
+        while pending:
+            wait = max(0, min(deadlines.values()) - time.time()) if deadlines else None
+            try:
+                plan, step = steps.get(timeout=wait)
+            except queue.Empty:
+                now = time.time()
+                for plan in [p for p, deadline in deadlines.items() if deadline <= now]:
+                    del deadlines[plan]
+                    pending.discard(plan)
+                    plan.failures.append({'operation': 'delete' if plan.created else 'create',
+                                          'snapshotId': plan.snapshot_id, 'error': 'timeout'})
+                continue
+            if plan not in pending:
+                # Reported after its deadline, already counted as a timeout
+                continue
+            if step is None:
+                pending.discard(plan)
+                deadlines.pop(plan, None)
+                continue
+            slots.acquire()
+            deadlines[plan] = time.time() + self.timeout + 60
+            executor().submit(self._step, plan, step, slots, steps)
+
+    def _step(self, plan, step, slots, steps):
+        try:
+            with priority('bulk'):
+                if step == 'create':
+                    self._create(plan, steps)
+                    return
+                self._delete(plan)
+            steps.put((plan, None))
+        except Exception as e:
+            plan.failures.append({'operation': step, 'snapshotId': plan.snapshot_id,
+                                  'error': str(e) or e.__class__.__name__})
+            steps.put((plan, None))
+        finally:
+            slots.release()
+
+    def _create(self, plan, steps):
+        data = {'snapshot': {'volume_id': plan.volume_id, 'display_name': plan.create,
+                             'display_description': plan.create, 'force': self.force}}
+        response = self.handler.driver.connection.request('/os-snapshots', method='POST', data=data)
+        snapshot = self.handler.driver._to_snapshot(response.object)
+        plan.snapshot_id = snapshot.id
+
+        def ready(snapshot_id, result):
+            if isinstance(result, Exception) or result != 'available':
+                error = 'timeout' if isinstance(result, WaitTimeout) else \
+                    (str(result) if isinstance(result, Exception) else 'snapshot is %s' % result)
+                plan.failures.append({'operation': 'create', 'snapshotId': snapshot_id, 'error': error})
+                steps.put((plan, None))
+                return
+            plan.created = True
+            steps.put((plan, 'delete' if plan.delete else None))
+        self.handler.watch([snapshot.id], 'available', self.timeout, callback=ready)
+
+    def _delete(self, plan):
+        for snapshot_id in plan.delete:
+            try:
+                self.handler.driver.connection.request('/os-snapshots/%s' % snapshot_id, method='DELETE')
+            except Exception as e:
+                plan.failures.append({'operation': 'delete', 'snapshotId': snapshot_id,
+                                      'error': str(e) or e.__class__.__name__})
+                continue
+            plan.deleted.append(snapshot_id)
@@ -1,10 +1,46 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import json
-from datetime import time, datetime
+try:
+    from urllib.parse import parse_qsl, urlparse
+except ImportError:
+    from urlparse import parse_qsl, urlparse
 
-from libcloud.compute.types import Provider
-from libcloud.compute.providers import get_driver
+from .bulk import run_bulk
+from .cache import catalog_cache, node_cache
+from .filters import ListFilter
+from .instrumentation import instrumented
+from .lifecycle import Lifecycle
+from .placement import flavor_index, image_index
+from .provision import Provisioner
+from .records import ImageRecord, NodeRecord, SnapshotRecord, VolumeRecord, size_from_api
+from .registry import registry
+from .resilience import failure
+from .serializers import (check_output, encode, image_to_dict, network_to_dict, node_to_dict,
+                          size_to_dict, snapshot_to_dict, updated_node_to_dict, volume_to_dict)
+from .singleflight import coalesced
+from .waiter import get_waiter, wait_all
+
+# Driver methods fetching a single object by id
+_GETTERS = {'snapshot': 'ex_get_snapshot', 'network': 'ex_get_network'}
+
+# Pending volumes/snapshots fetched one by one when polling, more cost one listing
+DIRECT_POLL = 5
+
+# Listings for which Nova sends a next link with every full page
+LINKED = ('/servers/detail', '/flavors/detail', '/images/detail')
+
+# Nova's Cinder proxies page by offset and ignore the marker
+OFFSET_PAGED = ('/os-volumes', '/os-snapshots')
+
+
+def _next_params(links):
+    """
+    Query parameters of the rel=next link of a listing, None on the last page
+    """
+    for link in links or []:
+        if link.get('rel') == 'next' and link.get('href'):
+            return dict(parse_qsl(urlparse(link['href']).query))
+    return None
 
 
 class OpenStackHandler(object):
@@ -12,61 +48,242 @@ class OpenStackHandler(object):
     Operate OpenStack
     """
 
-    def __init__(self, username, password, tenant, url, api):
+    def __init__(self, username, password, tenant, url, api, output='json', region=None):
+        """
+        :param output: result format, see serializers.FORMATS, an unknown one raises ValueError
+        :param region: service region, None for the catalog's default
+        """
+        check_output(output)
         self.username = username
         self.password = password
         self.tenant = tenant
         self.url = url
         self.api = api
-        self.OpenStack = None
+        self.output = output
+        self.region = region
         self.driver = None
         self.init_connection()
 
+    @property
+    def OpenStack(self):
+        # libcloud is imported on first use rather than with the package
+        return registry.driver_cls
+
     def init_connection(self):
+        """
+        Get the shared driver, nothing is imported or sent to OpenStack until it is first used
+        """
         try:
-            self.OpenStack = get_driver(Provider.OPENSTACK)
-            self.driver = self.OpenStack(self.username, self.password,
-                                         ex_tenant_name=self.tenant,
-                                         ex_force_auth_url=self.url,
-                                         ex_force_auth_version=self.api)
+            self.driver = registry.acquire(self.username, self.password, self.tenant,
+                                           self.url, self.api, region=self.region)
         except:
-            raise Exception("Failed to connect to OpenStack")
+            raise failure("Failed to connect to OpenStack")
+
+    def _dump(self, obj):
+        return encode(obj, self.output)
+
+    def _cached(self, resource, key, loader):
+        """
+        Catalog lookup through the shared cache
+        :param resource: image|flavor|network|volume
+        :param key: object id, None for the listing
+        :param loader: callable fetching the value
+        :return:
+        """
+        return catalog_cache.get_or_load(self.driver.key, resource, key, loader)
+
+    def _invalidate(self, resource, key=None):
+        catalog_cache.invalidate(self.driver.key, resource, key)
+
+    def _iter_pages(self, path, key, page_size, params=None):
+        """
+        Iterate a listing following the OpenStack pagination, holding a single
+        page in memory at a time. Servers, flavors and images follow the next
+        links, the volume and snapshot proxies are paged by offset, other
+        listings by marker. Nova caps the limit at its osapi_max_limit, so
+        without next links only an empty page ends the listing
+        :param path: listing url
+        :param key: response key of the items
+        :param page_size: items per request
+        :param params: extra query parameters
+        :return: generator of API payload dicts
+        """
+        params = dict(params or {})
+        params['limit'] = page_size
+        previous = ()
+        while True:
+            response = self.driver.connection.request(path, params=params).object
+            items = response.get(key) or []
+            # An API ignoring the marker answers the same page again
+            if not items or items[0]['id'] in previous:
+                break
+            for item in items:
+                yield item
+            if path in LINKED:
+                following = _next_params(response.get(key + '_links'))
+                if following is None:
+                    break
+                params.update(following)
+            elif path in OFFSET_PAGED:
+                params['offset'] = params.get('offset', 0) + len(items)
+            else:
+                params['marker'] = items[-1]['id']
+            previous = set(item['id'] for item in items)
+
+    def _pending_states(self, path, key, single, ids):
+        """
+        States of the volumes or snapshots a waiter polls for. Nova's Cinder
+        proxies ignore changes-since and status filters, so a few pending ids
+        are fetched directly and only larger sets pay for a full listing
+        :param path: /os-volumes|/os-snapshots
+        :param key: response key of the listing
+        :param single: response key of one object
+        :param ids: pending ids
+        :return: dict id -> status, ids that no longer exist left out
+        """
+        if len(ids) <= DIRECT_POLL:
+            states = {}
+            for obj_id in ids:
+                try:
+                    item = self.driver.connection.request('%s/%s' % (path, obj_id)).object.get(single) or {}
+                except Exception as e:
+                    if getattr(e, 'code', None) == 404:
+                        continue
+                    raise
+                states[obj_id] = item.get('status')
+            return states
+        wanted = set(ids)
+        return dict((item['id'], item['status']) for item in self._iter_pages(path, key, 1000)
+                    if item['id'] in wanted)
+
+    def _flavors(self):
+        """
+        Cached flavor listing, built from /flavors/detail without libcloud's pricing lookups
+        :return: list of NodeSize
+        """
+        def load():
+            driver = self.driver
+            return [size_from_api(driver, flavor) for flavor in self._iter_pages('/flavors/detail', 'flavors', 1000)]
+        return self._cached('flavor', None, load)
+
+    def _size(self, size_id):
+        """
+        NodeSize from the cached listing when there is one, with a single GET otherwise
+        """
+        def load():
+            for size in catalog_cache.get(self.driver.key, 'flavor') or ():
+                if size.id == size_id:
+                    return size
+            response = self.driver.connection.request('/flavors/%s' % size_id)
+            return size_from_api(self.driver, response.object['flavor'])
+        return self._cached('flavor', size_id, load)
+
+    @staticmethod
+    def _list_filter(resource, fields, **filters):
+        """
+        :return: ListFilter, None when neither filters nor fields are given
+        """
+        if fields is None and all(value is None for value in filters.values()):
+            return None
+        return ListFilter(resource, fields, **filters)
+
+    def _filtered(self, query, page_size=1000):
+        """
+        Filtered listing built straight from the API payloads
+        :param query: ListFilter
+        :return: list of dicts
+        """
+        return [query.build(item) for item in self._iter_pages(query.path, query.key, page_size, query.params)
+                if query.match(item)]
+
+    def _get_by_id(self, resource, obj_id):
+        """
+        Fetch one object by id with a direct GET
+        :param resource: snapshot|network
+        :param obj_id:
+        :return: object or None
+        """
+        getter = getattr(self.driver, _GETTERS[resource])
+        try:
+            return getter(obj_id)
+        except Exception as e:
+            # libcloud's BaseHTTPError, matched by its code to keep libcloud out of the import
+            if getattr(e, 'code', None) == 404:
+                return None
+            raise
 
 
+@instrumented
 class Image(OpenStackHandler):
     """
     Operate Image
     """
 
-    def __init__(self, username, password, tenant, url, api):
-        super(Image, self).__init__(username, password, tenant, url, api)
+    def __init__(self, username, password, tenant, url, api, **kwargs):
+        super(Image, self).__init__(username, password, tenant, url, api, **kwargs)
 
-    def images(self):
+    @coalesced
+    def images(self, status=None, name=None, created_since=None, fields=None):
         """
         List all images
+        :param status: only filtered listings, ACTIVE by default like the unfiltered one
+        :param name: regex the name must match
+        :param created_since: datetime or ISO-8601 string
+        :param fields: output keys to return, e.g. ['imageId', 'name']
         :return: json images
         """
+        query = None
+        if not (fields is None and status is None and name is None and created_since is None):
+            # Like the unfiltered listing, only active images unless asked otherwise
+            query = ListFilter('image', fields, status=status or 'ACTIVE', name=name,
+                               created_since=created_since)
         try:
-            images = self.driver.list_images()
+            if query is not None:
+                return self._dump(self._filtered(query))
+            images = self._cached('image', None, self.driver.list_images)
             if images is not None:
                 _images = []
                 for image in images:
-                    create = image.extra.get('created')
-                    if create is not None:
-                        gmtCreate = str(datetime.strptime(
-                            create.replace("T", " ").replace("Z", ""),
-                            "%Y-%m-%d %H:%M:%S"))
-                    else:
-                        gmtCreate = None
-                    d = {'imageId': image.id, 'name': image.name, 'uuid': image.uuid,
-                         'status': image.extra.get('status'),
-                         'gmtCreate': gmtCreate}
-                    _images.append(d)
-                return json.dumps(_images)
+                    _images.append(image_to_dict(image))
+                return self._dump(_images)
             else:
                 return None
         except:
-            raise Exception("Failed to list images")
+            raise failure("Failed to list images")
+
+    def image_index(self):
+        """
+        Index of the cached image listing, rebuilt when the listing is refreshed
+        :return: placement.ImageIndex of NodeImage
+        """
+        try:
+            return image_index(self.driver.key, self._cached('image', None, self.driver.list_images))
+        except:
+            raise failure("Failed to index images")
+
+    def latest(self, name=None, tag=None):
+        """
+        Newest image with this name and/or tag, by 'version' metadata then creation date
+        :return: json image or None
+        """
+        image = self.image_index().latest(name=name, tag=tag)
+        return self._dump(image_to_dict(image)) if image is not None else None
+
+    def iter_images(self, page_size=1000, records=False):
+        """
+        Iterate all active images page by page
+        :param page_size: images fetched per request
+        :param records: yield ImageRecord instead of dicts
+        :return: generator of image dicts
+        """
+        try:
+            for item in self._iter_pages('/images/detail', 'images', page_size):
+                if item.get('status') != 'ACTIVE':
+                    continue
+                record = ImageRecord.from_api(item)
+                yield record if records else record.to_dict()
+        except Exception:
+            raise failure("Failed to list images")
 
     def delete_image(self, image_id):
         """
@@ -77,47 +294,65 @@ class Image(OpenStackHandler):
         try:
             image = self.driver.get_image(image_id)
             if image is not None:
-                return self.driver.delete_image(image)
+                deleted = self.driver.delete_image(image)
+                # After the delete, a concurrent reader could otherwise cache the image again
+                self._invalidate('image', image_id)
+                return deleted
             else:
                 return False
         except:
-            raise Exception("Failed to delete image")
+            raise failure("Failed to delete image")
 
 
+@instrumented
 class Volume(OpenStackHandler):
     """
     Operate Volume
     """
 
-    def __init__(self, username, password, tenant, url, api):
-        super(Volume, self).__init__(username, password, tenant, url, api)
+    def __init__(self, username, password, tenant, url, api, **kwargs):
+        super(Volume, self).__init__(username, password, tenant, url, api, **kwargs)
 
-    def volumes(self):
+    @coalesced
+    def volumes(self, status=None, name=None, created_since=None, fields=None):
         """
         List all volumes from OpenStack
+        :param status: e.g. error, in-use
+        :param name: regex the name must match
+        :param created_since: datetime or ISO-8601 string
+        :param fields: output keys to return, e.g. ['volumeId', 'status']
         :return: json volumes
         """
-        # try:
-        volumes = self.driver.list_volumes()
-        if volumes is not None:
-            _volumes = []
-            for volume in volumes:
-                create = volume.extra.get('created_at')
-                if create is not None:
-                    gmtCreate = str(datetime.strptime(
-                        create.replace("T", " ")[: -7], "%Y-%m-%d %H:%M:%S"))
-                else:
-                    gmtCreate = None
-                d = {'volumeId': volume.id, 'name': volume.name, 'size': volume.size, 'status': volume.state,
-                     'uuid': volume.uuid,
-                     'gmtCreate': gmtCreate}
-                _volumes.append(d)
-            return json.dumps(_volumes)
-        else:
-            return None
-            # except:
-            #     raise Exception("Failed to list volumes")
+        query = self._list_filter('volume', fields, status=status, name=name, created_since=created_since)
+        try:
+            if query is not None:
+                return self._dump(self._filtered(query))
+            volumes = self.driver.list_volumes()
+            if volumes is not None:
+                _volumes = []
+                for volume in volumes:
+                    _volumes.append(volume_to_dict(volume))
+                return self._dump(_volumes)
+            else:
+                return None
+        except:
+            raise failure("Failed to list volumes")
+
+    def iter_volumes(self, page_size=1000, records=False):
+        """
+        Iterate all volumes page by page
+        :param page_size: volumes fetched per request
+        :param records: yield VolumeRecord instead of dicts
+        :return: generator of volume dicts
+        """
+        try:
+            for item in self._iter_pages('/os-volumes', 'volumes', page_size):
+                record = VolumeRecord.from_api(item)
+                yield record if records else record.to_dict()
+        except Exception:
+            raise failure("Failed to list volumes")
 
+    @coalesced
     def get_volume(self, volume_id):
         """
         Get volume
@@ -127,20 +362,11 @@ class Volume(OpenStackHandler):
         try:
             volume = self.driver.ex_get_volume(volume_id)
             if volume is not None:
-                create = volume.extra.get('created')
-                if create is not None:
-                    gmtCreate = str(datetime.strptime(
-                        create.replace("T", " ")[: -7], "%Y-%m-%d %H:%M:%S"))
-                else:
-                    gmtCreate = None
-                d = {'volumeId': volume.id, 'name': volume.name, 'size': volume.size, 'status': volume.state,
-                     'uuid': volume.uuid,
-                     'gmtCreate': gmtCreate}
-                return json.dumps(d)
+                return self._dump(volume_to_dict(volume))
             else:
                 return None
         except:
-            raise Exception("Failed to get volume")
+            raise failure("Failed to get volume")
 
     def create_volume(self, size, name, location='nova', snapshot=None,
                       ex_volume_type=''):
@@ -157,20 +383,38 @@ class Volume(OpenStackHandler):
             volume = self.driver.create_volume(size, name, location=location, snapshot=snapshot,
                                                ex_volume_type=ex_volume_type)
             if volume is not None:
-                create = volume.extra.get('created')
-                if create is not None:
-                    gmtCreate = str(datetime.strptime(
-                        create.replace("T", " ")[: -7], "%Y-%m-%d %H:%M:%S"))
-                else:
-                    gmtCreate = None
-                d = {'volumeId': volume.id, 'name': volume.name, 'size': volume.size, 'status': volume.state,
-                     'uuid': volume.uuid,
-                     'gmtCreate': gmtCreate}
-                return json.dumps(d)
+                return self._dump(volume_to_dict(volume))
             else:
                 return None
         except:
-            raise Exception("Failed to create volume")
+            raise failure("Failed to create volume")
+
+    def _volume_states(self, ids, since):
+        return self._pending_states('/os-volumes', 'volumes', 'volume', ids)
+
+    def watch(self, volume_ids, target_state='available', timeout=600, callback=None):
+        """
+        Wait for volumes in the background, all pending volumes of the
+        process share one poll: a GET each while they are few, else one listing
+        :param volume_ids:
+        :param target_state:
+        :param timeout: seconds
+        :param callback: callable(volume_id, status_or_exception)
+        :return: dict volume_id -> Future of the final status
+        """
+        waiter = get_waiter(self.driver.key, 'volume', self._volume_states)
+        return waiter.submit(volume_ids, [target_state], errors=['error'], timeout=timeout,
+                             callback=callback)
+
+    def wait_for(self, volume_ids, target_state='available', timeout=600):
+        """
+        Block until volumes reach target_state, error or the timeout
+        :param volume_ids:
+        :param target_state:
+        :param timeout: seconds
+        :return: json {volume_id: status}, status is null on timeout
+        """
+        return self._dump(wait_all(self.watch(volume_ids, target_state, timeout)))
 
     def delete_volume(self, volume_id):
         """
@@ -181,20 +425,23 @@ class Volume(OpenStackHandler):
         try:
             volume = self.driver.ex_get_volume(volume_id)
             if volume is not None:
-                return self.driver.destroy_volume(volume)
+                deleted = self.driver.destroy_volume(volume)
+                self._invalidate('volume', volume_id)
+                return deleted
             else:
                 return False
         except:
-            raise Exception("Failed to delete volume")
+            raise failure("Failed to delete volume")
 
 
+@instrumented
 class Snapshot(OpenStackHandler):
     """
     Operate Snapshot
     """
 
-    def __init__(self, username, password, tenant, url, api):
-        super(Snapshot, self).__init__(username, password, tenant, url, api)
+    def __init__(self, username, password, tenant, url, api, **kwargs):
+        super(Snapshot, self).__init__(username, password, tenant, url, api, **kwargs)
 
     def create_volume_snapshot(self, volume_id, name):
         """
@@ -208,53 +455,56 @@ class Snapshot(OpenStackHandler):
             if volume is not None:
                 volume_snapshot = self.driver.ex_create_snapshot(volume, name, description=name)
                 if volume_snapshot is not None:
-                    create = volume_snapshot.extra.get('created')
-                    if create is not None:
-                        gmtCreate = str(datetime.strptime(
-                            create.replace("T", " ")[:-7], "%Y-%m-%d %H:%M:%S"))
-                    else:
-                        gmtCreate = None
-                    d = {'snapshotId': volume_snapshot.id, 'size': volume_snapshot.size,
-                         'status': volume_snapshot.state,
-                         'volumeId': volume_snapshot.extra.get('volume_id'),
-                         'gmtCreate': gmtCreate,
-                         'remark': volume_snapshot.extra.get('description'),
-                         'name': volume_snapshot.extra.get('name')}
-                    return json.dumps(d)
+                    return self._dump(snapshot_to_dict(volume_snapshot))
                 else:
                     return None
             else:
                 None
         except:
-            raise Exception("Failed to create volume snapshot")
+            raise failure("Failed to create volume snapshot")
 
-    def snapshots(self):
+    @coalesced
+    def snapshots(self, status=None, name=None, volume_id=None, created_since=None, fields=None):
         """
         List all snapshots
+        :param status: e.g. error, available
+        :param name: regex the name must match
+        :param volume_id: snapshots of this volume only
+        :param created_since: datetime or ISO-8601 string
+        :param fields: output keys to return, e.g. ['snapshotId', 'volumeId']
         :return: json snapshots
         """
+        query = self._list_filter('snapshot', fields, status=status, name=name, volume_id=volume_id,
+                                  created_since=created_since)
         try:
+            if query is not None:
+                return self._dump(self._filtered(query))
             snapshots = self.driver.ex_list_snapshots()
             if snapshots is not None:
                 _snapshots = []
                 for snapshot in snapshots:
-                    create = snapshot.extra.get('created')
-                    if create is not None:
-                        gmtCreate = str(datetime.strptime(
-                            create.replace("T", " ")[:-7], "%Y-%m-%d %H:%M:%S"))
-                    else:
-                        gmtCreate = None
-                    d = {'snapshotId': snapshot.id, 'size': snapshot.size, 'status': snapshot.state,
-                         'volumeId': snapshot.extra.get('volume_id'),
-                         'gmtCreate': gmtCreate,
-                         'remark': snapshot.extra.get('description'), 'name': snapshot.extra.get('name')}
-                    _snapshots.append(d)
-                return json.dumps(_snapshots)
+                    _snapshots.append(snapshot_to_dict(snapshot))
+                return self._dump(_snapshots)
             else:
                 return None
         except:
-            raise Exception("Failed to list snapshots")
+            raise failure("Failed to list snapshots")
+
+    def iter_snapshots(self, page_size=1000, records=False):
+        """
+        Iterate all snapshots page by page
+        :param page_size: snapshots fetched per request
+        :param records: yield SnapshotRecord instead of dicts
+        :return: generator of snapshot dicts
+        """
+        try:
+            for item in self._iter_pages('/os-snapshots', 'snapshots', page_size):
+                record = SnapshotRecord.from_api(item)
+                yield record if records else record.to_dict()
+        except Exception:
+            raise failure("Failed to list snapshots")
 
+    @coalesced
     def get_snapshot(self, snapshot_id):
         """
         Get snapshot
@@ -262,28 +512,15 @@ class Snapshot(OpenStackHandler):
         :return:
         """
         try:
-            snapshots = self.driver.ex_list_snapshots()
-            if snapshots is not None:
-                for snapshot in snapshots:
-                    if snapshot.id == snapshot_id:
-                        create = snapshot.extra.get('created')
-                        if create is not None:
-                            gmtCreate = str(datetime.strptime(
-                                create.replace("T", " ")[:-7], "%Y-%m-%d %H:%M:%S"))
-                        else:
-                            gmtCreate = None
-                        d = {'snapshotId': snapshot.id, 'size': snapshot.size, 'status': snapshot.state,
-                             'volumeId': snapshot.extra.get('volume_id'),
-                             'gmtCreate': gmtCreate,
-                             'remark': snapshot.extra.get('description'), 'name': snapshot.extra.get('name')}
-                        return json.dumps(d)
-                    else:
-                        return None
+            snapshot = self._get_by_id('snapshot', snapshot_id)
+            if snapshot is not None:
+                return self._dump(snapshot_to_dict(snapshot))
             else:
                 return None
         except:
-            raise Exception("Failed to delete snapshot")
+            raise failure("Failed to get snapshot")
 
+    @coalesced
     def volume_snapshots(self, volume_id):
         """
         List all volume snapshots
@@ -294,32 +531,92 @@ class Snapshot(OpenStackHandler):
             volume = self.driver.ex_get_volume(volume_id)
             if volume is not None:
                 volume_snapshots = self.driver.list_volume_snapshots(volume)
+                volume_names = self._volume_names(volume_snapshots, {volume.id: volume.name})
                 _volume_snapshots = []
                 for volume_snapshot in volume_snapshots:
-                    volume_id = volume_snapshot.extra.get('volume_id')
-                    volume_name = None
-                    if volume_id is not None:
-                        volume = self.driver.ex_get_volume(volume_id)
-                        if volume is not None:
-                            volume_name = volume.name
-                    create = volume_snapshot.extra.get('created')
-                    if create is not None:
-                        gmtCreate = str(datetime.strptime(
-                            create.replace("T", " ")[:-7], "%Y-%m-%d %H:%M:%S"))
-                    else:
-                        gmtCreate = None
-                    d = {'snapshotId': volume_snapshot.id, 'size': volume_snapshot.size,
-                         'status': volume_snapshot.state,
-                         'volumeId': volume_snapshot.extra.get('volume_id'), 'volumeName': volume_name,
-                         'gmtCreate': gmtCreate,
-                         'remark': volume_snapshot.extra.get('description'),
-                         'name': volume_snapshot.extra.get('name')}
-                    _volume_snapshots.append(d)
-                return json.dumps(_volume_snapshots)
+                    _volume_snapshots.append(snapshot_to_dict(volume_snapshot, volume_names))
+                return self._dump(_volume_snapshots)
+            else:
+                return None
+        except:
+            raise failure("Failed to list volume snapshots")
+
+    @coalesced
+    def volume_snapshots_all(self):
+        """
+        List all snapshots of the tenant joined with their volume names
+        :return: json volume snapshots
+        """
+        try:
+            volumes = self.driver.list_volumes()
+            snapshots = self.driver.ex_list_snapshots()
+            if volumes is not None and snapshots is not None:
+                volume_names = dict((volume.id, volume.name) for volume in volumes)
+                _volume_snapshots = []
+                for volume_snapshot in snapshots:
+                    _volume_snapshots.append(snapshot_to_dict(volume_snapshot, volume_names))
+                return self._dump(_volume_snapshots)
             else:
                 return None
         except:
-            raise Exception("Failed to list volume snapshots")
+            raise failure("Failed to list volume snapshots")
+
+    def _snapshot_states(self, ids, since):
+        return self._pending_states('/os-snapshots', 'snapshots', 'snapshot', ids)
+
+    def watch(self, snapshot_ids, target_state='available', timeout=600, callback=None):
+        """
+        Wait for snapshots in the background, all pending snapshots of the
+        process share one poll: a GET each while they are few, else one listing
+        :param snapshot_ids:
+        :param target_state:
+        :param timeout: seconds
+        :param callback: callable(snapshot_id, status_or_exception)
+        :return: dict snapshot_id -> Future of the final status
+        """
+        waiter = get_waiter(self.driver.key, 'snapshot', self._snapshot_states)
+        return waiter.submit(snapshot_ids, [target_state], errors=['error'], timeout=timeout,
+                             callback=callback)
+
+    def wait_for(self, snapshot_ids, target_state='available', timeout=600):
+        """
+        Block until snapshots reach target_state, error or the timeout
+        :return: json {snapshot_id: status}, status is null on timeout
+        """
+        return self._dump(wait_all(self.watch(snapshot_ids, target_state, timeout)))
+
+    def lifecycle(self, policy, volume_ids=None, concurrency=8, timeout=600, dry_run=False):
+        """
+        Snapshot volumes and prune their old snapshots according to a retention policy
+        :param policy: lifecycle.RetentionPolicy, or callable(VolumeRecord) -> policy or None
+        :param volume_ids: volumes to cover, all volumes of the tenant by default
+        :param concurrency: requests in flight
+        :param timeout: seconds to wait for each new snapshot
+        :param dry_run: only return the plan
+        :return: json report with the plan counts, created, deleted, failures, seconds and throughput
+        """
+        try:
+            engine = Lifecycle(self, policy, concurrency=concurrency, timeout=timeout)
+            return self._dump(engine.run(volume_ids, dry_run=dry_run))
+        except:
+            raise failure("Failed to run the snapshot lifecycle")
+
+    def _volume_names(self, snapshots, names=None):
+        """
+        Resolve the volume name of every snapshot, fetching each referenced
+        volume at most once
+        :param snapshots:
+        :param names: already known volume id -> name
+        :return: dict volume id -> name
+        """
+        names = dict(names or {})
+        for snapshot in snapshots:
+            volume_id = snapshot.extra.get('volume_id')
+            if volume_id is None or volume_id in names:
+                continue
+            volume = self._cached('volume', volume_id, lambda: self.driver.ex_get_volume(volume_id))
+            names[volume_id] = volume.name if volume is not None else None
+        return names
 
     def delete_snapshot(self, snapshot_id):
         """
@@ -328,82 +625,133 @@ class Snapshot(OpenStackHandler):
         :return:
         """
         try:
-            snapshots = self.driver.ex_list_snapshots()
-            if snapshots is not None:
-                for snapshot in snapshots:
-                    if snapshot.id == snapshot_id:
-                        return self.driver.ex_delete_snapshot(snapshot)
-                    else:
-                        continue
+            snapshot = self._get_by_id('snapshot', snapshot_id)
+            if snapshot is not None:
+                return self.driver.ex_delete_snapshot(snapshot)
             else:
                 return False
         except:
-            raise Exception("Failed to delete snapshot")
+            raise failure("Failed to delete snapshot")
 
 
+@instrumented
 class Size(OpenStackHandler):
     """
     Operate Size
     """
 
-    def __init__(self, username, password, tenant, url, api):
-        super(Size, self).__init__(username, password, tenant, url, api)
+    def __init__(self, username, password, tenant, url, api, **kwargs):
+        super(Size, self).__init__(username, password, tenant, url, api, **kwargs)
 
+    @coalesced
     def sizes(self):
         """
         List sizes
         :return: json sizes
         """
         try:
-            sizes = self.driver.list_sizes()
+            sizes = self._flavors()
             if sizes is not None:
                 _sizes = []
                 for size in sizes:
-                    d = {'flavorId': size.id, 'name': size.name, 'memory': size.ram,
-                         'uuid': size.uuid, 'cpu': size.vcpus, 'disk': size.disk}
-                    _sizes.append(d)
-                return json.dumps(_sizes)
+                    _sizes.append(size_to_dict(size))
+                return self._dump(_sizes)
             else:
                 return None
         except:
-            raise Exception("Failed to list sizes")
+            raise failure("Failed to list sizes")
 
+    def flavor_index(self):
+        """
+        Index of the cached flavor listing, rebuilt when the listing is refreshed
+        :return: placement.FlavorIndex of NodeSize
+        """
+        try:
+            return flavor_index(self.driver.key, self._flavors())
+        except:
+            raise failure("Failed to index sizes")
+
+    def best_fit(self, cpu=0, ram=0, disk=0):
+        """
+        Cheapest flavor with at least these resources
+        :param cpu: vcpus
+        :param ram: MB
+        :param disk: GB
+        :return: json size or None
+        """
+        size = self.flavor_index().best_fit(cpu, ram, disk)
+        return self._dump(size_to_dict(size)) if size is not None else None
+
+    def candidates(self, cpu=0, ram=0, disk=0, max_cpu=None, max_ram=None, max_disk=None, limit=None):
+        """
+        Flavors with at least these resources and at most the max_* ones, cheapest first
+        :return: json sizes
+        """
+        sizes = self.flavor_index().candidates(cpu, ram, disk, max_cpu=max_cpu, max_ram=max_ram,
+                                               max_disk=max_disk, limit=limit)
+        return self._dump([size_to_dict(size) for size in sizes])
 
+
+@instrumented
 class Node(OpenStackHandler):
     """
     Operate Node
     """
 
-    def __init__(self, username, password, tenant, url, api):
-        super(Node, self).__init__(username, password, tenant, url, api)
+    # bulk() action -> driver method
+    ACTIONS = {'reboot': 'ex_hard_reboot_node', 'pause': 'ex_pause_node',
+               'unpause': 'ex_unpause_node', 'suspend': 'ex_suspend_node',
+               'active': 'ex_resume_node', 'delete': 'destroy_node'}
+    # Default max actions started per second by bulk()
+    bulk_rate = None
+
+    def __init__(self, username, password, tenant, url, api, **kwargs):
+        super(Node, self).__init__(username, password, tenant, url, api, **kwargs)
 
-    def nodes(self):
+    @coalesced
+    def nodes(self, status=None, name=None, image=None, flavor=None, created_since=None, fields=None):
         """
         List nodes
+        :param status: Nova status, e.g. ERROR, SHUTOFF
+        :param name: regex the name must match
+        :param image: image id
+        :param flavor: flavor id
+        :param created_since: datetime or ISO-8601 string
+        :param fields: output keys to return, e.g. ['instanceId', 'status']
         :return:
         """
+        query = self._list_filter('node', fields, status=status, name=name, image=image, flavor=flavor,
+                                  created_since=created_since)
         try:
+            if query is not None:
+                return self._dump(self._filtered(query))
             nodes = self.driver.list_nodes()
             if nodes is not None:
                 _nodes = []
                 for node in nodes:
-                    create = node.extra.get('created')
-                    if create is not None:
-                        gmtCreate = str(datetime.strptime(
-                            create.replace("T", " ").replace("Z", ""), "%Y-%m-%d %H:%M:%S"))
-                    else:
-                        gmtCreate = None
-                    d = {'instanceId': node.id, 'name': node.name, 'imageId': node.extra.get('imageId'),
-                         'flavorId': node.extra.get("flavorId"), 'status': node.extra.get("vm_state"),
-                         'uuid': node.uuid, 'privateIps': node.private_ips, 'publicIps': node.public_ips,
-                         'gmtCreate': gmtCreate}
-                    _nodes.append(d)
-                return json.dumps(_nodes)
+                    node_cache.set(self.driver.key, 'node', node.id, node)
+                    _nodes.append(node_to_dict(node))
+                return self._dump(_nodes)
             else:
                 return None
         except:
-            raise Exception("Failed to get nodes")
+            raise failure("Failed to get nodes")
+
+    def iter_nodes(self, page_size=1000, records=False):
+        """
+        Iterate all nodes page by page
+        :param page_size: nodes fetched per request
+        :param records: yield NodeRecord instead of dicts
+        :return: generator of node dicts
+        """
+        try:
+            for item in self._iter_pages('/servers/detail', 'servers', page_size):
+                record = NodeRecord.from_api(item)
+                yield record if records else record.to_dict()
+        except Exception:
+            raise failure("Failed to get nodes")
 
+    @coalesced
     def get_node(self, node_id):
         """
         Get node
@@ -413,21 +761,12 @@ class Node(OpenStackHandler):
         try:
             node = self.driver.ex_get_node_details(node_id)
             if node is not None:
-                create = node.extra.get('created')
-                if create is not None:
-                    gmtCreate = str(datetime.strptime(
-                        create.replace("T", " ").replace("Z", ""), "%Y-%m-%d %H:%M:%S"))
-                else:
-                    gmtCreate = None
-                d = {'instanceId': node.id, 'name': node.name, 'imageId': node.extra.get('imageId'),
-                     'flavorId': node.extra.get("flavorId"), 'status': node.extra.get("vm_state"),
-                     'uuid': node.uuid, 'privateIps': node.private_ips, 'publicIps': node.public_ips,
-                     'gmtCreate': gmtCreate}
-                return json.dumps(d)
+                node_cache.set(self.driver.key, 'node', node.id, node)
+                return self._dump(node_to_dict(node))
             else:
                 return None
         except:
-            raise Exception("Failed to get node")
+            raise failure("Failed to get node")
 
     def create_node(self, name, image_id, size_id, network_id):
         """
@@ -438,33 +777,111 @@ class Node(OpenStackHandler):
         :return: json node
         """
         try:
-            image = self.driver.get_image(image_id)
-            size = self.driver.ex_get_size(size_id)
-            networks = self.driver.ex_list_networks()
-            net = None
-            for network in networks:
-                if network.id == network_id:
-                    net = network
-            if image is not None and size is not None and networks is not None:
+            image = self._cached('image', image_id, lambda: self.driver.get_image(image_id))
+            size = self._size(size_id)
+            net = self._cached('network', network_id, lambda: self._get_by_id('network', network_id))
+            if image is not None and size is not None and net is not None:
                 node = self.driver.create_node(name=name, image=image, size=size, networks=[net])
                 if node is not None:
-                    create = node.extra.get('created')
-                    if create is not None:
-                        gmtCreate = str(datetime.strptime(
-                            create.replace("T", " ").replace("Z", ""), "%Y-%m-%d %H:%M:%S"))
-                    else:
-                        gmtCreate = None
-                    d = {'instanceId': node.id, 'name': node.name, 'imageId': node.extra.get('imageId'),
-                         'flavorId': node.extra.get("flavorId"), 'status': node.extra.get("vm_state"),
-                         'uuid': node.uuid, 'privateIps': node.private_ips, 'publicIps': node.public_ips,
-                         'gmtCreate': gmtCreate}
-                    return json.dumps(d)
+                    return self._dump(node_to_dict(node))
                 else:
                     return None
             else:
                 return None
         except:
-            raise Exception("Failed to create node")
+            raise failure("Failed to create node")
+
+    def create_nodes(self, name, image_id, size_id, network_id, count, volume_size=None,
+                     volume_type='', location='nova', multi=True, timeout=600, concurrency=8):
+        """
+        Create count nodes, each with its own data volume when volume_size is
+        given. Image, flavor and network are resolved once, the servers are
+        booted with one multi-create request (multi=False: one request each)
+        while the volumes are created, and every volume is attached as soon
+        as its server is ACTIVE.
+        :param name: servers are named <name>-1 .. <name>-<count>
+        :param image_id:
+        :param size_id:
+        :param network_id:
+        :param count:
+        :param volume_size: GB, None for no data volumes
+        :param volume_type:
+        :param location:
+        :param multi: use Nova multi-create
+        :param timeout: seconds to wait for servers and volumes
+        :param concurrency: volume creations in flight
+        :return: json {'reservationId', 'timings', 'instances': [{'instanceId', 'name',
+                 'status', 'volumeId', 'volumeStatus', 'attached', 'error', 'timings'}]}
+        """
+        try:
+            volumes = Volume(self.username, self.password, self.tenant, self.url, self.api,
+                             region=self.region)
+            provisioner = Provisioner(self, volumes, timeout=timeout, concurrency=concurrency)
+            report = provisioner.run(name, image_id, size_id, network_id, count,
+                                     volume_size=volume_size, volume_type=volume_type,
+                                     location=location, multi=multi)
+            self._invalidate('volume')
+            return self._dump(report)
+        except:
+            raise failure("Failed to create nodes")
+
+    def _node_states(self, ids, since):
+        params = {'changes-since': since} if since else {}
+        servers = self.driver.connection.request('/servers/detail', params=params).object.get('servers') or []
+        return dict((server['id'], server['status']) for server in servers)
+
+    def watch(self, node_ids, target_state='ACTIVE', timeout=600, callback=None):
+        """
+        Wait for nodes in the background, all pending nodes of the process
+        share one changes-since listing per poll
+        :param node_ids:
+        :param target_state:
+        :param timeout: seconds
+        :param callback: callable(node_id, status_or_exception)
+        :return: dict node_id -> Future of the final status
+        """
+        waiter = get_waiter(self.driver.key, 'node', self._node_states)
+        return waiter.submit(node_ids, [target_state], errors=['ERROR'], timeout=timeout,
+                             callback=callback)
+
+    def wait_for(self, node_ids, target_state='ACTIVE', timeout=600):
+        """
+        Block until nodes reach target_state, ERROR or the timeout
+        :param node_ids:
+        :param target_state:
+        :param timeout: seconds
+        :return: json {node_id: status}, status is null on timeout
+        """
+        return self._dump(wait_all(self.watch(node_ids, target_state, timeout)))
+
+    def _node(self, node_id):
+        return node_cache.get_or_load(self.driver.key, 'node', node_id,
+                                      lambda: self.driver.ex_get_node_details(node_id))
+
+    def _node_action(self, action, node_id):
+        node = self._node(node_id)
+        if node is None:
+            return False
+        if action == 'delete':
+            node_cache.invalidate(self.driver.key, 'node', node_id)
+        return getattr(self.driver, self.ACTIONS[action])(node)
+
+    def bulk(self, action, node_ids, concurrency=8, rate=None):
+        """
+        Run one action on many nodes concurrently
+        :param action: reboot|pause|unpause|suspend|active|delete
+        :param node_ids:
+        :param concurrency: max actions in flight
+        :param rate: max actions started per second, defaults to bulk_rate
+        :return: json {'results': {node_id: True|False}, 'errors': {node_id: message}}
+        """
+        if action.endswith('_node'):
+            action = action[:-len('_node')]
+        if action not in self.ACTIONS:
+            raise ValueError("Unknown node action: %s" % action)
+        results, errors = run_bulk(lambda node_id: self._node_action(action, node_id), node_ids,
+                                   concurrency=concurrency, rate=rate or self.bulk_rate)
+        return self._dump({'results': results, 'errors': errors})
 
     def reboot_node(self, node_id):
         """
@@ -473,13 +890,9 @@ class Node(OpenStackHandler):
         :return:
         """
         try:
-            node = self.driver.ex_get_node_details(node_id)
-            if node is not None:
-                return self.driver.ex_hard_reboot_node(node)
-            else:
-                return False
+            return self._node_action('reboot', node_id)
         except:
-            raise Exception("Failed to reboot node")
+            raise failure("Failed to reboot node")
 
     def update_node(self, node_id, name):
         """
@@ -493,14 +906,11 @@ class Node(OpenStackHandler):
             if node is not None:
                 _node = self.driver.ex_update_node(node, name=name)
                 if _node is not None:
-                    d = {'instanceId': _node.id, 'name': _node.name, 'imageId': _node.image, 'size': _node.size,
-                         'status': _node.state, 'uuid': _node.uuid, 'privateIps': _node.private_ips,
-                         'publicIps': _node.public_ips}
-                    return json.dumps(d)
+                    return self._dump(updated_node_to_dict(_node))
             else:
                 return None
         except:
-            raise Exception("Failed to update node")
+            raise failure("Failed to update node")
 
     def delete_node(self, node_id):
         """
@@ -509,13 +919,9 @@ class Node(OpenStackHandler):
         :return: True|False
         """
         try:
-            node = self.driver.ex_get_node_details(node_id)
-            if node is not None:
-                return self.driver.destroy_node(node)
-            else:
-                return False
+            return self._node_action('delete', node_id)
         except:
-            raise Exception("Failed to delete node")
+            raise failure("Failed to delete node")
 
     def pause_node(self, node_id):
         """
@@ -524,13 +930,9 @@ class Node(OpenStackHandler):
         :return: True|False
         """
         try:
-            node = self.driver.ex_get_node_details(node_id)
-            if node is not None:
-                return self.driver.ex_pause_node(node)
-            else:
-                return False
+            return self._node_action('pause', node_id)
         except:
-            raise Exception("Failed to stop node")
+            raise failure("Failed to stop node")
 
     def unpause_node(self, node_id):
         """
@@ -539,13 +941,9 @@ class Node(OpenStackHandler):
         :return: True|False
         """
         try:
-            node = self.driver.ex_get_node_details(node_id)
-            if node is not None:
-                return self.driver.ex_unpause_node(node)
-            else:
-                return False
+            return self._node_action('unpause', node_id)
         except:
-            raise Exception("Failed to start node")
+            raise failure("Failed to start node")
 
     def suspend_node(self, node_id):
         """
@@ -554,13 +952,9 @@ class Node(OpenStackHandler):
         :return:
         """
         try:
-            node = self.driver.ex_get_node_details(node_id)
-            if node is not None:
-                return self.driver.ex_suspend_node(node)
-            else:
-                return False
+            return self._node_action('suspend', node_id)
         except:
-            raise Exception("Failed to suspend node")
+            raise failure("Failed to suspend node")
 
     def active_node(self, node_id):
         """
@@ -569,41 +963,38 @@ class Node(OpenStackHandler):
         :return:
         """
         try:
-            node = self.driver.ex_get_node_details(node_id)
-            if node is not None:
-                return self.driver.ex_resume_node(node)
-            else:
-                return False
+            return self._node_action('active', node_id)
         except:
-            raise Exception("Failed to active node")
+            raise failure("Failed to active node")
 
 
+@instrumented
 class Network(OpenStackHandler):
     """
     Operate Network
     """
 
-    def __init__(self, username, password, tenant, url, api):
-        super(Network, self).__init__(username, password, tenant, url, api)
+    def __init__(self, username, password, tenant, url, api, **kwargs):
+        super(Network, self).__init__(username, password, tenant, url, api, **kwargs)
 
+    @coalesced
     def networks(self):
         """
         List networks
         :return:
         """
         try:
-            networks = self.driver.ex_list_networks()
+            networks = self._cached('network', None, self.driver.ex_list_networks)
             if networks is not None:
                 _networks = []
                 for network in networks:
-                    d = {'networkId': network.id, 'name': network.name, 'cidr': network.cidr}
-                    _networks.append(d)
-                return json.dumps(_networks)
+                    _networks.append(network_to_dict(network))
+                return self._dump(_networks)
             else:
                 return None
 
         except:
-            raise Exception("Failed to list networks")
+            raise failure("Failed to list networks")
 
     def create_network(self, name, cidr):
         """
@@ -614,13 +1005,13 @@ class Network(OpenStackHandler):
         """
         try:
             network = self.driver.ex_create_network(name, cidr)
+            self._invalidate('network')
             if network is not None:
-                d = {'networkId': network.id, 'name': network.name, 'cidr': network.cidr}
-                return json.dumps(d)
+                return self._dump(network_to_dict(network))
             else:
                 return None
         except:
-            raise Exception("Failed to create network")
+            raise failure("Failed to create network")
 
     def delete_network(self, network_id):
         """
@@ -629,23 +1020,26 @@ class Network(OpenStackHandler):
         :return:
         """
         try:
-            networks = self.driver.ex_list_networks()
-            for network in networks:
-                if network.id == network_id:
-                    return self.driver.ex_delete_network(network)
-                else:
-                    continue
+            network = self._get_by_id('network', network_id)
+            if network is not None:
+                deleted = self.driver.ex_delete_network(network)
+                self._invalidate('network')
+                return deleted
             else:
                 return False
         except:
-            raise Exception("Failed to delete network")
+            raise failure("Failed to delete network")
 
 
 if __name__ == '__main__':
-    _username = 'admin'
-    _password = 'Root1234'
-    _url = 'http://192.168.1.211:35357'
-    _tenant = 'admin'
-    _api = '2.0_password'
+    # Credentials come from the usual OpenStack environment variables:
+    #   python -m openstack_handler.openstack_handler <node id>
+    import os
+    import sys
+    _username = os.environ['OS_USERNAME']
+    _password = os.environ['OS_PASSWORD']
+    _url = os.environ['OS_AUTH_URL']
+    _tenant = os.environ.get('OS_TENANT_NAME') or os.environ['OS_PROJECT_NAME']
+    _api = os.environ.get('OS_AUTH_VERSION', '2.0_password')
     node = Node(_username, _password, _tenant, _url, _api)
-    print node.get_node('fb5253b3-29cd-40a0-aff2-d89a584e73e5')
+    print(node.get_node(sys.argv[1]) if len(sys.argv) > 1 else node.nodes())
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+In-memory flavor and image indexes for placement decisions.
+
+FlavorIndex keeps the flavors sorted by cost (ram, then vcpus, then disk by
+default). best_fit(cpu, ram, disk) is the first flavor in that order that
+satisfies all three. Requirements are rounded up to the vcpus/ram/disk
+values that exist among the flavors, so every distinct question is answered
+by one scan and then from a memo. Repeated lookups cost a dict hit, see
+benchmarks/bench_placement.py. Disabled flavors (OS-FLV-DISABLED) cannot be
+booted and are left out.
+
+ImageIndex groups images by name and by tag, newest first, with latest()
+picking by the 'version' metadata when present and the creation date
+otherwise.
+
+Both indexes are built from the catalog cache listings and rebuilt when the
+cache returns a new listing, see flavor_index() and image_index().
+"""
+import re
+import threading
+from bisect import bisect_left
+
+# Memo entries kept before the memo is reset
+MEMO_SIZE = 65536
+
+
+class FlavorIndex(object):
+    """
+    Flavors sorted by cost, with range queries on vcpus, ram and disk
+    """
+
+    def __init__(self, flavors, order=('ram', 'vcpus', 'disk')):
+        """
+        :param flavors: objects with id, name, vcpus, ram and disk (NodeSize, FlavorRecord),
+                        the ones whose extra['disabled'] is set are skipped
+        :param order: attributes ranking the flavors, the first ones weigh most
+        """
+        self.order = tuple(order)
+        flavors = [f for f in flavors if not (getattr(f, 'extra', None) or {}).get('disabled')]
+        self.flavors = sorted(flavors, key=lambda f: tuple(getattr(f, a) or 0 for a in self.order) + (f.id,))
+        self._by_id = dict((f.id, f) for f in self.flavors)
+        self._by_name = dict((f.name, f) for f in self.flavors)
+        self._cpus = sorted(set(f.vcpus or 0 for f in self.flavors))
+        self._rams = sorted(set(f.ram or 0 for f in self.flavors))
+        self._disks = sorted(set(f.disk or 0 for f in self.flavors))
+        self._best = {}
+        self._grid_best = {}
+        self._fits = {}
+
+    def __len__(self):
+        return len(self.flavors)
+
+    def get(self, flavor_id):
+        return self._by_id.get(flavor_id)
+
+    def by_name(self, name):
+        return self._by_name.get(name)
+
+    @staticmethod
+    def _round(values, wanted):
+        i = bisect_left(values, wanted)
+        return values[i] if i < len(values) else None
+
+    def _grid(self, cpu, ram, disk):
+        """
+        :return: requirements rounded up to existing values, None when no flavor is big enough
+        """
+        cpu = self._round(self._cpus, cpu)
+        ram = self._round(self._rams, ram)
+        disk = self._round(self._disks, disk)
+        if cpu is None or ram is None or disk is None:
+            return None
+        return cpu, ram, disk
+
+    def _fit(self, grid):
+        fits = self._fits.get(grid)
+        if fits is None:
+            cpu, ram, disk = grid
+            fits = tuple(f for f in self.flavors
+                         if (f.vcpus or 0) >= cpu and (f.ram or 0) >= ram and (f.disk or 0) >= disk)
+            if len(self._fits) >= MEMO_SIZE:
+                self._fits.clear()
+            self._fits[grid] = fits
+        return fits
+
+    def best_fit(self, cpu=0, ram=0, disk=0):
+        """
+        Cheapest flavor with at least these resources
+        :param cpu: vcpus
+        :param ram: MB
+        :param disk: GB
+        :return: flavor or None
+        """
+        key = (cpu, ram, disk)
+        try:
+            return self._best[key]
+        except KeyError:
+            pass
+        grid = self._grid(cpu, ram, disk)
+        if grid is None:
+            best = None
+        elif grid in self._grid_best:
+            best = self._grid_best[grid]
+        else:
+            # Cheapest first, so the scan stops at the first fit
+            best = next((f for f in self.flavors if (f.vcpus or 0) >= grid[0] and (f.ram or 0) >= grid[1]
+                         and (f.disk or 0) >= grid[2]), None)
+            self._grid_best[grid] = best
+        if len(self._best) >= MEMO_SIZE:
+            self._best.clear()
+        self._best[key] = best
+        return best
+
+    def candidates(self, cpu=0, ram=0, disk=0, max_cpu=None, max_ram=None, max_disk=None, limit=None):
+        """
+        Flavors with at least these resources, cheapest first
+        :param max_cpu: upper bounds, None for none
+        :param max_ram:
+        :param max_disk:
+        :param limit: max flavors returned
+        :return: list of flavors
+        """
+        grid = self._grid(cpu, ram, disk)
+        if grid is None:
+            return []
+        fits = self._fit(grid)
+        if max_cpu is not None or max_ram is not None or max_disk is not None:
+            fits = [f for f in fits
+                    if (max_cpu is None or (f.vcpus or 0) <= max_cpu)
+                    and (max_ram is None or (f.ram or 0) <= max_ram)
+                    and (max_disk is None or (f.disk or 0) <= max_disk)]
+        return list(fits[:limit] if limit is not None else fits)
+
+
+_NUMBERS = re.compile(r'(\d+)')
+
+
+def _natural(value):
+    # '1.10' sorts after '1.9'
+    return tuple(int(part) if part.isdigit() else part for part in _NUMBERS.split(value or ''))
+
+
+def _metadata(image):
+    extra = getattr(image, 'extra', None) or {}
+    return extra.get('metadata') or extra.get('properties') or {}
+
+
+def _tags(image):
+    extra = getattr(image, 'extra', None) or {}
+    tags = extra.get('tags') or _metadata(image).get('tags') or []
+    if not isinstance(tags, (list, tuple)):
+        tags = [t.strip() for t in str(tags).split(',') if t.strip()]
+    return tags
+
+
+def _rank(image):
+    extra = getattr(image, 'extra', None) or {}
+    created = extra.get('created') or extra.get('created_at') or ''
+    return _natural(_metadata(image).get('version')), created
+
+
+class ImageIndex(object):
+    """
+    Images by id, name and tag, newest first
+    """
+
+    def __init__(self, images):
+        """
+        :param images: NodeImage objects, extra['metadata'] may carry 'version' and 'tags'
+        """
+        self.images = sorted(images, key=_rank, reverse=True)
+        self._by_id = {}
+        self._by_name = {}
+        self._by_tag = {}
+        for image in self.images:
+            self._by_id[image.id] = image
+            self._by_name.setdefault(image.name, []).append(image)
+            for tag in _tags(image):
+                self._by_tag.setdefault(tag, []).append(image)
+
+    def __len__(self):
+        return len(self.images)
+
+    def get(self, image_id):
+        return self._by_id.get(image_id)
+
+    def by_name(self, name):
+        return list(self._by_name.get(name, ()))
+
+    def by_tag(self, tag):
+        return list(self._by_tag.get(tag, ()))
+
+    def latest(self, name=None, tag=None):
+        """
+        Newest image with this name and/or tag
+        :return: image or None
+        """
+        if name is not None:
+            images = self._by_name.get(name, ())
+            if tag is not None:
+                images = [i for i in images if tag in _tags(i)]
+        elif tag is not None:
+            images = self._by_tag.get(tag, ())
+        else:
+            images = self.images
+        return images[0] if images else None
+
+
+_lock = threading.Lock()
+_indexes = {}
+
+
+def _index(scope, resource, listing, build):
+    """
+    Index of a catalog listing, rebuilt when the listing object changes
+    """
+    with _lock:
+        source, index = _indexes.get((scope, resource), (None, None))
+        if source is listing:
+            return index
+    index = build(listing)
+    with _lock:
+        _indexes[(scope, resource)] = (listing, index)
+    return index
+
+
+def flavor_index(scope, flavors):
+    """
+    :param scope: SharedDriver.key
+    :param flavors: cached flavor listing
+    :return: FlavorIndex
+    """
+    return _index(scope, 'flavor', flavors, FlavorIndex)
+
+
+def image_index(scope, images):
+    """
+    :param scope: SharedDriver.key
+    :param images: cached image listing
+    :return: ImageIndex
+    """
+    return _index(scope, 'image', images, ImageIndex)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Batch provisioning: N servers with one data volume each.
+
+The stages overlap instead of running one instance after the other:
+
+1. image, flavor and network are resolved once for the whole batch
+2. data volume creation is started on the shared worker pool, fed from a
+   thread of its own so the boot request never waits for a free slot
+3. the servers are booted with a single Nova multi-create request
+   (min_count/max_count), or one request each when multi=False
+4. servers and volumes are handed to the batched waiters, every server is
+   attached to its volume as soon as both of them are ready
+"""
+import threading
+import time
+
+from .bulk import executor, run_bulk
+from .resilience import NotFound
+from .waiter import WaitTimeout
+
+
+def _error(e):
+    if isinstance(e, WaitTimeout):
+        return 'timeout'
+    return str(e) or e.__class__.__name__
+
+
+class _Instance(object):
+    """
+    Progress of one server + volume pair
+    """
+
+    def __init__(self, index, started):
+        self.index = index
+        self.started = started
+        self.server_id = None
+        self.name = None
+        self.status = None
+        self.volume_id = None
+        self.volume_status = None
+        self.server_ready = False
+        self.volume_ready = False
+        self.attached = False
+        self.error = None
+        self.timings = {}
+        from concurrent.futures import Future
+        self.done = Future()
+        self.lock = threading.Lock()
+
+    def mark(self, stage, since):
+        self.timings[stage] = round(time.time() - since, 3)
+
+    def fail(self, stage, e):
+        with self.lock:
+            if self.error is None:
+                self.error = '%s: %s' % (stage, _error(e))
+        self.finish()
+
+    def finish(self):
+        if not self.done.done():
+            self.mark('total', self.started)
+            self.done.set_result(self)
+
+    def to_dict(self):
+        return {'instanceId': self.server_id, 'name': self.name, 'status': self.status,
+                'volumeId': self.volume_id, 'volumeStatus': self.volume_status,
+                'attached': self.attached, 'error': self.error, 'timings': self.timings}
+
+
+class Provisioner(object):
+    """
+    Runs one batch for a Node handler and a Volume handler of the same tenant
+    """
+
+    def __init__(self, nodes, volumes, timeout=600, concurrency=8):
+        """
+        :param nodes: Node handler
+        :param volumes: Volume handler, only needed with volume_size
+        :param timeout: seconds to wait for servers and volumes
+        :param concurrency: volume creations in flight
+        """
+        self.nodes = nodes
+        self.volumes = volumes
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.timings = {}
+
+    def run(self, name, image_id, size_id, network_id, count, volume_size=None,
+            volume_type='', location='nova', multi=True):
+        """
+        When the boot request fails every instance reports the error, along with
+        the id of its data volume when one was already created
+        :return: report dict {'reservationId', 'timings', 'instances': [...]}
+        """
+        started = time.time()
+        image, size, net = self._resolve(image_id, size_id, network_id)
+        self.timings['resolve'] = round(time.time() - started, 3)
+        instances = [_Instance(i, started) for i in range(count)]
+
+        feeder = None
+        if volume_size:
+            feeder = self._start_volumes(instances, name, volume_size, volume_type, location)
+        else:
+            for instance in instances:
+                instance.volume_ready = True
+
+        boot = time.time()
+        try:
+            reservation, servers = self._boot(name, image, size, net, count, multi)
+        except Exception as e:
+            for instance in instances:
+                instance.fail('create', e)
+            if feeder is not None:
+                # No more volumes, and report the ids of the ones already created
+                from concurrent.futures import wait
+                thread, stop, futures = feeder
+                stop.set()
+                thread.join()
+                wait(futures, timeout=self.timeout)
+            self.timings['total'] = round(time.time() - started, 3)
+            return {'reservationId': None, 'timings': self.timings,
+                    'instances': [i.to_dict() for i in instances]}
+        self.timings['create'] = round(time.time() - boot, 3)
+
+        for instance, server in zip(instances, servers):
+            instance.server_id = server['id']
+            instance.name = server.get('name')
+            instance.status = server.get('status')
+        for instance in instances[len(servers):]:
+            instance.fail('create', Exception("server missing from the reservation"))
+        booted = [i for i in instances if i.server_id is not None]
+        by_id = dict((i.server_id, i) for i in booted)
+
+        def server_done(server_id, result):
+            self._server_done(by_id[server_id], boot, result)
+        self.nodes.watch([i.server_id for i in booted], 'ACTIVE', self.timeout, callback=server_done)
+
+        for instance in instances:
+            try:
+                instance.done.result(self.timeout + 60)
+            except Exception as e:
+                instance.fail('wait', e)
+        self.timings['total'] = round(time.time() - started, 3)
+        return {'reservationId': reservation, 'timings': self.timings,
+                'instances': [i.to_dict() for i in instances]}
+
+    def _resolve(self, image_id, size_id, network_id):
+        driver = self.nodes.driver
+        image = self.nodes._cached('image', image_id, lambda: driver.get_image(image_id))
+        size = self.nodes._size(size_id)
+        net = self.nodes._cached('network', network_id, lambda: self.nodes._get_by_id('network', network_id))
+        if image is None or size is None or net is None:
+            raise NotFound("Failed to resolve image, flavor or network")
+        return image, size, net
+
+    def _boot(self, name, image, size, net, count, multi):
+        """
+        :return: (reservation id or None, server payloads in creation order)
+        """
+        driver = self.nodes.driver
+        if not multi or count == 1:
+            def boot_one(index):
+                server_name = name if count == 1 else '%s-%d' % (name, index + 1)
+                return driver.create_node(name=server_name, image=image, size=size, networks=[net])
+            created, errors = run_bulk(boot_one, range(count), concurrency=self.concurrency)
+            servers = [{'id': created[i].id, 'name': created[i].name,
+                        'status': created[i].extra.get('vm_state')}
+                       for i in range(count) if i in created]
+            return None, servers
+
+        params = driver._create_args_to_params(None, name=name, image=image, size=size, networks=[net])
+        params.update({'min_count': count, 'max_count': count, 'return_reservation_id': True})
+        response = driver.connection.request('/servers', method='POST', data={'server': params})
+        reservation = response.object['reservation_id']
+        servers = list(self.nodes._iter_pages('/servers/detail', 'servers', 1000,
+                                              {'reservation_id': reservation}))
+
+        def order(server):
+            # Nova names the members <name>-1 .. <name>-N
+            suffix = (server.get('name') or '').rsplit('-', 1)[-1]
+            return int(suffix) if suffix.isdigit() else 0
+        return reservation, sorted(servers, key=order)
+
+    def _start_volumes(self, instances, name, size, volume_type, location):
+        """
+        Submit the volume creations from a thread of their own, so waiting for
+        a free slot never holds back the boot request
+        :return: (feeder thread, stop event, list of the submitted futures)
+        """
+        stop = threading.Event()
+        futures = []
+        slots = threading.BoundedSemaphore(max(1, self.concurrency))
+
+        def feed():
+            for instance in instances:
+                slots.acquire()
+                if stop.is_set():
+                    slots.release()
+                    return
+                futures.append(executor().submit(self._create_volume, instance, slots,
+                                                 '%s-%d-data' % (name, instance.index + 1),
+                                                 size, volume_type, location))
+        thread = threading.Thread(target=feed, name='provision-volumes')
+        thread.daemon = True
+        thread.start()
+        return thread, stop, futures
+
+    def _create_volume(self, instance, slots, name, size, volume_type, location):
+        started = time.time()
+        try:
+            volume = self.volumes.driver.create_volume(size, name, location=location,
+                                                       ex_volume_type=volume_type)
+        except Exception as e:
+            instance.fail('volume', e)
+            return
+        finally:
+            slots.release()
+        instance.volume_id = volume.id
+
+        def volume_done(volume_id, result):
+            instance.mark('volume', started)
+            if isinstance(result, Exception) or result != 'available':
+                instance.volume_status = None if isinstance(result, Exception) else result
+                instance.fail('volume', result if isinstance(result, Exception)
+                              else Exception("volume is %s" % result))
+                return
+            instance.volume_status = result
+            self._ready(instance, volume=True)
+        self.volumes.watch([volume.id], 'available', self.timeout, callback=volume_done)
+
+    def _server_done(self, instance, boot, result):
+        instance.mark('build', boot)
+        if isinstance(result, Exception):
+            instance.fail('build', result)
+            return
+        instance.status = result
+        if result != 'ACTIVE':
+            instance.fail('build', Exception("server is %s" % result))
+            return
+        self._ready(instance, server=True)
+
+    def _ready(self, instance, server=False, volume=False):
+        with instance.lock:
+            instance.server_ready = instance.server_ready or server
+            instance.volume_ready = instance.volume_ready or volume
+            ready = instance.server_ready and instance.volume_ready and instance.error is None
+        if not ready:
+            return
+        if instance.volume_id is None:
+            instance.finish()
+        else:
+            executor().submit(self._attach, instance)
+
+    def _attach(self, instance):
+        started = time.time()
+        try:
+            self.nodes.driver.connection.request(
+                '/servers/%s/os-volume_attachments' % instance.server_id, method='POST',
+                data={'volumeAttachment': {'volumeId': instance.volume_id}})
+        except Exception as e:
+            instance.fail('attach', e)
+            return
+        instance.attached = True
+        instance.mark('attach', started)
+        instance.finish()
@@ -0,0 +1,238 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Client side rate limiting shared by every handler of the process, or of
+every process on the host.
+
+Budgets are token buckets keyed by (service, verb), '*' matching any of
+them. A request takes one token from every budget it matches, so
+('compute', 'DELETE') can cap deletions while ('compute', '*') caps all
+calls to that endpoint. Each endpoint (service and host) has its own buckets.
+
+Priority classes keep bulk work from starving interactive calls: a class
+may only take a token while the bucket keeps its reserve, a fraction of the
+burst, so bulk writes stop well before interactive reads. Reads default to
+'interactive', other verbs to 'normal', and run_bulk() runs its calls as 'bulk'.
+
+    ratelimit.configure({('compute', '*'): (20, 40), ('compute', 'DELETE'): (5, 10)},
+                        path='/run/openstack_handler/ratelimit')
+
+With path, the buckets live in that file and are shared across processes.
+A request that would wait longer than max_wait fails with RateLimited,
+which the retry policy treats like the API's own throttling.
+"""
+import contextlib
+import json
+import os
+import threading
+import time
+
+from .resilience import RateLimited, _endpoint
+
+# priority class -> fraction of the burst it must leave in the bucket
+RESERVES = {
+    'interactive': 0.0,
+    'normal': 0.25,
+    'bulk': 0.5,
+}
+
+READS = frozenset(['GET', 'HEAD', 'OPTIONS'])
+
+_local = threading.local()
+
+
+@contextlib.contextmanager
+def priority(name):
+    """
+    Run the requests of the block with this priority class
+    :param name: interactive|normal|bulk
+    """
+    if name not in RESERVES:
+        raise ValueError("Unknown priority: %s" % name)
+    previous = getattr(_local, 'priority', None)
+    _local.priority = name
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def current_priority(method):
+    name = getattr(_local, 'priority', None)
+    if name is not None:
+        return name
+    return 'interactive' if method in READS else 'normal'
+
+
+def _take(state, rate, burst, reserve, now):
+    """
+    :param state: [tokens, timestamp], updated in place
+    :return: seconds to wait before a token can be taken, 0 when taken
+    """
+    tokens = min(burst, state[0] + (now - state[1]) * rate)
+    state[1] = now
+    need = min(burst, reserve * burst + 1)
+    if tokens >= need:
+        state[0] = tokens - 1
+        return 0
+    state[0] = tokens
+    return (need - tokens) / rate
+
+
+class _MemoryState(object):
+    """
+    Buckets of this process
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._buckets = {}
+
+    def take(self, key, rate, burst, reserve):
+        with self._lock:
+            now = time.time()
+            state = self._buckets.get(key)
+            if state is None:
+                state = self._buckets[key] = [burst, now]
+            return _take(state, rate, burst, reserve, now)
+
+
+class _FileState(object):
+    """
+    Buckets in a file locked with flock, shared by every process using it
+    """
+
+    def __init__(self, path):
+        import fcntl
+        self._fcntl = fcntl
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def take(self, key, rate, burst, reserve):
+        with self._lock:
+            fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+            try:
+                self._fcntl.flock(fd, self._fcntl.LOCK_EX)
+                with os.fdopen(os.dup(fd), 'r+') as fp:
+                    try:
+                        buckets = json.loads(fp.read() or '{}')
+                    except ValueError:
+                        buckets = {}
+                    now = time.time()
+                    state = buckets.get(key) or [burst, now]
+                    wait = _take(state, rate, burst, reserve, now)
+                    buckets[key] = state
+                    fp.seek(0)
+                    fp.truncate()
+                    fp.write(json.dumps(buckets))
+                return wait
+            finally:
+                os.close(fd)
+
+
+class RateLimiter(object):
+    """
+    Token buckets per endpoint and verb
+    """
+
+    def __init__(self, budgets, path=None, max_wait=30.0):
+        """
+        :param budgets: dict (service, verb) -> (rate per second, burst), '*' matches anything
+        :param path: file shared by all processes using it, None for this process only
+        :param max_wait: longest a request may wait for a token, in seconds
+        """
+        self.budgets = dict(((service, verb.upper()), (float(rate), float(max(burst, 1))))
+                            for (service, verb), (rate, burst) in budgets.items())
+        self.max_wait = max_wait
+        self._state = _FileState(path) if path else _MemoryState()
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def _rules(self, service, method):
+        for rule in ((service, method), (service, '*'), ('*', method), ('*', '*')):
+            if rule in self.budgets:
+                yield rule
+
+    def _count(self, rule, name, value=1):
+        key = '%s %s' % rule
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = {'requests': 0, 'waits': 0, 'waited': 0.0, 'rejected': 0}
+            stats[name] += value
+
+    def acquire(self, service, endpoint, method, priority=None):
+        """
+        Block until every budget matching the request has a token
+        :param service: e.g. compute
+        :param endpoint: '<service> <host>'
+        :param method: HTTP verb
+        :param priority: interactive|normal|bulk, from the verb and priority() by default
+        :raise RateLimited: when a token is further away than max_wait
+        """
+        reserve = RESERVES[priority or current_priority(method)]
+        deadline = time.time() + self.max_wait
+        for rule in self._rules(service, method):
+            rate, burst = self.budgets[rule]
+            key = '%s %s|%s' % (rule[0], rule[1], endpoint)
+            self._count(rule, 'requests')
+            waited = 0.0
+            while True:
+                wait = self._state.take(key, rate, burst, reserve)
+                if not wait:
+                    break
+                if time.time() + wait > deadline:
+                    self._count(rule, 'rejected')
+                    raise RateLimited("Client rate limit of %s %s on %s" % (rule[0], rule[1], endpoint),
+                                      endpoint=endpoint, retry_after=wait)
+                time.sleep(wait)
+                waited += wait
+            if waited:
+                self._count(rule, 'waits')
+                self._count(rule, 'waited', waited)
+
+    def stats(self):
+        """
+        :return: dict '<service> <verb>' -> requests, waits, seconds waited and rejections
+        """
+        with self._lock:
+            return dict((key, dict(value)) for key, value in self._stats.items())
+
+
+# Process wide limiter, None disables rate limiting
+limiter = None
+
+
+def configure(budgets, path=None, max_wait=30.0):
+    """
+    Enable rate limiting for every handler, see RateLimiter
+    :return: RateLimiter
+    """
+    global limiter
+    limiter = RateLimiter(budgets, path=path, max_wait=max_wait)
+    return limiter
+
+
+def disable():
+    global limiter
+    limiter = None
+
+
+def install(connection):
+    """
+    Take a token from the current limiter before each request of a libcloud connection
+    :param connection: driver.connection
+    """
+    request = connection.request
+
+    def limited_request(action, *args, **kwargs):
+        if limiter is not None:
+            method = kwargs.get('method', args[3] if len(args) > 3 else 'GET').upper()
+            service = getattr(connection, 'service_type', None) or 'identity'
+            limiter.acquire(service, _endpoint(connection), method)
+        return request(action, *args, **kwargs)
+
+    connection.request = limited_request
@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compact records for listed resources.
+
+Records are built straight from API payloads and keep only the fields the
+handlers expose, instead of a libcloud object with its extra dict plus a
+parallel dict. to_dict() returns the same dict as the serializers module.
+See benchmarks/bench_records.py for the memory footprint.
+"""
+import hashlib
+
+from .timeutil import gmt_create
+
+_PUBLIC_LABELS = ('public', 'internet')
+# Provider.OPENSTACK
+_PROVIDER = 'openstack'
+
+_libcloud = None
+
+
+def _lib():
+    """
+    libcloud's state maps and helpers, imported on first use to keep the
+    package import light
+    """
+    global _libcloud
+    if _libcloud is None:
+        from libcloud.compute.drivers.openstack import OpenStackNodeDriver
+        from libcloud.compute.types import StorageVolumeState, VolumeSnapshotState
+        from libcloud.utils.networking import is_public_subnet
+        _libcloud = {
+            'volume_states': OpenStackNodeDriver.VOLUME_STATE_MAP,
+            'volume_unknown': StorageVolumeState.UNKNOWN,
+            'snapshot_states': OpenStackNodeDriver.SNAPSHOT_STATE_MAP,
+            'snapshot_unknown': VolumeSnapshotState.UNKNOWN,
+            'is_public_subnet': is_public_subnet,
+        }
+    return _libcloud
+
+
+def _uuid(obj_id):
+    # Same value as libcloud's UuidMixin for the OpenStack driver
+    return hashlib.sha1(('%s:%s' % (obj_id, _PROVIDER)).encode('utf-8')).hexdigest()
+
+
+def _split_ips(addresses):
+    public_ips, private_ips = [], []
+    is_public_subnet = _lib()['is_public_subnet']
+    for label, values in (addresses or {}).items():
+        for value in values:
+            ip = value['addr']
+            try:
+                public = is_public_subnet(ip)
+            except Exception:
+                # IPv6
+                public = label in _PUBLIC_LABELS or value.get('OS-EXT-IPS:type') == 'floating'
+            (public_ips if public else private_ips).append(ip)
+    return public_ips, private_ips
+
+
+def _volume_status(volume):
+    lib = _lib()
+    return lib['volume_states'].get(volume['status'], lib['volume_unknown'])
+
+
+def _snapshot_status(snapshot):
+    lib = _lib()
+    return lib['snapshot_states'].get(snapshot.get('status'), lib['snapshot_unknown'])
+
+
+class Record(object):
+    __slots__ = ()
+    # output key -> callable(API payload), used by project()
+    API_FIELDS = {}
+
+    @classmethod
+    def project(cls, payload, fields):
+        """
+        Build only some keys of to_dict() straight from an API payload
+        :param payload: API payload dict
+        :param fields: output keys
+        :return: dict
+        """
+        extract = cls.API_FIELDS
+        return dict((field, extract[field](payload)) for field in fields)
+
+    def __repr__(self):
+        return '<%s %s>' % (self.__class__.__name__, self.to_dict())
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, k) == getattr(other, k) for k in self.__slots__)
+
+    def __ne__(self, other):
+        return not self == other
+
+
+class NodeRecord(Record):
+    __slots__ = ('id', 'name', 'image_id', 'flavor_id', 'status', 'private_ips', 'public_ips',
+                 'gmt_create')
+
+    API_FIELDS = {
+        'instanceId': lambda server: server['id'],
+        'name': lambda server: server.get('name'),
+        'imageId': lambda server: (server.get('image') or {}).get('id'),
+        'flavorId': lambda server: (server.get('flavor') or {}).get('id'),
+        'status': lambda server: server.get('OS-EXT-STS:vm_state'),
+        'uuid': lambda server: _uuid(server['id']),
+        'privateIps': lambda server: _split_ips(server.get('addresses'))[1],
+        'publicIps': lambda server: _split_ips(server.get('addresses'))[0],
+        'gmtCreate': lambda server: gmt_create(server.get('created')),
+    }
+
+    def __init__(self, id, name, image_id, flavor_id, status, private_ips, public_ips, gmt_create):
+        self.id = id
+        self.name = name
+        self.image_id = image_id
+        self.flavor_id = flavor_id
+        self.status = status
+        self.private_ips = private_ips
+        self.public_ips = public_ips
+        self.gmt_create = gmt_create
+
+    @classmethod
+    def from_api(cls, server):
+        public_ips, private_ips = _split_ips(server.get('addresses'))
+        image = server.get('image') or {}
+        return cls(server['id'], server.get('name'), image.get('id'),
+                   (server.get('flavor') or {}).get('id'), server.get('OS-EXT-STS:vm_state'),
+                   private_ips, public_ips, gmt_create(server.get('created')))
+
+    def to_dict(self):
+        return {'instanceId': self.id, 'name': self.name, 'imageId': self.image_id,
+                'flavorId': self.flavor_id, 'status': self.status,
+                'uuid': _uuid(self.id), 'privateIps': self.private_ips, 'publicIps': self.public_ips,
+                'gmtCreate': self.gmt_create}
+
+
+class VolumeRecord(Record):
+    __slots__ = ('id', 'name', 'size', 'status', 'gmt_create')
+
+    API_FIELDS = {
+        'volumeId': lambda volume: volume['id'],
+        'name': lambda volume: volume.get('displayName', volume.get('name')),
+        'size': lambda volume: volume['size'],
+        'status': _volume_status,
+        'uuid': lambda volume: _uuid(volume['id']),
+        'gmtCreate': lambda volume: gmt_create(volume.get('created_at', volume.get('createdAt'))),
+    }
+
+    def __init__(self, id, name, size, status, gmt_create):
+        self.id = id
+        self.name = name
+        self.size = size
+        self.status = status
+        self.gmt_create = gmt_create
+
+    @classmethod
+    def from_api(cls, volume):
+        status = _volume_status(volume)
+        return cls(volume['id'], volume.get('displayName', volume.get('name')), volume['size'],
+                   status, gmt_create(volume.get('created_at', volume.get('createdAt'))))
+
+    def to_dict(self):
+        return {'volumeId': self.id, 'name': self.name, 'size': self.size, 'status': self.status,
+                'uuid': _uuid(self.id),
+                'gmtCreate': self.gmt_create}
+
+
+class SnapshotRecord(Record):
+    __slots__ = ('id', 'size', 'status', 'volume_id', 'gmt_create', 'remark', 'name')
+
+    API_FIELDS = {
+        'snapshotId': lambda snapshot: snapshot['id'],
+        'size': lambda snapshot: snapshot['size'],
+        'status': _snapshot_status,
+        'volumeId': lambda snapshot: snapshot.get('volume_id', snapshot.get('volumeId')),
+        'gmtCreate': lambda snapshot: gmt_create(snapshot.get('created_at', snapshot.get('createdAt'))),
+        'remark': lambda snapshot: snapshot.get('description', snapshot.get(
+            'display_description', snapshot.get('displayDescription'))),
+        'name': lambda snapshot: snapshot.get('name', snapshot.get('display_name',
+                                                                   snapshot.get('displayName'))),
+    }
+
+    def __init__(self, id, size, status, volume_id, gmt_create, remark, name):
+        self.id = id
+        self.size = size
+        self.status = status
+        self.volume_id = volume_id
+        self.gmt_create = gmt_create
+        self.remark = remark
+        self.name = name
+
+    @classmethod
+    def from_api(cls, snapshot):
+        status = _snapshot_status(snapshot)
+        name = snapshot.get('name', snapshot.get('display_name', snapshot.get('displayName')))
+        remark = snapshot.get('description', snapshot.get('display_description',
+                                                          snapshot.get('displayDescription')))
+        return cls(snapshot['id'], snapshot['size'], status,
+                   snapshot.get('volume_id', snapshot.get('volumeId')),
+                   gmt_create(snapshot.get('created_at', snapshot.get('createdAt'))), remark, name)
+
+    def to_dict(self, volume_names=None):
+        d = {'snapshotId': self.id, 'size': self.size, 'status': self.status,
+             'volumeId': self.volume_id}
+        if volume_names is not None:
+            d['volumeName'] = volume_names.get(self.volume_id)
+        d['gmtCreate'] = self.gmt_create
+        d['remark'] = self.remark
+        d['name'] = self.name
+        return d
+
+
+class ImageRecord(Record):
+    __slots__ = ('id', 'name', 'status', 'gmt_create')
+    API_FIELDS = {
+        'imageId': lambda image: image['id'],
+        'name': lambda image: image['name'],
+        'uuid': lambda image: _uuid(image['id']),
+        'status': lambda image: image['status'],
+        'gmtCreate': lambda image: gmt_create(image.get('created_at') or image.get('created')),
+    }
+
+    def __init__(self, id, name, status, gmt_create):
+        self.id = id
+        self.name = name
+        self.status = status
+        self.gmt_create = gmt_create
+
+    @classmethod
+    def from_api(cls, image):
+        return cls(image['id'], image['name'], image['status'],
+                   gmt_create(image.get('created_at') or image.get('created')))
+
+    def to_dict(self):
+        return {'imageId': self.id, 'name': self.name, 'uuid': _uuid(self.id),
+                'status': self.status,
+                'gmtCreate': self.gmt_create}
+
+
+class FlavorRecord(Record):
+    __slots__ = ('id', 'name', 'ram', 'vcpus', 'disk')
+    API_FIELDS = {
+        'flavorId': lambda flavor: flavor['id'],
+        'name': lambda flavor: flavor['name'],
+        'memory': lambda flavor: flavor['ram'],
+        'uuid': lambda flavor: _uuid(flavor['id']),
+        'cpu': lambda flavor: flavor['vcpus'],
+        'disk': lambda flavor: flavor['disk'],
+    }
+
+    def __init__(self, id, name, ram, vcpus, disk):
+        self.id = id
+        self.name = name
+        self.ram = ram
+        self.vcpus = vcpus
+        self.disk = disk
+
+    @classmethod
+    def from_api(cls, flavor):
+        return cls(flavor['id'], flavor['name'], flavor['ram'], flavor['vcpus'], flavor['disk'])
+
+    def to_dict(self):
+        return {'flavorId': self.id, 'name': self.name, 'memory': self.ram,
+                'uuid': _uuid(self.id), 'cpu': self.vcpus, 'disk': self.disk}
+
+
+class NetworkRecord(Record):
+    __slots__ = ('id', 'name', 'cidr')
+
+    def __init__(self, id, name, cidr):
+        self.id = id
+        self.name = name
+        self.cidr = cidr
+
+    @classmethod
+    def from_api(cls, network):
+        return cls(network['id'], network.get('label', network.get('name')), network.get('cidr'))
+
+    def to_dict(self):
+        return {'networkId': self.id, 'name': self.name, 'cidr': self.cidr}
+
+
+def size_from_api(driver, flavor):
+    """
+    libcloud NodeSize for a flavor payload, as the driver's _to_size() builds
+    it minus the pricing lookup: OpenStack has no pricing entry and libcloud
+    re-reads its whole pricing file on every miss
+    :param driver: SharedDriver or libcloud driver
+    :param flavor: /flavors payload
+    :return: OpenStackNodeSize
+    """
+    from libcloud.compute.drivers.openstack import OpenStackNodeSize
+    extra = dict(flavor.get('OS-FLV-WITH-EXT-SPECS:extra_specs') or {})
+    extra['disabled'] = flavor.get('OS-FLV-DISABLED:disabled', None)
+    return OpenStackNodeSize(id=flavor['id'], name=flavor['name'], ram=flavor['ram'], disk=flavor['disk'],
+                             vcpus=flavor['vcpus'], ephemeral_disk=flavor.get('OS-FLV-EXT-DATA:ephemeral', None),
+                             swap=flavor.get('swap'), extra=extra, bandwidth=None, price=0.0,
+                             driver=driver.connection.driver)
@@ -0,0 +1,307 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import calendar
+import inspect
+import threading
+import time
+
+from . import diskcache, instrumentation, ratelimit, resilience, tokencache
+
+
+class SharedDriver(object):
+    """
+    Driver proxy handed out by the registry.
+
+    Every thread gets its own libcloud driver (libcloud connections are not
+    thread safe) but all of them share one Keystone token, so a handler can
+    be created any number of times without re-authenticating. Drivers for
+    other regions of the same Keystone share that token too.
+    """
+
+    def __init__(self, entry, region=None):
+        self._entry = entry
+        self._region = region
+
+    @property
+    def key(self):
+        if self._region is None:
+            return self._entry.key
+        return self._entry.key + (self._region,)
+
+    def __getattr__(self, name):
+        value = getattr(self._entry.driver(self._region), name)
+        if instrumentation.sinks and not name.startswith('_') and inspect.ismethod(value):
+            return instrumentation.trace_driver(name, value)
+        return value
+
+
+class _DriverEntry(object):
+    """
+    Drivers and token state shared by one (username, tenant, url, api)
+    """
+
+    def __init__(self, registry, key, password):
+        self.key = key
+        self.password = password
+        self._registry = registry
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._osa = None
+        self._catalog = None
+        self._generation = 0
+        # Set once evicted or replaced, SharedDrivers still using it keep working
+        self.closed = False
+        self._margin = registry.refresh_margin
+        # Generations whose token came from the token cache
+        self._warm = set()
+        # Generations whose token Keystone gave no expiry for
+        self._untimed = set()
+
+    @property
+    def _cache_key(self):
+        username, tenant, url, api = self.key
+        return tokencache.cache_key(username, self.password, tenant, url, api)
+
+    def _auth_kwargs(self):
+        api = self.key[3]
+        if api == '2.0_apikey':
+            return {'auth_type': 'api_key'}
+        elif api == '2.0_password':
+            return {'auth_type': 'password'}
+        return {}
+
+    def _create(self, region):
+        username, tenant, url, api = self.key
+        kwargs = {'ex_force_service_region': region} if region else {}
+        driver = self._registry.driver_cls(username, self.password,
+                                           ex_tenant_name=tenant,
+                                           ex_force_auth_url=url,
+                                           ex_force_auth_version=api, **kwargs)
+        # Every attempt, retries included, takes a token from the rate limiter
+        ratelimit.install(driver.connection)
+        self._install_reauth(driver)
+        # Instrumentation outermost, so retries show up as attempts of one request
+        resilience.install(driver.connection)
+        # Listings answered from disk cost no rate limiter token and no retry
+        diskcache.install(driver.connection, tenant)
+        instrumentation.install(driver.connection)
+        with self._lock:
+            if self._osa is None:
+                self._osa = self._untimed_valid(driver.connection.get_auth_class())
+            else:
+                driver.connection._osa = self._osa
+        self._registry._count('connections')
+        return driver
+
+    def _expires_in(self):
+        expires = self._osa.auth_token_expires
+        if expires is None:
+            return None
+        return calendar.timegm(expires.utctimetuple()) - time.time()
+
+    @staticmethod
+    def _untimed_valid(osa):
+        """
+        libcloud treats a token without expiry as expired and authenticates
+        again on every request, keep it until a request gets a 401 instead
+        """
+        is_token_valid = osa.is_token_valid
+
+        def untimed_valid():
+            if osa.auth_token and osa.auth_token_expires is None:
+                return True
+            return is_token_valid()
+        osa.is_token_valid = untimed_valid
+        return osa
+
+    def _needs_auth(self):
+        if not self._osa.auth_token:
+            return True
+        remaining = self._expires_in()
+        # No expiry: valid until a request is refused, see _drop_token
+        return remaining is not None and remaining <= self._margin
+
+    def _authenticate(self):
+        with self._lock:
+            if not self._needs_auth():
+                return
+            cache = self._registry.token_cache
+            if self._osa.auth_token:
+                self._registry._count('refreshes')
+            elif cache is not None and cache.load(self._cache_key, self._osa, self._margin):
+                # Warm start: a previous process left a token still valid for a while
+                self._registry._count('warm_starts')
+                self._catalog = None
+                self._generation += 1
+                self._warm.add(self._generation)
+                return
+            self._osa.auth_token_expires = None
+            self._osa.authenticate(**self._auth_kwargs())
+            # Never refresh more often than every half token lifetime
+            lifetime = self._expires_in()
+            self._margin = self._registry.refresh_margin if lifetime is None else \
+                min(self._registry.refresh_margin, lifetime / 2.0)
+            self._catalog = None
+            self._generation += 1
+            if lifetime is None:
+                self._untimed.add(self._generation)
+            if cache is not None:
+                cache.store(self._cache_key, self._osa)
+
+    def _drop_token(self, generation):
+        """
+        A token we could not tell was still valid was rejected: a cached one
+        (revoked, or Keystone restarted) or one without expiry
+        :return: True when the request should be retried with a new token
+        """
+        with self._lock:
+            if generation not in self._warm and generation not in self._untimed:
+                return False
+            if generation == self._generation:
+                self._osa.auth_token = None
+                if self._registry.token_cache is not None:
+                    self._registry.token_cache.discard(self._cache_key)
+            return True
+
+    def _install_reauth(self, driver):
+        """
+        Retry a request once with a fresh token when a cached or untimed one is refused
+        """
+        conn = driver.connection
+        request = conn.request
+
+        def reauth_request(action, *args, **kwargs):
+            generation = getattr(conn, '_registry_generation', None)
+            try:
+                return request(action, *args, **kwargs)
+            except Exception as e:
+                code = getattr(e, 'code', None) or getattr(e, 'http_code', None)
+                if code != 401 or not self._drop_token(generation):
+                    raise
+            self._authenticate()
+            self._sync(driver)
+            return request(action, *args, **kwargs)
+
+        conn.request = reauth_request
+
+    def _sync(self, driver):
+        conn = driver.connection
+        if getattr(conn, '_registry_generation', None) == self._generation:
+            return
+        with self._lock:
+            if self._catalog is None:
+                from libcloud.common.openstack_identity import OpenStackServiceCatalog
+                self._catalog = OpenStackServiceCatalog(service_catalog=self._osa.urls,
+                                                        auth_version=self.key[3])
+            conn.auth_token = self._osa.auth_token
+            conn.auth_token_expires = self._osa.auth_token_expires
+            conn.auth_user_info = getattr(self._osa, 'auth_user_info', None)
+            conn.service_catalog = self._catalog
+            conn._registry_generation = self._generation
+
+    def driver(self, region=None):
+        drivers = getattr(self._local, 'drivers', None)
+        if drivers is None:
+            drivers = self._local.drivers = {}
+        driver = drivers.get(region)
+        if driver is None:
+            driver = drivers[region] = self._create(region)
+        if self._needs_auth():
+            self._authenticate()
+        self._sync(driver)
+        return driver
+
+    def close(self):
+        """
+        Release the connections, the token is kept for the SharedDrivers still
+        holding the entry
+        """
+        with self._lock:
+            self._local = threading.local()
+            self.closed = True
+
+
+class DriverRegistry(object):
+    """
+    Process wide registry of authenticated OpenStack drivers
+    """
+
+    def __init__(self, refresh_margin=300, driver_cls=None, token_cache=None):
+        """
+        :param refresh_margin: seconds before token expiry to re-authenticate
+        :param driver_cls: libcloud driver class, defaults to Provider.OPENSTACK
+        :param token_cache: tokencache.TokenCache, defaults to $OPENSTACK_HANDLER_TOKEN_CACHE
+        """
+        self.refresh_margin = refresh_margin
+        self.token_cache = token_cache if token_cache is not None else tokencache.from_env()
+        self._driver_cls = driver_cls
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._stats = {'hits': 0, 'misses': 0, 'connections': 0, 'refreshes': 0, 'warm_starts': 0}
+
+    @property
+    def driver_cls(self):
+        if self._driver_cls is None:
+            from libcloud.compute.providers import get_driver
+            from libcloud.compute.types import Provider
+            self._driver_cls = get_driver(Provider.OPENSTACK)
+        return self._driver_cls
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def acquire(self, username, password, tenant, url, api, region=None):
+        """
+        Get the shared driver for these credentials
+        :param username:
+        :param password:
+        :param tenant:
+        :param url:
+        :param api:
+        :param region: service region, None for the catalog's default
+        :return: SharedDriver
+        """
+        key = (username, tenant, url, api)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.password == password:
+                self._stats['hits'] += 1
+            else:
+                if entry is not None:
+                    entry.close()
+                entry = self._entries[key] = _DriverEntry(self, key, password)
+                self._stats['misses'] += 1
+        return SharedDriver(entry, region)
+
+    def evict(self, username, tenant, url, api):
+        """
+        Drop the shared driver for these credentials
+        :return: True|False
+        """
+        with self._lock:
+            entry = self._entries.pop((username, tenant, url, api), None)
+        if entry is None:
+            return False
+        entry.close()
+        return True
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.close()
+
+    def stats(self):
+        """
+        Reuse/miss counters
+        :return: dict
+        """
+        with self._lock:
+            d = dict(self._stats)
+            d['entries'] = len(self._entries)
+        return d
+
+
+registry = DriverRegistry()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Tenant overview in one call.
+
+Nodes, volumes, snapshots, images, sizes and networks are listed at the
+same time on the shared worker pool, through one registry entry (one token
+for every section). The results are then joined in memory:
+
+- nodes get their flavor's specs and their image's name
+- volumes get the number and total size of their snapshots
+- snapshots get their volume's name
+
+A section that fails or misses the deadline is reported in `sections` and
+left empty, the others are still returned.
+
+    TenantReport('admin', 'secret', 'admin', 'http://keystone:5000', '2.0_password').report()
+"""
+import time
+
+from .bulk import fan_out
+from .instrumentation import instrumented
+from .openstack_handler import OpenStackHandler
+from .records import NodeRecord, SnapshotRecord, VolumeRecord
+from .resilience import failure
+from .serializers import image_to_dict, network_to_dict, size_to_dict
+
+SECTIONS = ('nodes', 'volumes', 'snapshots', 'images', 'sizes', 'networks')
+
+
+@instrumented
+class TenantReport(OpenStackHandler):
+    """
+    Joined listing of every resource of the tenant
+    """
+
+    def __init__(self, username, password, tenant, url, api, page_size=1000, **kwargs):
+        """
+        :param page_size: items per listing request
+        """
+        self.page_size = page_size
+        super(TenantReport, self).__init__(username, password, tenant, url, api, **kwargs)
+
+    def _records(self, path, key, record):
+        return [record.from_api(item) for item in self._iter_pages(path, key, self.page_size)]
+
+    def _fetch(self, section):
+        if section == 'nodes':
+            return self._records('/servers/detail', 'servers', NodeRecord)
+        if section == 'volumes':
+            return self._records('/os-volumes', 'volumes', VolumeRecord)
+        if section == 'snapshots':
+            return self._records('/os-snapshots', 'snapshots', SnapshotRecord)
+        if section == 'images':
+            return self._cached('image', None, self.driver.list_images) or []
+        if section == 'sizes':
+            return self._flavors() or []
+        return self._cached('network', None, self.driver.ex_list_networks) or []
+
+    @staticmethod
+    def _join(data):
+        sizes = dict((size.id, size) for size in data.get('sizes') or ())
+        image_names = dict((image.id, image.name) for image in data.get('images') or ())
+        volume_names = dict((volume.id, volume.name) for volume in data.get('volumes') or ())
+        snapshot_stats = {}
+        for snapshot in data.get('snapshots') or ():
+            count, total = snapshot_stats.get(snapshot.volume_id, (0, 0))
+            snapshot_stats[snapshot.volume_id] = (count + 1, total + (snapshot.size or 0))
+
+        nodes = []
+        for record in data.get('nodes') or ():
+            node = record.to_dict()
+            size = sizes.get(record.flavor_id)
+            node['flavor'] = {'name': size.name, 'cpu': size.vcpus, 'memory': size.ram,
+                              'disk': size.disk} if size is not None else None
+            node['imageName'] = image_names.get(record.image_id)
+            nodes.append(node)
+
+        volumes = []
+        for record in data.get('volumes') or ():
+            volume = record.to_dict()
+            volume['snapshotCount'], volume['snapshotSize'] = snapshot_stats.get(record.id, (0, 0))
+            volumes.append(volume)
+
+        return {
+            'nodes': nodes,
+            'volumes': volumes,
+            'snapshots': [record.to_dict(volume_names) for record in data.get('snapshots') or ()],
+            'images': [image_to_dict(image) for image in data.get('images') or ()],
+            'sizes': [size_to_dict(size) for size in data.get('sizes') or ()],
+            'networks': [network_to_dict(network) for network in data.get('networks') or ()],
+        }
+
+    @staticmethod
+    def _summary(report):
+        statuses = {}
+        for node in report['nodes']:
+            statuses[node['status']] = statuses.get(node['status'], 0) + 1
+        return {
+            'counts': dict((section, len(report[section])) for section in SECTIONS),
+            'nodeStatuses': statuses,
+            'vcpus': sum(node['flavor']['cpu'] or 0 for node in report['nodes'] if node['flavor']),
+            'memory': sum(node['flavor']['memory'] or 0 for node in report['nodes'] if node['flavor']),
+            'volumeSize': sum(volume['size'] or 0 for volume in report['volumes']),
+            'snapshotSize': sum(volume['snapshotSize'] for volume in report['volumes']),
+        }
+
+    def report(self, sections=None, timeout=60):
+        """
+        Fetch and join the tenant's resources
+        :param sections: subset of SECTIONS, all of them by default
+        :param timeout: seconds to wait for the listings
+        :return: json {section: [...], 'summary': {...},
+                       'sections': {section: {'status', 'seconds', 'error', 'count'}},
+                       'timings': {'fetch', 'join', 'total'}}
+        """
+        sections = [s for s in SECTIONS if s in (sections or SECTIONS)]
+        try:
+            started = time.time()
+            outcome = fan_out(dict((section, lambda section=section: self._fetch(section))
+                                   for section in sections), timeout)
+            fetched = time.time()
+            report = self._join(dict((section, outcome[section][0]) for section in sections))
+            for section in SECTIONS:
+                if section not in sections:
+                    del report[section]
+            statuses = dict((section, outcome[section][1]) for section in sections)
+            joined = time.time()
+            if len(sections) == len(SECTIONS):
+                report['summary'] = self._summary(report)
+            report['sections'] = statuses
+            report['timings'] = {'fetch': round(fetched - started, 3), 'join': round(joined - fetched, 3),
+                                 'total': round(time.time() - started, 3)}
+            return self._dump(report)
+        except:
+            raise failure("Failed to build the tenant report")
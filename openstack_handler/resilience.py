@@ -0,0 +1,363 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Retries, circuit breakers and typed errors for OpenStack API calls.
+
+Every connection created by the registry sends its requests through
+install()'s wrapper:
+
+- failures are classified (throttled, conflict, unavailable, network, ...)
+- throttled requests (413/429) are retried whatever the verb, since the API
+  rejected them before doing anything; conflicts, 5xx and network errors are
+  only retried for idempotent verbs (GET, HEAD, PUT, DELETE)
+- the delay is exponential with full jitter and never shorter than the
+  server's Retry-After
+- one circuit breaker per endpoint opens after `threshold` consecutive
+  5xx/network failures and fails fast with CircuitOpen until `reset_timeout`
+  has passed, then lets a single trial request through
+
+Handler methods raise failure("Failed to ..."), an OpenStackError subclass
+matching the original error, which is kept as `cause` (and __cause__).
+"""
+import random
+import socket
+import sys
+import threading
+import time
+
+
+class OpenStackError(Exception):
+    """
+    Base of the handler errors
+    """
+
+    def __init__(self, message, cause=None, status=None, endpoint=None, retry_after=None):
+        super(OpenStackError, self).__init__(message)
+        self.cause = cause
+        self.status = status
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+        self.__cause__ = cause
+
+
+class BadRequest(OpenStackError):
+    """4xx not covered below"""
+
+
+class Unauthorized(OpenStackError):
+    """401/403"""
+
+
+class NotFound(OpenStackError):
+    """404"""
+
+
+class Conflict(OpenStackError):
+    """409, usually a resource busy in another task"""
+
+
+class RateLimited(OpenStackError):
+    """413/429, see retry_after"""
+
+
+class ServiceUnavailable(OpenStackError):
+    """5xx or the endpoint could not be reached"""
+
+
+class CircuitOpen(ServiceUnavailable):
+    """The endpoint failed repeatedly, calls fail fast for a while"""
+
+
+# classification -> error type
+ERRORS = {
+    'client': BadRequest,
+    'auth': Unauthorized,
+    'not_found': NotFound,
+    'conflict': Conflict,
+    'throttled': RateLimited,
+    'unavailable': ServiceUnavailable,
+    'server': ServiceUnavailable,
+    'network': ServiceUnavailable,
+}
+
+IDEMPOTENT = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS'])
+# Failures worth retrying, and for which verbs
+RETRY_ANY = frozenset(['throttled'])
+RETRY_IDEMPOTENT = frozenset(['conflict', 'unavailable', 'server', 'network'])
+# Failures that count against the endpoint's breaker
+TRIPS = frozenset(['unavailable', 'server', 'network'])
+
+
+_errors = None
+
+
+def _error_types():
+    """
+    libcloud and requests are only imported once a request has failed
+    :return: (http error type, network error types)
+    """
+    global _errors
+    if _errors is None:
+        from libcloud.common.exceptions import BaseHTTPError
+        network = [socket.error, socket.timeout]
+        try:
+            import requests
+            network.extend([requests.exceptions.ConnectionError, requests.exceptions.Timeout])
+        except ImportError:
+            pass
+        _errors = BaseHTTPError, tuple(network)
+    return _errors
+
+
+def classify(e):
+    """
+    :param e: exception raised by a driver or connection call
+    :return: client|auth|not_found|conflict|throttled|unavailable|server|network|circuit|unknown
+    """
+    if isinstance(e, OpenStackError):
+        for kind, cls in ERRORS.items():
+            if type(e) is cls:
+                return kind
+        return 'circuit' if isinstance(e, CircuitOpen) else 'unknown'
+    http_error, network_errors = _error_types()
+    if isinstance(e, http_error):
+        code = e.code
+        if code in (413, 429):
+            return 'throttled'
+        if code in (401, 403):
+            return 'auth'
+        if code == 404:
+            return 'not_found'
+        if code == 409:
+            return 'conflict'
+        if code in (502, 503, 504):
+            return 'unavailable'
+        if code is not None and 400 <= code < 500:
+            return 'client'
+        if code is not None and code >= 500:
+            return 'server'
+    if isinstance(e, network_errors):
+        return 'network'
+    return 'unknown'
+
+
+def retry_after(e):
+    """
+    :return: seconds from the error's Retry-After header, None when absent
+    """
+    value = getattr(e, 'retry_after', None)
+    if not value:
+        headers = getattr(e, 'headers', None) or {}
+        value = headers.get('retry-after')
+    try:
+        return float(value) if value else None
+    except (TypeError, ValueError):
+        return None
+
+
+def error_for(message, cause, endpoint=None):
+    """
+    Typed error for a failed call
+    :param message: e.g. "Failed to get nodes"
+    :param cause: original exception
+    :return: OpenStackError
+    """
+    if isinstance(cause, OpenStackError):
+        cls, status, endpoint = type(cause), cause.status, endpoint or cause.endpoint
+    else:
+        cls, status = ERRORS.get(classify(cause), OpenStackError), getattr(cause, 'code', None)
+    return cls(message, cause=cause, status=status, endpoint=endpoint, retry_after=retry_after(cause))
+
+
+def failure(message):
+    """
+    Typed error for the exception being handled:
+
+        except:
+            raise failure("Failed to get nodes")
+    """
+    return error_for(message, sys.exc_info()[1])
+
+
+class RetryPolicy(object):
+    """
+    When and how long to wait before retrying a failed request
+    """
+
+    def __init__(self, attempts=4, base=0.5, cap=20.0, max_retry_after=60.0, deadline=120.0):
+        """
+        :param attempts: tries per request including the first one, 1 disables retries
+        :param base: first backoff step in seconds
+        :param cap: longest backoff step
+        :param max_retry_after: give up when the server asks to wait longer than this
+        :param deadline: seconds a request may spend retrying in total
+        """
+        self.attempts = attempts
+        self.base = base
+        self.cap = cap
+        self.max_retry_after = max_retry_after
+        self.deadline = deadline
+
+    def delay(self, attempt, kind, method, e):
+        """
+        :param attempt: number of failed tries so far
+        :return: seconds to sleep, None when the request must not be retried
+        """
+        if attempt >= self.attempts:
+            return None
+        if kind not in RETRY_ANY and (kind not in RETRY_IDEMPOTENT or method not in IDEMPOTENT):
+            return None
+        # Full jitter keeps clients that failed together from retrying together
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** (attempt - 1)))
+        wait = retry_after(e)
+        if wait is not None:
+            if wait > self.max_retry_after:
+                return None
+            delay = max(delay, wait)
+        return delay
+
+
+class CircuitBreaker(object):
+    """
+    closed -> open after `threshold` consecutive failures -> half open after
+    `reset_timeout` seconds, where one trial request decides between the two
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self.state = 'closed'
+        self.failures = 0
+        self.opened = 0
+        self._trial = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == 'closed':
+                return True
+            if self.state == 'open' and time.time() - self.opened >= self.reset_timeout:
+                self.state = 'half_open'
+            if self.state == 'half_open' and not self._trial:
+                self._trial = True
+                return True
+            return False
+
+    def remaining(self):
+        return max(0.0, self.reset_timeout - (time.time() - self.opened))
+
+    def record(self, ok):
+        """
+        :param ok: True on success, False on an endpoint failure, None when
+                   the outcome says nothing about the endpoint's health
+        """
+        with self._lock:
+            self._trial = False
+            if ok is None:
+                return
+            if ok:
+                self.state = 'closed'
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.state == 'half_open' or self.failures >= self.threshold:
+                if self.state != 'open':
+                    _count('opened')
+                self.state = 'open'
+                self.opened = time.time()
+
+
+class Breakers(object):
+    """
+    One CircuitBreaker per endpoint
+    """
+
+    def __init__(self, threshold=5, reset_timeout=30.0):
+        """
+        :param threshold: consecutive failures opening a breaker, None disables breakers
+        :param reset_timeout: seconds an open breaker fails fast
+        """
+        self.threshold = threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._breakers = {}
+
+    def get(self, endpoint):
+        with self._lock:
+            breaker = self._breakers.get(endpoint)
+            if breaker is None:
+                breaker = self._breakers[endpoint] = CircuitBreaker(self.threshold, self.reset_timeout)
+            return breaker
+
+    def states(self):
+        with self._lock:
+            return dict((endpoint, breaker.state) for endpoint, breaker in self._breakers.items())
+
+    def clear(self):
+        with self._lock:
+            self._breakers = {}
+
+
+policy = RetryPolicy()
+breakers = Breakers()
+
+_lock = threading.Lock()
+_stats = {'retries': 0, 'opened': 0, 'rejected': 0}
+
+
+def _count(name):
+    with _lock:
+        _stats[name] += 1
+
+
+def stats():
+    """
+    :return: dict with retries, breakers opened and calls rejected by open breakers
+    """
+    with _lock:
+        return dict(_stats)
+
+
+def _endpoint(connection):
+    return '%s %s' % (getattr(connection, 'service_type', None) or 'identity', connection.host)
+
+
+def install(connection):
+    """
+    Route a libcloud connection's requests through the retry policy and the
+    endpoint's circuit breaker
+    :param connection: driver.connection
+    """
+    request = connection.request
+
+    def resilient_request(action, *args, **kwargs):
+        if policy is None:
+            return request(action, *args, **kwargs)
+        method = kwargs.get('method', args[3] if len(args) > 3 else 'GET')
+        endpoint = _endpoint(connection)
+        breaker = breakers.get(endpoint) if breakers.threshold else None
+        deadline = time.time() + policy.deadline
+        attempt = 0
+        while True:
+            if breaker is not None and not breaker.allow():
+                _count('rejected')
+                raise CircuitOpen("%s is failing, retry in %.0fs" % (endpoint, breaker.remaining()),
+                                  endpoint=endpoint, retry_after=breaker.remaining())
+            attempt += 1
+            try:
+                response = request(action, *args, **kwargs)
+            except Exception as e:
+                kind = classify(e)
+                if breaker is not None:
+                    breaker.record(False if kind in TRIPS else (None if kind in RETRY_ANY else True))
+                delay = policy.delay(attempt, kind, method, e)
+                if delay is None or time.time() + delay > deadline:
+                    raise
+                _count('retries')
+                time.sleep(delay)
+                continue
+            if breaker is not None:
+                breaker.record(True)
+            return response
+
+    connection.request = resilient_request
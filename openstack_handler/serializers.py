@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Resource -> dict builders and output encoders shared by every handler.
+
+Handlers return encode(obj, handler.output):
+
+- 'json'    str from the stdlib encoder (default)
+- 'dict'    the native dicts/lists, no encoding at all
+- 'orjson'  bytes from orjson
+- 'msgpack' bytes from msgpack
+- 'fastest' str from orjson when installed, from stdlib json otherwise
+
+An unknown format is rejected when the handler is created, see check_output().
+"""
+import importlib
+import json
+
+from .timeutil import gmt_create
+
+# Optional encoders, imported on first use to keep the package import light
+_encoders = {}
+
+FORMATS = ('json', 'dict', 'orjson', 'msgpack', 'fastest')
+
+
+def node_to_dict(node):
+    return {'instanceId': node.id, 'name': node.name, 'imageId': node.extra.get('imageId'),
+            'flavorId': node.extra.get("flavorId"), 'status': node.extra.get("vm_state"),
+            'uuid': node.uuid, 'privateIps': node.private_ips, 'publicIps': node.public_ips,
+            'gmtCreate': gmt_create(node.extra.get('created'))}
+
+
+def updated_node_to_dict(node):
+    return {'instanceId': node.id, 'name': node.name, 'imageId': node.image, 'size': node.size,
+            'status': node.state, 'uuid': node.uuid, 'privateIps': node.private_ips,
+            'publicIps': node.public_ips}
+
+
+def volume_to_dict(volume):
+    return {'volumeId': volume.id, 'name': volume.name, 'size': volume.size, 'status': volume.state,
+            'uuid': volume.uuid,
+            'gmtCreate': gmt_create(volume.extra.get('created_at'))}
+
+
+def snapshot_to_dict(snapshot, volume_names=None):
+    """
+    :param snapshot:
+    :param volume_names: volume id -> name, adds 'volumeName' when given
+    :return: dict
+    """
+    volume_id = snapshot.extra.get('volume_id')
+    d = {'snapshotId': snapshot.id, 'size': snapshot.size, 'status': snapshot.state,
+         'volumeId': volume_id}
+    if volume_names is not None:
+        d['volumeName'] = volume_names.get(volume_id)
+    d['gmtCreate'] = gmt_create(snapshot.extra.get('created'))
+    d['remark'] = snapshot.extra.get('description')
+    d['name'] = snapshot.extra.get('name')
+    return d
+
+
+def image_to_dict(image):
+    return {'imageId': image.id, 'name': image.name, 'uuid': image.uuid,
+            'status': image.extra.get('status'),
+            'gmtCreate': gmt_create(image.extra.get('created'))}
+
+
+def size_to_dict(size):
+    return {'flavorId': size.id, 'name': size.name, 'memory': size.ram,
+            'uuid': size.uuid, 'cpu': size.vcpus, 'disk': size.disk}
+
+
+def network_to_dict(network):
+    return {'networkId': network.id, 'name': network.name, 'cidr': network.cidr}
+
+
+def _encoder(name):
+    """
+    :param name: orjson|msgpack
+    :return: the module, None when it is not installed
+    """
+    try:
+        return _encoders[name]
+    except KeyError:
+        pass
+    try:
+        module = importlib.import_module(name)
+    except ImportError:
+        module = None
+    _encoders[name] = module
+    return module
+
+
+def check_output(output):
+    """
+    :raise ValueError: output is not one of FORMATS
+    """
+    if output not in FORMATS:
+        raise ValueError("Unknown output format: %s, expected one of %s" % (output, ', '.join(FORMATS)))
+
+
+def encode(obj, output='json'):
+    """
+    Encode a handler result
+    :param obj: dict/list built by the *_to_dict functions
+    :param output: one of FORMATS
+    :return: str|bytes|dict|list
+    """
+    if output == 'json':
+        return json.dumps(obj)
+    elif output == 'dict':
+        return obj
+    elif output == 'fastest':
+        orjson = _encoder('orjson')
+        return orjson.dumps(obj).decode('utf-8') if orjson is not None else json.dumps(obj)
+    elif output == 'orjson':
+        orjson = _encoder('orjson')
+        if orjson is None:
+            raise ValueError("orjson is not installed")
+        return orjson.dumps(obj)
+    elif output == 'msgpack':
+        msgpack = _encoder('msgpack')
+        if msgpack is None:
+            raise ValueError("msgpack is not installed")
+        return msgpack.packb(obj, use_bin_type=True)
+    raise ValueError("Unknown output format: %s" % output)
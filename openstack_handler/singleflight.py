@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Single-flight coalescing of identical reads.
+
+When threads make the same read at the same time (same connection, handler
+method, arguments and output format), the first one makes the call and the
+others wait for its result instead of sending the same request again.
+With a reuse window the result is also handed to identical calls made
+shortly after it completed. Errors are shared the same way.
+
+Followers get the very object the first caller got, which matters only for
+output='dict': the dicts must be treated as read only.
+"""
+import functools
+import threading
+import time
+
+
+class _Flight(object):
+    __slots__ = ('done', 'value', 'error', 'finished')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        self.finished = None
+
+
+class SingleFlight(object):
+    """
+    In flight calls by key
+    """
+
+    def __init__(self, enabled=True, reuse=0.0):
+        """
+        :param enabled: False makes every call run on its own
+        :param reuse: seconds a completed result keeps answering identical calls
+        """
+        self.enabled = enabled
+        self.reuse = reuse
+        self._lock = threading.Lock()
+        self._flights = {}
+        self._stats = {'leaders': 0, 'shared': 0, 'reused': 0}
+
+    def configure(self, enabled=None, reuse=None):
+        with self._lock:
+            if enabled is not None:
+                self.enabled = enabled
+            if reuse is not None:
+                self.reuse = reuse
+            self._flights = {}
+
+    def do(self, key, func):
+        """
+        :param key: hashable identity of the call
+        :param func: callable making the call
+        :return: func()'s result, possibly from a concurrent identical call
+        """
+        if not self.enabled:
+            return func()
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None and flight.finished is not None \
+                    and time.time() - flight.finished > self.reuse:
+                flight = None
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+                self._stats['leaders'] += 1
+            else:
+                leader = False
+                self._stats['reused' if flight.finished is not None else 'shared'] += 1
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+        try:
+            flight.value = func()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                flight.finished = time.time()
+                # Failed calls are never reused
+                if flight.error is not None or self.reuse <= 0:
+                    if self._flights.get(key) is flight:
+                        del self._flights[key]
+                elif len(self._flights) > 1024:
+                    self._prune(flight.finished)
+            flight.done.set()
+        return flight.value
+
+    def _prune(self, now):
+        for key, flight in list(self._flights.items()):
+            if flight.finished is not None and now - flight.finished > self.reuse:
+                del self._flights[key]
+
+    def stats(self):
+        """
+        :return: dict with leaders (misses), shared and reused (hits), hits, misses and inflight
+        """
+        with self._lock:
+            d = dict(self._stats)
+            d['inflight'] = sum(1 for f in self._flights.values() if f.finished is None)
+        d['hits'] = d['shared'] + d['reused']
+        d['misses'] = d['leaders']
+        return d
+
+    def reset(self):
+        with self._lock:
+            self._stats = dict((k, 0) for k in self._stats)
+
+
+flights = SingleFlight()
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    return value
+
+
+def coalesced(method):
+    """
+    Handler method decorator: identical concurrent calls share one call
+    """
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not flights.enabled:
+            return method(self, *args, **kwargs)
+        try:
+            key = (self.driver.key, self.__class__.__name__, method.__name__, self.output,
+                   _freeze(args), _freeze(kwargs))
+            hash(key)
+        except TypeError:
+            return method(self, *args, **kwargs)
+        return flights.do(key, lambda: method(self, *args, **kwargs))
+    return wrapper
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Incremental encoders for the iter_* listing generators.
+
+    with open('nodes.json', 'w') as fp:
+        write_json_array(node.iter_nodes(), fp)
+"""
+import io
+import json
+
+# Bytes buffered before a write to the file/socket
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_json_array(records, dumps=json.dumps):
+    """
+    Encode records as one JSON array, chunk by chunk
+    :param records: iterable of dicts
+    :param dumps: record encoder
+    :return: generator of str
+    """
+    yield '['
+    first = True
+    for record in records:
+        if first:
+            first = False
+            yield dumps(record)
+        else:
+            yield ', ' + dumps(record)
+    yield ']'
+
+
+def iter_ndjson(records, dumps=json.dumps):
+    """
+    Encode records as newline delimited JSON
+    :param records: iterable of dicts
+    :param dumps: record encoder
+    :return: generator of str
+    """
+    for record in records:
+        yield dumps(record) + '\n'
+
+
+def _binary(fp):
+    if hasattr(fp, 'sendall') or isinstance(fp, (io.RawIOBase, io.BufferedIOBase)):
+        return True
+    return 'b' in getattr(fp, 'mode', '')
+
+
+def write_chunks(chunks, fp, chunk_size=CHUNK_SIZE):
+    """
+    Write encoded chunks to a file or socket in buffered writes
+    :param chunks: iterable of str
+    :param fp: text/binary file object or socket
+    :param chunk_size: bytes buffered per write
+    :return: number of characters written
+    """
+    write = fp.sendall if hasattr(fp, 'sendall') else fp.write
+    binary = _binary(fp)
+    buf, size, total = [], 0, 0
+    for chunk in chunks:
+        buf.append(chunk)
+        size += len(chunk)
+        if size >= chunk_size:
+            data = ''.join(buf)
+            write(data.encode('utf-8') if binary else data)
+            total += size
+            buf, size = [], 0
+    if buf:
+        data = ''.join(buf)
+        write(data.encode('utf-8') if binary else data)
+        total += size
+    return total
+
+
+def write_json_array(records, fp, dumps=json.dumps):
+    return write_chunks(iter_json_array(records, dumps), fp)
+
+
+def write_ndjson(records, fp, dumps=json.dumps):
+    return write_chunks(iter_ndjson(records, dumps), fp)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import calendar
+import re
+from datetime import datetime, timedelta
+
+_ISO = re.compile(r'^(\d{4}-\d\d-\d\d)[T ](\d\d:\d\d:\d\d)(?:\.\d+)?(Z|[+-]\d\d:?\d\d)?$')
+_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Bound on memoized values, the memo is simply reset when full
+MEMO_SIZE = 65536
+_memo = {}
+
+
+def _parse_offset(date, clock, offset):
+    sign = -1 if offset[0] == '-' else 1
+    offset = offset[1:].replace(':', '')
+    delta = timedelta(hours=int(offset[:2]), minutes=int(offset[2:]))
+    return datetime.strptime(date + ' ' + clock, _FORMAT) - sign * delta
+
+
+def _valid(date, clock):
+    # The regex only checks digits, datetime would reject these
+    year, month, day = int(date[:4]), int(date[5:7]), int(date[8:10])
+    if year < 1 or not 1 <= month <= 12 or day < 1:
+        return False
+    if day > 28 and day > calendar.monthrange(year, month)[1]:
+        return False
+    return int(clock[:2]) < 24 and int(clock[3:5]) < 60 and int(clock[6:8]) < 60
+
+
+def _parse(value):
+    match = _ISO.match(value)
+    if match is not None:
+        date, clock, offset = match.groups()
+        if not _valid(date, clock):
+            return None
+        if offset is None or offset == 'Z' or offset.replace(':', '')[1:] == '0000':
+            # Already UTC: no datetime needed, just drop 'T', fraction and zone
+            return date + ' ' + clock
+        return _parse_offset(date, clock, offset).strftime(_FORMAT)
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except (AttributeError, ValueError):
+        return None
+    return to_gmt(parsed)
+
+
+def to_gmt(value):
+    """
+    Format a datetime as UTC 'YYYY-MM-DD HH:MM:SS'
+    :param value: naive (assumed UTC) or aware datetime
+    :return: str
+    """
+    if value.tzinfo is not None and value.utcoffset() is not None:
+        value = value.replace(tzinfo=None) - value.utcoffset()
+    return value.strftime(_FORMAT)
+
+
+def gmt_create(value):
+    """
+    Normalize an OpenStack created/created_at value to the gmtCreate format
+    ('YYYY-MM-DD HH:MM:SS', UTC). Accepts ISO-8601 with or without fraction,
+    'Z' or a numeric offset, as well as datetime objects.
+    :param value: str|datetime|None
+    :return: str or None when missing/unparseable
+    """
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return to_gmt(value)
+    result = _memo.get(value)
+    if result is None:
+        result = _parse(value)
+        if len(_memo) >= MEMO_SIZE:
+            _memo.clear()
+        _memo[value] = result
+    return result
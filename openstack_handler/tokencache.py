@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Keystone tokens persisted in a local JSON file, so a new process (a CLI
+call, a freshly forked worker) can reuse a still valid token and service
+catalog instead of authenticating again.
+
+Entries are keyed by a hash of the credentials, the file is only readable by
+its owner and is replaced atomically on every write.
+"""
+import calendar
+import hashlib
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+try:
+    from datetime import timezone
+    _UTC = timezone.utc
+except ImportError:
+    _UTC = None
+
+# Environment variable naming the default cache file
+ENV = 'OPENSTACK_HANDLER_TOKEN_CACHE'
+
+
+def cache_key(username, password, tenant, url, api):
+    return hashlib.sha256('\0'.join([username, password, tenant or '', url, api]).encode('utf-8')).hexdigest()
+
+
+class TokenCache(object):
+    """
+    File backed token store
+    """
+
+    def __init__(self, path):
+        self.path = os.path.expanduser(path)
+
+    def _read(self):
+        try:
+            with open(self.path) as fp:
+                return json.load(fp)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _write(self, entries):
+        directory = os.path.dirname(self.path) or '.'
+        if not os.path.isdir(directory):
+            os.makedirs(directory, 0o700)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.tokens')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                json.dump(entries, fp)
+            os.chmod(tmp, 0o600)
+            os.rename(tmp, self.path)
+        except Exception:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def load(self, key, osa, margin=0):
+        """
+        Put a cached token on a libcloud identity connection
+        :param key: cache_key()
+        :param osa: OpenStackIdentityConnection
+        :param margin: seconds the token must still be valid for
+        :return: True when a token was restored
+        """
+        entry = self._read().get(key)
+        if not entry or entry['expires'] - time.time() <= margin:
+            return False
+        osa.auth_token = entry['token']
+        osa.auth_token_expires = datetime.fromtimestamp(entry['expires'], _UTC) if _UTC else \
+            datetime.utcfromtimestamp(entry['expires'])
+        osa.urls = entry['urls']
+        osa.auth_user_info = entry.get('user')
+        osa.auth_user_roles = entry.get('roles')
+        return True
+
+    def store(self, key, osa):
+        """
+        Persist the token of an authenticated identity connection
+        """
+        if not osa.auth_token or osa.auth_token_expires is None:
+            return
+        now = time.time()
+        entries = dict((k, v) for k, v in self._read().items() if v.get('expires', 0) > now)
+        entries[key] = {'token': osa.auth_token,
+                        'expires': calendar.timegm(osa.auth_token_expires.utctimetuple()),
+                        'urls': osa.urls, 'user': osa.auth_user_info,
+                        'roles': getattr(osa, 'auth_user_roles', None)}
+        try:
+            self._write(entries)
+        except (IOError, OSError, TypeError, ValueError):
+            # A cache that cannot be written only costs a later authentication
+            pass
+
+    def discard(self, key):
+        entries = self._read()
+        if entries.pop(key, None) is not None:
+            try:
+                self._write(entries)
+            except (IOError, OSError):
+                pass
+
+
+def from_env():
+    """
+    :return: TokenCache for $OPENSTACK_HANDLER_TOKEN_CACHE, None when unset
+    """
+    path = os.environ.get(ENV)
+    return TokenCache(path) if path else None
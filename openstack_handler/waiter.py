@@ -0,0 +1,185 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+
+
+class WaitTimeout(Exception):
+    """
+    The resource did not reach the target state in time
+    """
+
+
+class _Pending(object):
+    __slots__ = ('targets', 'errors', 'future', 'deadline')
+
+    def __init__(self, targets, errors, future, deadline):
+        self.targets = targets
+        self.errors = errors
+        self.future = future
+        self.deadline = deadline
+
+
+class Waiter(object):
+    """
+    Waits for many resources at once.
+
+    A single poller thread asks for the state of every pending resource with
+    one list call per interval, backs off exponentially (with jitter) while
+    nothing changes and resolves each resource's future once it reaches a
+    target or error state.
+    """
+
+    # Allow for clock skew between us and the API when asking for deltas
+    SKEW = 60
+
+    def __init__(self, fetch, interval=1.0, max_interval=15.0, jitter=0.2):
+        """
+        :param fetch: callable(ids, changes_since) -> {id: status}; changes_since
+                      is an ISO timestamp the listing may be filtered with, or None
+        :param interval: first poll interval in seconds
+        :param max_interval: upper bound of the backoff
+        :param jitter: +/- fraction applied to every interval
+        """
+        self._fetch = fetch
+        self.interval = interval
+        self.max_interval = max_interval
+        self.jitter = jitter
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._pending = {}
+        self._unseen = set()
+        self._since = None
+        self._thread = None
+        self.polls = 0
+
+    def submit(self, ids, targets, errors=('ERROR', 'error'), timeout=600, callback=None):
+        """
+        Start waiting for resources
+        :param ids: resource ids
+        :param targets: states that complete the wait
+        :param errors: states that end the wait as failed
+        :param timeout: seconds before the future fails with WaitTimeout
+        :param callback: callable(id, status_or_exception) run on completion
+        :return: dict id -> Future resolving to the final status
+        """
+        from concurrent.futures import Future
+        futures = {}
+        deadline = time.time() + timeout
+        since = (datetime.utcnow() - timedelta(seconds=self.SKEW)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        with self._lock:
+            for obj_id in ids:
+                future = Future()
+                if callback is not None:
+                    future.add_done_callback(self._done_callback(obj_id, callback))
+                self._pending.setdefault(obj_id, []).append(
+                    _Pending(frozenset(targets), frozenset(errors), future, deadline))
+                self._unseen.add(obj_id)
+                futures[obj_id] = future
+            if self._since is None or since < self._since:
+                self._since = since
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='openstack-waiter')
+                self._thread.daemon = True
+                self._thread.start()
+        self._wakeup.set()
+        return futures
+
+    @staticmethod
+    def _done_callback(obj_id, callback):
+        def done(future):
+            error = future.exception()
+            callback(obj_id, error if error is not None else future.result())
+        return done
+
+    def _resolve(self, states):
+        changed = False
+        now = time.time()
+        with self._lock:
+            for obj_id in list(self._pending):
+                status = states.get(obj_id)
+                if status is not None:
+                    self._unseen.discard(obj_id)
+                waiting = []
+                for pending in self._pending[obj_id]:
+                    if status in pending.targets or status in pending.errors:
+                        pending.future.set_result(status)
+                        changed = True
+                    elif pending.deadline < now:
+                        pending.future.set_exception(WaitTimeout("%s did not reach %s" % (
+                            obj_id, '/'.join(sorted(pending.targets)))))
+                        changed = True
+                    else:
+                        waiting.append(pending)
+                if waiting:
+                    self._pending[obj_id] = waiting
+                else:
+                    del self._pending[obj_id]
+                    self._unseen.discard(obj_id)
+        return changed
+
+    def _run(self):
+        interval = self.interval
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    self._since = None
+                    return
+                ids = list(self._pending)
+                since = self._since
+                unseen = bool(self._unseen)
+            # Cleared before polling, so ids submitted during the poll wake the next one
+            self._wakeup.clear()
+            started = (datetime.utcnow() - timedelta(seconds=self.SKEW)).strftime('%Y-%m-%dT%H:%M:%SZ')
+            try:
+                # Resources never reported yet may be unchanged for long, list them in full
+                states = self._fetch(ids, None if unseen else since)
+                self.polls += 1
+                with self._lock:
+                    self._since = started
+            except Exception:
+                states = {}
+            if self._resolve(states):
+                interval = self.interval
+            else:
+                interval = min(interval * 2, self.max_interval)
+            self._wakeup.wait(interval * random.uniform(1 - self.jitter, 1 + self.jitter))
+            if self._wakeup.is_set():
+                interval = self.interval
+
+
+_lock = threading.Lock()
+_waiters = {}
+
+
+def get_waiter(scope, resource, fetch):
+    """
+    Process wide waiter for one connection scope and resource type
+    :param scope: SharedDriver.key
+    :param resource: node|volume
+    :param fetch: see Waiter
+    :return: Waiter
+    """
+    with _lock:
+        waiter = _waiters.get((scope, resource))
+        if waiter is None:
+            waiter = _waiters[(scope, resource)] = Waiter(fetch)
+        return waiter
+
+
+def wait_all(futures):
+    """
+    Block on futures returned by Waiter.submit
+    :param futures: dict id -> Future
+    :return: dict id -> final status, None for timed out resources
+    """
+    result = {}
+    for obj_id, future in futures.items():
+        try:
+            result[obj_id] = future.result()
+        except WaitTimeout:
+            result[obj_id] = None
+    return result
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+"""
+Fixtures running the handlers against the local stub in benchmarks/
+"""
+import os
+import sys
+
+import pytest
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+sys.path.insert(0, os.path.join(HERE, '..', 'benchmarks'))
+
+from mock_openstack import Dataset, MockOpenStack  # noqa: E402
+
+from openstack_handler.cache import catalog_cache, node_cache  # noqa: E402
+from openstack_handler.registry import registry  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    catalog_cache.clear()
+    node_cache.clear()
+    yield
+    registry.clear()
+
+
+@pytest.fixture
+def dataset():
+    return Dataset(nodes=10, volumes=10, snapshots=10, images=10, flavors=10, networks=3)
+
+
+@pytest.fixture
+def server(dataset):
+    with MockOpenStack(dataset) as srv:
+        yield srv
+
+
+@pytest.fixture
+def credentials(server):
+    """
+    Positional handler arguments for the stub
+    """
+    return ('admin', 'password', 'admin', server.url, '2.0_password')
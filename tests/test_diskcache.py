@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+
+import pytest
+
+from openstack_handler import diskcache
+from openstack_handler.cache import catalog_cache
+from openstack_handler.openstack_handler import Image
+
+
+@pytest.fixture
+def disk(tmpdir):
+    yield diskcache.configure(os.path.join(str(tmpdir), 'responses.db'), max_age={'image': 0})
+    diskcache.disable()
+
+
+def images(server):
+    catalog_cache.clear()
+    return json.loads(Image('admin', 'password', 'admin', server.url, '2.0_password').images())
+
+
+def test_changes_since_merge(server, dataset, disk):
+    assert len(images(server)) == len(dataset.images)
+    dataset.images[0]['name'] = 'renamed'
+    dataset.images[0]['updated'] = '2100-01-01T00:00:00Z'
+    assert 'renamed' in [i['name'] for i in images(server)]
+    assert disk.stats()['merged'] == 1
+
+
+def test_full_download_finds_deleted_images(server, dataset, disk):
+    images(server)
+    # changes-since does not report a deleted image
+    dataset.images.pop()
+    assert len(images(server)) == len(dataset.images) + 1
+    disk.full_interval = 0
+    assert len(images(server)) == len(dataset.images)
+    assert [q for m, p, q in server.requests if p.endswith('/images/detail')][-1] == {}
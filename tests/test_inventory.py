@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+from mock_openstack import MockOpenStack
+
+from openstack_handler.inventory import Inventory
+
+
+@pytest.fixture
+def inventory(credentials):
+    inv = Inventory(*credentials)
+    yield inv
+    inv.close()
+
+
+def test_count(inventory, dataset):
+    volume_id = dataset.volumes[0]['id']
+    expected = len([s for s in dataset.snapshots if s['volumeId'] == volume_id])
+    assert expected > 0
+    assert inventory.count('node') == len(dataset.servers)
+    assert inventory.count('node', status='active') == len(dataset.servers)
+    assert inventory.count('node', status='error') == 0
+    assert inventory.count('snapshot', volume_id=volume_id) == expected
+    assert inventory.count('snapshot', status='available', volume_id=volume_id) == expected
+
+
+def test_count_unknown_filter(inventory):
+    with pytest.raises(ValueError):
+        inventory.count('node', bogus='x')
+    with pytest.raises(ValueError):
+        inventory.count('snapshot', volume=None)
+    with pytest.raises(ValueError):
+        inventory.count('bogus')
+
+
+def test_snapshots_by_volume(inventory, dataset):
+    volume_id = dataset.volumes[1]['id']
+    snapshots = json.loads(inventory.snapshots(volume_id=volume_id))
+    assert snapshots
+    assert all(s['volumeId'] == volume_id for s in snapshots)
+
+
+def test_node_filters(inventory, dataset):
+    image_id = dataset.images[0]['id']
+    flavor_id = dataset.flavors[0]['id']
+    by_image = [s['id'] for s in dataset.servers if s['image']['id'] == image_id]
+    by_both = [s['id'] for s in dataset.servers
+               if s['image']['id'] == image_id and s['flavor']['id'] == flavor_id]
+    assert by_image
+    assert sorted(n['instanceId'] for n in json.loads(inventory.nodes(image=image_id))) == sorted(by_image)
+    nodes = json.loads(inventory.nodes(image=image_id, flavor=flavor_id))
+    assert sorted(n['instanceId'] for n in nodes) == sorted(by_both)
+    assert len(json.loads(inventory.nodes(network='private'))) == len(dataset.servers)
+    assert json.loads(inventory.nodes(network='public')) == []
+
+
+def test_volume_status(inventory, dataset):
+    dataset.volumes[0]['status'] = 'error'
+    assert [v['volumeId'] for v in json.loads(inventory.volumes(status='error'))] == [dataset.volumes[0]['id']]
+    assert inventory.count('volume', status='available') == len(dataset.volumes) - 1
+
+
+def test_sync_pages_past_max_limit(dataset):
+    with MockOpenStack(dataset, max_limit=3) as server:
+        inv = Inventory('admin', 'password', 'admin', server.url, '2.0_password', page_size=1000)
+        try:
+            assert inv.count('node') == len(dataset.servers)
+            assert inv.count('volume') == len(dataset.volumes)
+            assert inv.count('snapshot') == len(dataset.snapshots)
+        finally:
+            inv.close()
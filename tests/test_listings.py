@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+from mock_openstack import Dataset, MockOpenStack
+
+from openstack_handler.lifecycle import Lifecycle, RetentionPolicy
+from openstack_handler.openstack_handler import Image, Node, Size, Snapshot, Volume
+
+
+@pytest.fixture
+def capped(dataset):
+    """
+    Stub returning at most 4 items per page whatever the limit asked
+    """
+    with MockOpenStack(dataset, max_limit=4) as srv:
+        yield srv
+
+
+def handler(cls, server):
+    return cls('admin', 'password', 'admin', server.url, '2.0_password')
+
+
+def ids(items, key):
+    return sorted(item[key] for item in items)
+
+
+@pytest.mark.parametrize('page_size', [3, 4, 1000])
+def test_iter_pages_past_max_limit(capped, dataset, page_size):
+    node = handler(Node, capped)
+    assert ids(node.iter_nodes(page_size=page_size), 'instanceId') == ids(dataset.servers, 'id')
+    volume = handler(Volume, capped)
+    assert ids(volume.iter_volumes(page_size=page_size), 'volumeId') == ids(dataset.volumes, 'id')
+    snapshot = handler(Snapshot, capped)
+    assert ids(snapshot.iter_snapshots(page_size=page_size), 'snapshotId') == ids(dataset.snapshots, 'id')
+    image = handler(Image, capped)
+    assert ids(image.iter_images(page_size=page_size), 'imageId') == ids(dataset.images, 'id')
+
+
+def test_proxies_paged_by_offset(capped):
+    list(handler(Volume, capped).iter_volumes(page_size=4))
+    offsets = [query.get('offset') for method, path, query in capped.requests
+               if path.endswith('/os-volumes')]
+    assert offsets == [None, '4', '8', '10']
+
+
+def test_filtered_listing_past_max_limit(capped, dataset):
+    volume_id = dataset.volumes[0]['id']
+    for i in range(6):
+        dataset.snapshots.append(dataset._snapshot(volume_id, 'extra-%d' % i))
+    expected = ids([s for s in dataset.snapshots if s['volumeId'] == volume_id], 'id')
+    snapshots = json.loads(handler(Snapshot, capped).snapshots(volume_id=volume_id))
+    assert ids(snapshots, 'snapshotId') == expected
+
+
+def test_flavors_past_max_limit(capped, dataset):
+    sizes = json.loads(handler(Size, capped).sizes())
+    assert len(sizes) == len(dataset.flavors)
+
+
+def test_short_listing_single_request(server, dataset):
+    assert len(list(handler(Node, server).iter_nodes())) == len(dataset.servers)
+    assert server.count('GET', r'/servers/detail$') == 1
+
+
+def test_created_since_drops_deleted(server, dataset):
+    # Nova answers changes-since with the servers deleted since then too
+    dataset.servers.append(dataset._server('gone', None, None, 'DELETED'))
+    node = handler(Node, server)
+    names = [n['name'] for n in json.loads(node.nodes(created_since='2016-01-01T00:00:00Z'))]
+    assert len(names) == len(dataset.servers) - 1
+    assert 'gone' not in names
+    deleted = json.loads(node.nodes(status='DELETED', created_since='2016-01-01T00:00:00Z'))
+    assert [n['name'] for n in deleted] == ['gone']
+
+
+def test_lifecycle_plan_past_max_limit(capped, dataset):
+    # Every volume has a recent enough snapshot, none to create or prune
+    policy = RetentionPolicy(keep_last=10, prefix='snapshot-', interval=10 ** 10)
+    assert Lifecycle(handler(Snapshot, capped), policy, page_size=1000).plan() == []
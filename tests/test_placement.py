@@ -0,0 +1,16 @@
+# -*- coding: utf-8 -*-
+import json
+
+from openstack_handler.openstack_handler import Size
+
+
+def test_best_fit_skips_disabled_flavors(credentials, dataset):
+    size = Size(*credentials)
+    smallest = json.loads(size.best_fit())
+    assert smallest['flavorId'] == dataset.flavors[0]['id']
+    dataset.flavors[0]['OS-FLV-DISABLED:disabled'] = True
+    size._invalidate('flavor')
+    assert json.loads(size.best_fit())['flavorId'] == dataset.flavors[1]['id']
+    candidates = json.loads(size.candidates())
+    assert dataset.flavors[0]['id'] not in [c['flavorId'] for c in candidates]
+    assert len(candidates) == len(dataset.flavors) - 1
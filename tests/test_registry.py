@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+import json
+import threading
+
+from openstack_handler.openstack_handler import Node
+from openstack_handler.registry import registry
+
+
+def test_evicted_entry_keeps_working(credentials, server, dataset):
+    node = Node(*credentials)
+    assert len(json.loads(node.nodes())) == len(dataset.servers)
+    entry = node.driver._entry
+    username, password, tenant, url, api = credentials
+    assert registry.evict(username, tenant, url, api)
+    assert entry.closed
+    # A request already past driver() when the entry is closed still has its token
+    assert not entry._needs_auth()
+    assert len(json.loads(node.nodes())) == len(dataset.servers)
+    assert server.count('POST', r'/tokens$') == 1
+
+
+def test_concurrent_evictions(credentials, server):
+    node = Node(*credentials)
+    username, password, tenant, url, api = credentials
+    errors = []
+
+    def work():
+        for _ in range(20):
+            try:
+                node.nodes()
+            except Exception as e:
+                errors.append(e)
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for _ in range(50):
+        registry.evict(username, tenant, url, api)
+    for thread in threads:
+        thread.join()
+    assert errors == []
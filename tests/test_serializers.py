@@ -0,0 +1,27 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from openstack_handler.openstack_handler import Node
+from openstack_handler.serializers import encode
+
+
+def test_fastest_is_str():
+    obj = {'a': [1, 2], 'b': 'c'}
+    assert isinstance(encode(obj, 'fastest'), str)
+    assert json.loads(encode(obj, 'fastest')) == obj
+
+
+def test_unknown_output_rejected(server):
+    with pytest.raises(ValueError):
+        Node('admin', 'password', 'admin', server.url, '2.0_password', output='yaml')
+    # Nothing was sent
+    assert server.requests == []
+
+
+def test_fastest_nodes(credentials, dataset):
+    username, password, tenant, url, api = credentials
+    nodes = Node(username, password, tenant, url, api, output='fastest').nodes()
+    assert isinstance(nodes, str)
+    assert len(json.loads(nodes)) == len(dataset.servers)